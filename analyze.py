@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Score every frame of a movie for scene-aware frame selection.
+
+Each frame is decoded, downsampled to SCENE_ANALYSIS_WIDTH and scored for
+brightness, sharpness and colourfulness, plus its colour change from the
+previous frame (shot boundaries). Frames are scored in batches with NumPy,
+the movie is split into GOP-aligned ranges decoded by one process each, and
+only one batch per worker is held in memory, so feature-length films fit on
+small machines. Scores go to static/<movie_id>/scenes.bin; playback uses them
+when SCENE_SNAP_WINDOW is set. Run this from the project directory, ideally
+on a faster machine or overnight:
+
+    movieframe-analyze <movie_id> [--workers N]
+"""
+
+import argparse
+import os
+import sys
+from multiprocessing import Pool
+
+import cv2
+import numpy as np
+
+import database
+from utils import frame_index, scene_index
+
+# Frames scored per NumPy batch
+BATCH_FRAMES = 64
+
+
+def analyze_range(job):
+    """
+    Worker: decode frames [start, end) and return their SCORE_DTYPE records
+    with the range's first and last downsampled frames (None if unread).
+
+    start is a keyframe, so the seek lands exactly and no two workers decode
+    the same GOP. The first frame's change is left for merge_ranges, which
+    has the previous range's last frame.
+    """
+    video_path, start, end = job
+    scores = np.zeros(end - start, dtype=scene_index.SCORE_DTYPE)
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"[ERROR] Failed to open {video_path}")
+        return scores, None, None
+
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    first = previous = None
+    batch = []
+    done = 0
+    while start + done + len(batch) < end:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        small = scene_index.downsample(frame)
+        if first is None:
+            first = small
+        batch.append(small)
+        if len(batch) == BATCH_FRAMES:
+            records = scene_index.score_batch(np.stack(batch), previous)
+            scores[done:done + len(records)] = records
+            done += len(records)
+            previous = batch[-1]
+            batch = []
+    if batch:
+        records = scene_index.score_batch(np.stack(batch), previous)
+        scores[done:done + len(records)] = records
+        done += len(records)
+        previous = batch[-1]
+    cap.release()
+    if done < len(scores):
+        # Unread frames keep zero scores, so they only win in an unread window
+        print(f"[WARN] Read only {done} of frames {start}-{end - 1}")
+    return scores, first, previous
+
+
+def merge_ranges(parts):
+    """One scores array from analyze_range results in order, with each range's first change filled in."""
+    for (_, _, last), (scores, first, _) in zip(parts, parts[1:]):
+        if last is not None and first is not None and len(scores):
+            scores[0]["change"] = scene_index.frame_change(first, last)
+    return np.concatenate([scores for scores, _, _ in parts])
+
+
+def analyze_movie(movie_id, workers=None):
+    movie = database.get_movie_by_id(movie_id)
+    settings = database.get_settings()
+    if not movie or not settings:
+        print(f"[ERROR] Movie {movie_id} or settings not found.")
+        return False
+
+    video_path = os.path.join(settings['VideoRootPath'], movie['video_path'])
+    if not os.path.exists(video_path):
+        print(f"[ERROR] Video file not found: {video_path}")
+        return False
+    source_size, source_mtime = frame_index.file_identity(video_path)
+
+    # An exact frame count and keyframe list make the split GOP-aligned
+    total_frames = frame_index.build_index(movie_id, video_path) or movie['total_frames']
+    keyframes = frame_index.keyframes_for(movie_id, video_path)
+    if not total_frames:
+        print(f"[ERROR] Cannot read frames from {video_path}")
+        return False
+
+    workers = workers or os.cpu_count() or 1
+    ranges = frame_index.split_by_gop(range(total_frames), keyframes, workers)
+    jobs = [(video_path, frames.start, frames.stop) for frames in ranges if len(frames)]
+
+    print(f"[INFO] Analysing {total_frames} frames of {movie['video_path']} with {len(jobs)} worker(s)...")
+    with Pool(len(jobs)) as pool:
+        parts = pool.map(analyze_range, jobs)
+
+    scores = merge_ranges(parts)
+    output = scene_index.scores_path(movie_id)
+    scene_index.write_scores(output, source_size, source_mtime, scores)
+    _, shots = scene_index.interestingness(scores)
+    shot_count = int(shots[-1]) + 1 if len(shots) else 0
+    print(f"[INFO] Wrote scores for {len(scores)} frames ({shot_count} shots) to {output}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a movie's frames for scene-aware frame selection.")
+    parser.add_argument("movie_id", type=int, help="id of the Movie to analyse")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    database.init_db()
+    sys.exit(0 if analyze_movie(args.movie_id, args.workers) else 1)
+
+
+if __name__ == "__main__":
+    main()
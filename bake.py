@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Pre-extract a movie's scheduled frames into a baked archive.
+
+Every skip_frames-th frame is decoded, letterboxed to the configured
+resolution and JPEG-encoded once, so playback only has to copy bytes out of a
+memory-mapped file. Run this from the project directory (it uses the same
+database.sqlite and config.toml as the player), ideally on a faster machine
+or overnight:
+
+    movieframe-bake <movie_id> [--workers N]
+"""
+
+import argparse
+import os
+import sys
+from multiprocessing import Pool
+
+import database
+from utils import video_utils, frame_index, frame_archive
+
+
+def plan_frames(movie):
+    """
+    Frames playback can request: the lattice from current_frame for the first
+    pass and, after wrapping, the lattice from frame 0.
+    """
+    total_frames = movie['total_frames']
+    skip_frames = max(1, movie['skip_frames'])
+    start = movie['current_frame'] % skip_frames
+    return sorted(set(range(start, total_frames, skip_frames)) | set(range(0, total_frames, skip_frames)))
+
+
+def bake_range(job):
+    """Worker: decode one range of frames into a part file; return its entries."""
+    movie_id, video_path, frames, resolution, part_path = job
+    session = video_utils.CaptureSession()
+    entries = []
+    with open(part_path, "wb") as part:
+        for frame_number in frames:
+            decode_frame = video_utils.display_frame_number(movie_id, video_path, frame_number)
+            # Reuse renders the player already made, but do not flood the
+            # cache with a whole movie's worth of frames
+            data = video_utils.render_frame(video_path, decode_frame, resolution,
+                                            lambda: session.read(movie_id, video_path, decode_frame, resolution),
+                                            store=False)
+            if data is None:
+                print(f"[WARN] Could not read frame {decode_frame}; leaving it out of the archive")
+                continue
+            entries.append((frame_number, part.tell(), len(data)))
+            part.write(data)
+    session.release()
+    return part_path, entries
+
+
+def bake_movie(movie_id, workers=None):
+    movie = database.get_movie_by_id(movie_id)
+    settings = database.get_settings()
+    if not movie or not settings:
+        print(f"[ERROR] Movie {movie_id} or settings not found.")
+        return False
+
+    video_path = os.path.join(settings['VideoRootPath'], movie['video_path'])
+    if not os.path.exists(video_path):
+        print(f"[ERROR] Video file not found: {video_path}")
+        return False
+    resolution = [int(x) for x in settings['Resolution'].split(',')]
+    source_size, source_mtime = frame_index.file_identity(video_path)
+
+    # An exact frame count and keyframe list make the split GOP-aligned
+    frame_index.build_index(movie_id, video_path)
+    movie = database.get_movie_by_id(movie_id)
+    keyframes = frame_index.keyframes_for(movie_id, video_path)
+
+    frames = plan_frames(movie)
+    # Taken before decoding, so settings changed mid-bake invalidate the archive
+    settings_used = video_utils.archive_settings(movie_id, video_path)
+    workers = workers or os.cpu_count() or 1
+    ranges = [frames_range for frames_range in frame_index.split_by_gop(frames, keyframes, workers) if frames_range]
+    if not ranges:
+        # Pool() needs at least one worker; total_frames is 0 until the
+        # movie's frames have been counted
+        print(f"[ERROR] Movie {movie_id} has no frames to bake (total_frames is {movie['total_frames']}).")
+        return False
+
+    output = frame_archive.archive_path(movie_id)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    jobs = [(movie_id, video_path, frames_range, resolution, f"{output}.part{i}")
+            for i, frames_range in enumerate(ranges)]
+
+    print(f"[INFO] Baking {len(frames)} frames of {movie['video_path']} at "
+          f"{resolution[0]}x{resolution[1]} with {len(jobs)} worker(s)...")
+    with Pool(len(jobs)) as pool:
+        parts = pool.map(bake_range, jobs)
+
+    frame_archive.write_archive(output, resolution[0], resolution[1], source_size, source_mtime,
+                                settings_used, parts)
+    baked = sum(len(entries) for _, entries in parts)
+    print(f"[INFO] Wrote {baked} frames to {output} ({os.path.getsize(output) / (1024**2):.1f} MB)")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-extract a movie's frames into a baked archive.")
+    parser.add_argument("movie_id", type=int, help="id of the Movie to bake")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    database.init_db()
+    sys.exit(0 if bake_movie(args.movie_id, args.workers) else 1)
+
+
+if __name__ == "__main__":
+    main()
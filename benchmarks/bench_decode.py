@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Decode time per frame for each backend in utils/decoders.py, sequentially
+(stepping by --skip frames, like playback) and with random seeks:
+
+    python benchmarks/bench_decode.py [video.mp4] [--size 800x480] [--frames N]
+
+Without a video a 1080p test clip is generated. Backends that are not
+available on this machine (PyAV not installed, no V4L2 decoder) are listed
+as skipped.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import decoders, video_utils  # noqa: E402
+
+
+def synthetic_video(path, width=1920, height=1080, frames=240, fps=24):
+    """Moving gradients plus noise, so every frame is different."""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    rng = np.random.default_rng(0)
+    for i in range(frames):
+        frame = np.stack([(x + i * 8) % 256, (y + i * 4) % 256, (x + y + i * 2) % 256], axis=-1)
+        frame += rng.normal(0, 8, frame.shape)
+        writer.write(np.clip(frame, 0, 255).astype(np.uint8))
+    writer.release()
+    return path
+
+
+def time_frames(decoder_name, video_path, size, frame_numbers):
+    """Milliseconds per decoded and letterboxed frame through a CaptureSession."""
+    session = video_utils.CaptureSession()
+    original = decoders.DECODE_BACKEND
+    decoders.DECODE_BACKEND = decoder_name
+    try:
+        start = time.perf_counter()
+        for frame_number in frame_numbers:
+            frame = session.read(0, video_path, frame_number, size)
+            if frame is None:
+                raise RuntimeError(f"could not decode frame {frame_number}")
+            video_utils.resize_with_black_borders(frame, size[0], size[1])
+        return (time.perf_counter() - start) * 1000 / len(frame_numbers)
+    finally:
+        decoders.DECODE_BACKEND = original
+        session.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("video", nargs="?", help="video to decode (default: generated 1080p clip)")
+    parser.add_argument("--size", default="800x480", help="panel size WxH (default 800x480)")
+    parser.add_argument("--frames", type=int, default=30, help="frames per measurement")
+    parser.add_argument("--skip", type=int, default=5, help="frame step for the sequential run")
+    args = parser.parse_args()
+
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+    video_path = args.video or synthetic_video(os.path.join(tempfile.mkdtemp(prefix="decode-bench-"), "clip.mp4"))
+    cap = cv2.VideoCapture(video_path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    source = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    cap.release()
+
+    sequential = [(i * args.skip) % total for i in range(args.frames)]
+    random_seeks = random.Random(0).sample(range(total), min(args.frames, total))
+
+    print(f"{video_path}: {source[0]}x{source[1]}, {total} frames -> {size[0]}x{size[1]}")
+    print(f"{'backend':<10} {'sequential ms/frame':>20} {'random seek ms/frame':>21}")
+    available = decoders.available_backends()
+    for name in decoders.BACKENDS:
+        if name not in available:
+            print(f"{name:<10} {'skipped (not available)':>42}")
+            continue
+        try:
+            seq_ms = time_frames(name, video_path, size, sequential)
+            seek_ms = time_frames(name, video_path, size, random_seeks)
+        except RuntimeError as e:
+            print(f"{name:<10} failed: {e}")
+            continue
+        print(f"{name:<10} {seq_ms:>20.1f} {seek_ms:>21.1f}")
+
+
+if __name__ == "__main__":
+    main()
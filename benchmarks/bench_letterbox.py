@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Letterbox time per frame for typical source sizes: the original allocate +
+bilinear resize + copy approach against utils/letterbox.py in each
+interpolation and fit mode:
+
+    python benchmarks/bench_letterbox.py [--size 800x480] [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import letterbox  # noqa: E402
+
+SOURCES = {
+    "480p 4:3": (640, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "1080p scope": (1920, 800),
+    "4K": (3840, 2160),
+}
+
+
+def original(image, target_width, target_height):
+    """resize_with_black_borders before the letterbox engine."""
+    original_height, original_width = image.shape[:2]
+    original_aspect_ratio = original_width / original_height
+    if original_aspect_ratio > target_width / target_height:
+        new_width, new_height = target_width, int(target_width / original_aspect_ratio)
+    else:
+        new_width, new_height = int(target_height * original_aspect_ratio), target_height
+    resized_image = cv2.resize(image, (new_width, new_height))
+    canvas = np.zeros((target_height, target_width, 3), dtype=np.uint8)
+    x_offset = (target_width - new_width) // 2
+    y_offset = (target_height - new_height) // 2
+    canvas[y_offset:y_offset + new_height, x_offset:x_offset + new_width] = resized_image
+    return canvas
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", default="800x480", help="panel size WxH (default 800x480)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.lower().split("x"))
+
+    variants = {
+        "original": lambda image: original(image, width, height),
+        "pad/linear": letterbox.Letterbox(width, height, "pad", "linear").apply,
+        "pad/area": letterbox.Letterbox(width, height, "pad", "area").apply,
+        "pad/fast": letterbox.Letterbox(width, height, "pad", "fast").apply,
+        "crop/fast": letterbox.Letterbox(width, height, "crop", "fast").apply,
+        "smart/fast": letterbox.Letterbox(width, height, "smart", "fast").apply,
+    }
+
+    print(f"ms per frame to {width}x{height} (best of {args.repeat})")
+    print(f"{'source':<14}" + "".join(f"{name:>15}" for name in variants))
+    rng = np.random.default_rng(0)
+    for label, (source_width, source_height) in SOURCES.items():
+        image = rng.integers(0, 256, (source_height, source_width, 3), dtype=np.uint8)
+        row = [best_of(lambda: apply(image), args.repeat) for apply in variants.values()]
+        print(f"{label:<14}" + "".join(f"{ms:>15.2f}" for ms in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Compare the Inky driver's set_image() quantization against the LUT quantizer
+in utils/palette.py. Needs the inky package but no display attached:
+
+    python benchmarks/bench_palette.py [image.jpg] [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import palette  # noqa: E402
+
+DRIVERS = {
+    "7-colour (ac073tc1a)": "inky.inky_ac073tc1a",
+    "Spectra 6 (e673)": "inky.inky_e673",
+}
+
+
+def synthetic_frame(width, height):
+    """Colour gradients plus noise, roughly as hard to dither as a film frame."""
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    rgb = np.stack([x / width * 255, y / height * 255, (x + y) / (width + height) * 255], axis=-1)
+    rgb += np.random.default_rng(0).normal(0, 12, rgb.shape)
+    return Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8))
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("image", nargs="?", help="image to quantize (default: synthetic frame)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    import importlib
+    cache_dir = tempfile.mkdtemp(prefix="palette-bench-")
+
+    for label, module_name in DRIVERS.items():
+        display = importlib.import_module(module_name).Inky()
+        size = (display.width, display.height)
+        image = Image.open(args.image).convert("RGB").resize(size) if args.image else synthetic_frame(*size)
+        rgb = np.asarray(image)
+        colours, remap = palette.panel_palette(display, 0.5)
+
+        start = time.perf_counter()
+        lut = palette.load_lut(colours, cache_dir)
+        build_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        palette.load_lut(colours, cache_dir)
+        load_ms = (time.perf_counter() - start) * 1000
+
+        driver_ms = best_of(lambda: display.set_image(image, saturation=0.5), args.repeat)
+        ordered_ms = best_of(lambda: palette.to_native_buffer(palette.quantize(rgb, lut, "ordered"), remap), args.repeat)
+        plain_ms = best_of(lambda: palette.to_native_buffer(palette.quantize(rgb, lut, "none"), remap), args.repeat)
+
+        print(f"{label} {size[0]}x{size[1]}")
+        print(f"  LUT build (first run)  {build_ms:8.1f} ms")
+        print(f"  LUT load (cached)      {load_ms:8.1f} ms")
+        print(f"  driver set_image       {driver_ms:8.1f} ms")
+        print(f"  LUT + ordered dither   {ordered_ms:8.1f} ms  ({driver_ms / ordered_ms:.1f}x)")
+        print(f"  LUT, no dither         {plain_ms:8.1f} ms  ({driver_ms / plain_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Headless, reproducible benchmark suite for the frame pipeline.
+
+Generates synthetic videos (several codecs, GOP lengths and resolutions),
+then times get_total_frames, extract_frame_as_image with sequential and
+random access, resize_with_black_borders, JPEG save and an end-to-end
+play_video tick in dev mode. Each run is appended to a JSON history file and
+compared with the previous run on the same machine, so regressions show up
+between versions. --soak additionally simulates a year of playback and
+checks memory and file descriptor growth:
+
+    python benchmarks/suite.py [--quick] [--soak] [--history benchmarks/history.json]
+
+Everything runs in a scratch work directory with its own config.toml (dev
+mode, render cache off, other keys at their defaults) and a fresh database,
+so results do not depend on the local setup.
+Videos are made with ffmpeg's deterministic testsrc2 source when an ffmpeg
+binary is available, otherwise with OpenCV's writer (codec GOP defaults).
+"""
+
+import argparse
+import contextlib
+import datetime
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_HISTORY = os.path.join(REPO_DIR, "benchmarks", "history.json")
+FPS = 25
+
+# (name, ffmpeg encoder, OpenCV fourcc, container); intra-only codecs get one GOP
+CODECS = [
+    ("h264", "libx264", None, "mp4"),
+    ("mpeg4", "mpeg4", "mp4v", "mp4"),
+    ("mjpeg", "mjpeg", "MJPG", "avi"),
+]
+INTRA_ONLY = {"mjpeg"}
+GOPS = [12, 250]
+RESOLUTIONS = [(640, 360), (1920, 1080)]
+
+
+def ffmpeg_video(ffmpeg, path, codec, encoder, gop, width, height, frames):
+    command = [ffmpeg, "-y", "-v", "error", "-f", "lavfi",
+               "-i", f"testsrc2=size={width}x{height}:rate={FPS}:duration={frames / FPS}",
+               "-c:v", encoder, "-pix_fmt", "yuvj420p" if codec == "mjpeg" else "yuv420p"]
+    if codec not in INTRA_ONLY:
+        command += ["-g", str(gop)]
+    if encoder == "libx264":
+        command += ["-preset", "veryfast", "-bf", "0"]
+    else:
+        command += ["-q:v", "4"]
+    result = subprocess.run(command + [path], capture_output=True, text=True)
+    return result.returncode == 0 and os.path.getsize(path) > 0
+
+
+def opencv_video(path, fourcc, width, height, frames):
+    """Moving gradients plus noise, so every frame is different."""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), FPS, (width, height))
+    if not writer.isOpened():
+        return False
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    rng = np.random.default_rng(0)
+    for i in range(frames):
+        frame = np.stack([(x + i * 8) % 256, (y + i * 4) % 256, (x + y + i * 2) % 256], axis=-1)
+        frame += rng.normal(0, 8, frame.shape)
+        writer.write(np.clip(frame, 0, 255).astype(np.uint8))
+    writer.release()
+    return os.path.getsize(path) > 0
+
+
+def make_videos(video_dir, ffmpeg, resolutions, gops, frames):
+    """Generate (or reuse) the test matrix; returns [{name, codec, gop, width, height, path}]."""
+    os.makedirs(video_dir, exist_ok=True)
+    videos = []
+    for codec, encoder, fourcc, container in CODECS:
+        for gop in [1] if codec in INTRA_ONLY else gops:
+            for width, height in resolutions:
+                name = f"{codec}/gop{gop if ffmpeg or codec in INTRA_ONLY else 'default'}/{width}x{height}"
+                path = os.path.join(video_dir, name.replace("/", "_") + f"_{frames}.{container}")
+                if not os.path.exists(path):
+                    if ffmpeg:
+                        ok = ffmpeg_video(ffmpeg, path, codec, encoder, gop, width, height, frames)
+                    elif fourcc and (gop == gops[-1] or codec in INTRA_ONLY):
+                        ok = opencv_video(path, fourcc, width, height, frames)
+                    else:
+                        ok = False
+                    if not ok:
+                        if os.path.exists(path):
+                            os.remove(path)
+                        continue
+                videos.append({"name": name, "codec": codec, "gop": gop, "width": width, "height": height, "path": path})
+    return videos
+
+
+def measure(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {
+        "median_ms": round(times[len(times) // 2], 3),
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))], 3),
+        "min_ms": round(times[0], 3),
+        "runs": repeat,
+    }
+
+
+def load_pipeline(panel_size):
+    """Import the player from inside the work directory, with the suite's config.toml."""
+    with open("config.toml", "w") as f:
+        # Time the whole pipeline, not render cache hits
+        f.write(f'DEVELOPMENT_MODE = true\nRENDER_CACHE_MB = 0\nVIDEO_DIRECTORY = "videos"\n'
+                f'TARGET_WIDTH = {panel_size[0]}\nTARGET_HEIGHT = {panel_size[1]}\n')
+    os.environ.setdefault("ENVIRONMENT", "development")
+    sys.path.insert(0, REPO_DIR)
+    import database
+    from utils import render_cache, video_utils
+    database.init_db()
+    if not database.get_settings():
+        database.insert_default_settings()
+    return database, video_utils, render_cache
+
+
+def activate(database, video, panel_size, skip_frames, time_per_frame=1):
+    with database.transaction() as conn:
+        conn.execute("UPDATE Settings SET VideoRootPath = ?, Resolution = ?",
+                     (os.path.dirname(video["path"]), f"{panel_size[0]},{panel_size[1]}"))
+    filename = os.path.basename(video["path"])
+    movie = database.get_movie_by_path(filename) or database.insert_movie(filename, video["frames"])
+    database.update_movie({"id": movie["id"], "time_per_frame": time_per_frame, "skip_frames": skip_frames,
+                           "current_frame": 0, "total_frames": video["frames"]})
+    database.set_active_movie(movie["id"])
+    return movie
+
+
+def run_cases(database, video_utils, videos, panel_size, repeat):
+    results = {}
+    rng = random.Random(0)
+    logger = logging.getLogger("bench")
+    logger.setLevel(logging.WARNING)
+
+    for video in videos:
+        path, name = video["path"], video["name"]
+        video["frames"] = video_utils.get_total_frames(path)
+        print(f"  {name}: {video['frames']} frames", flush=True)
+        results[f"get_total_frames/{name}"] = measure(lambda: video_utils.get_total_frames(path), repeat)
+
+        cap = cv2.VideoCapture(path)
+        sequential = iter(range(10 ** 9))
+        results[f"extract_sequential/{name}"] = measure(
+            lambda: video_utils.extract_frame_as_image(cap, next(sequential) % video["frames"]), repeat)
+        results[f"extract_random/{name}"] = measure(
+            lambda: video_utils.extract_frame_as_image(cap, rng.randrange(video["frames"])), repeat)
+        frame = video_utils.extract_frame_as_image(cap, video["frames"] // 2)
+        cap.release()
+
+        resized = video_utils.resize_with_black_borders(frame, *panel_size)
+        results[f"resize_with_black_borders/{video['width']}x{video['height']}"] = measure(
+            lambda: video_utils.resize_with_black_borders(frame, *panel_size), repeat)
+
+        def save():
+            ok, encoded = cv2.imencode(".jpg", resized, [cv2.IMWRITE_JPEG_QUALITY, video_utils.JPEG_QUALITY])
+            video_utils.save_frame_bytes(encoded.tobytes(), 0)
+        results[f"jpeg_save/{panel_size[0]}x{panel_size[1]}"] = measure(save, repeat)
+
+        activate(database, video, panel_size, skip_frames=max(1, video["frames"] // (repeat + 2)))
+        session = video_utils.CaptureSession()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results[f"play_video/{name}"] = measure(lambda: video_utils.play_video(logger, session), repeat)
+        session.release()
+    return results
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _open_fds():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def soak(database, video_utils, render_cache, video, panel_size, days, time_per_frame, skip_frames):
+    """
+    Play `days` of frames back to back (simulated clock) through play_video
+    with a small render cache, sampling RSS, open files and live objects.
+    Growth is the median of the last tenth of samples minus the median of the
+    second tenth (the first is warm-up).
+    """
+    frames = int(days * 24 * 60 / time_per_frame)
+    render_cache.RENDER_CACHE_MB = 8
+    activate(database, video, panel_size, skip_frames, time_per_frame)
+    logger = logging.getLogger("bench")
+    session = video_utils.CaptureSession()
+    every = max(1, frames // 100)
+    samples = []
+    clock = time.time()
+    start = time.perf_counter()
+    print(f"  soak: {frames} frames ({days} days at {time_per_frame} min/frame) of {video['name']}", flush=True)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(frames):
+            if not video_utils.play_video(logger, session, clock + i * time_per_frame * 60):
+                raise RuntimeError(f"play_video failed at simulated frame {i}")
+            if i % every == 0:
+                gc.collect()
+                samples.append((_rss_mb(), _open_fds(), len(gc.get_objects())))
+    elapsed = time.perf_counter() - start
+    session.release()
+    render_cache.RENDER_CACHE_MB = 0
+
+    tenth = max(1, len(samples) // 10)
+
+    def growth(index):
+        if samples[0][index] is None:
+            return None
+        early = sorted(s[index] for s in samples[tenth:2 * tenth] or samples[:tenth])
+        late = sorted(s[index] for s in samples[-tenth:])
+        return late[len(late) // 2] - early[len(early) // 2]
+
+    return {
+        "frames": frames,
+        "seconds": round(elapsed, 1),
+        "ms_per_frame": round(elapsed * 1000 / frames, 3),
+        "rss_start_mb": round(samples[0][0], 1),
+        "rss_end_mb": round(samples[-1][0], 1),
+        "rss_growth_mb": round(growth(0), 2),
+        "fd_growth": growth(1),
+        "object_growth": growth(2),
+    }
+
+
+def host_info():
+    return {
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def load_history(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"runs": []}
+
+
+def previous_comparable(history, record):
+    for run in reversed(history["runs"]):
+        same_host = all(run["host"].get(k) == record["host"][k] for k in ("machine", "system", "cpus"))
+        if same_host and run["options"] == record["options"]:
+            return run
+    return None
+
+
+def compare(previous, record, threshold):
+    """
+    Print cases whose best time moved by more than threshold; returns the
+    regressions. The minimum is compared rather than the median because it is
+    the least disturbed by other load on the machine.
+    """
+    regressions = []
+    print(f"\nCompared with {previous['commit'] or 'unknown commit'} ({previous['timestamp']}):")
+    for key, result in record["results"].items():
+        before = previous["results"].get(key)
+        if not before or not before["min_ms"]:
+            continue
+        ratio = result["min_ms"] / before["min_ms"]
+        if ratio > 1 + threshold:
+            regressions.append(key)
+            print(f"  REGRESSION {key}: {before['min_ms']:.2f} -> {result['min_ms']:.2f} ms ({ratio:.2f}x)")
+        elif ratio < 1 - threshold:
+            print(f"  faster     {key}: {before['min_ms']:.2f} -> {result['min_ms']:.2f} ms ({ratio:.2f}x)")
+    if not regressions:
+        print(f"  no regressions above {threshold:.0%}")
+    return regressions
+
+
+def run(args, workdir, history_path, panel_size, repeat):
+    """Generate the videos, time every case (and the soak) and update the history. Returns True on failure."""
+    videos = make_videos(os.path.join(workdir, "videos"), args.ffmpeg,
+                         RESOLUTIONS[:1] if args.quick else RESOLUTIONS,
+                         GOPS[-1:] if args.quick else GOPS, args.frames)
+    if not videos:
+        sys.exit("Could not generate any test video (no ffmpeg and no usable OpenCV writer)")
+    print(f"Work directory {workdir}; {len(videos)} videos via {'ffmpeg' if args.ffmpeg else 'OpenCV'}")
+
+    database, video_utils, render_cache = load_pipeline(panel_size)
+    results = run_cases(database, video_utils, videos, panel_size, repeat)
+
+    commit, dirty = git_commit()
+    record = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "dirty": dirty,
+        "host": host_info(),
+        "options": {"quick": args.quick, "size": args.size, "frames": args.frames,
+                    "generator": "ffmpeg" if args.ffmpeg else "opencv"},
+        "results": results,
+    }
+
+    print(f"\n{'case':<52} {'median ms':>10} {'p95 ms':>10}")
+    for key, result in results.items():
+        print(f"{key:<52} {result['median_ms']:>10.2f} {result['p95_ms']:>10.2f}")
+
+    failed = False
+    if args.soak:
+        video = min(videos, key=lambda v: (v["width"] * v["height"], v["codec"] != "h264"))
+        record["soak"] = soak(database, video_utils, render_cache, video, panel_size,
+                              args.soak_days, args.time_per_frame, skip_frames=7)
+        record["soak"]["passed"] = record["soak"]["rss_growth_mb"] <= args.max_growth_mb
+        failed = not record["soak"]["passed"]
+        print(f"\nSoak: {json.dumps(record['soak'])}")
+        if failed:
+            print(f"  FAILED: RSS grew by more than {args.max_growth_mb} MB")
+
+    if not args.no_history:
+        history = load_history(history_path)
+        previous = previous_comparable(history, record)
+        if previous and compare(previous, record, args.threshold) and args.fail_on_regression:
+            failed = True
+        history["runs"].append(record)
+        tmp_path = f"{history_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(history, f, indent=1)
+        os.replace(tmp_path, history_path)
+        print(f"\nAppended to {history_path}")
+
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="small matrix: one resolution and GOP, fewer runs")
+    parser.add_argument("--size", default="800x480", help="panel size WxH (default 800x480)")
+    parser.add_argument("--repeat", type=int, help="timed runs per case (default 20, 5 with --quick)")
+    parser.add_argument("--frames", type=int, default=500, help="frames per generated video (default 500)")
+    parser.add_argument("--workdir", help="scratch directory, kept between runs to reuse videos (default: a temporary one, removed afterwards)")
+    parser.add_argument("--ffmpeg", default=shutil.which("ffmpeg"), help="ffmpeg binary for generating videos")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON history file to append to")
+    parser.add_argument("--no-history", action="store_true", help="do not read or write the history file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="change in best time reported as a regression (default 0.2)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit 1 when a case regressed")
+    parser.add_argument("--soak", action="store_true", help="also simulate a year of playback and check for leaks")
+    parser.add_argument("--soak-days", type=float, default=365)
+    parser.add_argument("--time-per-frame", type=float, default=60, help="soak minutes per frame (default 60)")
+    parser.add_argument("--max-growth-mb", type=float, default=20, help="soak RSS growth allowed (default 20)")
+    args = parser.parse_args()
+
+    panel_size = tuple(int(v) for v in args.size.lower().split("x"))
+    repeat = args.repeat or (5 if args.quick else 20)
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="frame-bench-"))
+    history_path = os.path.abspath(args.history)
+    os.makedirs(workdir, exist_ok=True)
+    start_dir = os.getcwd()
+    os.chdir(workdir)
+    try:
+        failed = run(args, workdir, history_path, panel_size, repeat)
+    finally:
+        # Generated videos, database and render cache; only a --workdir is kept
+        if not args.workdir:
+            os.chdir(start_dir)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,70 +1,228 @@
 import os
 import sqlite3
-from utils import config
+import threading
+import time
+from contextlib import contextmanager
+from utils import config, metrics, progress, scheduler, shuffle
 
 DB_PATH = "database.sqlite"
+# Version the CREATE TABLE statements in init_db() produce; bump it with each
+# migration in run_migrations()
+SCHEMA_VERSION = 9
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
+# Every thread (player loop, pre-render worker, Flask request threads) keeps
+# one open connection instead of reconnecting for each query. sqlite3 caches
+# compiled statements per connection, so repeated queries skip re-parsing.
+_local = threading.local()
+STATEMENT_CACHE_SIZE = 128
+
+def _sync_mode():
+    # NORMAL is durable against application crashes and, in WAL mode, only
+    # fsyncs at checkpoints, which is far kinder to SD cards than FULL.
+    # OFF trades power-loss safety for even fewer fsyncs.
+    config_data = config.read_toml_file("config.toml")
+    mode = str(config_data.get("DB_SYNCHRONOUS", "NORMAL")).upper()
+    return mode if mode in ("OFF", "NORMAL", "FULL") else "NORMAL"
+
+def _connect():
+    # isolation_level=None: no implicit transactions; writes go through
+    # transaction() so several statements can share one commit.
+    conn = sqlite3.connect(DB_PATH, timeout=10, isolation_level=None,
+                           cached_statements=STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA synchronous = {_sync_mode()}")
+    conn.execute("PRAGMA busy_timeout = 10000")
+    conn.execute("PRAGMA temp_store = MEMORY")
     return conn
 
+def get_db_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+    return conn
+
+def _forget_inherited_connection():
+    # A connection must not be used across fork(); child processes (e.g. the
+    # bake workers) open their own.
+    _local.conn = None
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_inherited_connection)
+
+# Playback progress between checkpoints (see journal_progress)
+_journal = progress.Journal(f"{DB_PATH}-progress", sync=_sync_mode() == "FULL")
+
+def close_db_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+@contextmanager
+def transaction(immediate=False):
+    """
+    Run the enclosed queries in one transaction on this thread's connection.
+
+    Nested uses join the outermost transaction. Pass immediate=True to take
+    the write lock up front (avoids a failed lock upgrade when a transaction
+    reads before it writes while another thread is writing).
+    """
+    conn = get_db_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
 def init_db():
     is_new_db = not os.path.exists(DB_PATH)
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # Always ensure core tables exist
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS Settings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            VideoRootPath TEXT,
-            Resolution TEXT,
-            use_quiet_hours BOOLEAN DEFAULT 0,
-            quiet_start INTEGER DEFAULT 22,
-            quiet_end INTEGER DEFAULT 7
-        )
-    ''')
-
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS Movie (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            video_path TEXT,
-            total_frames INTEGER,
-            time_per_frame INTEGER,
-            skip_frames INTEGER,
-            current_frame INTEGER,
-            isActive BOOLEAN DEFAULT 0,
-            isRandom BOOLEAN DEFAULT 0
-        )
-    ''')
-
-    cur.execute('''
-        CREATE UNIQUE INDEX IF NOT EXISTS unique_active_movie
-        ON Movie (isActive)
-        WHERE isActive = 1
-    ''')
-
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS NowPlaying (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            movie_id INTEGER NOT NULL,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS SchemaVersion (
-            version INTEGER
-        )
-    ''')
-
-    # If brand new DB, initialize schema version
-    if is_new_db:
-        cur.execute("INSERT INTO SchemaVersion (version) VALUES (2)")
-
-    conn.commit()
-    conn.close()
+
+    with transaction() as conn:
+        # Always ensure core tables exist
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS Settings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                VideoRootPath TEXT,
+                Resolution TEXT,
+                use_quiet_hours BOOLEAN DEFAULT 0,
+                quiet_start INTEGER DEFAULT 22,
+                quiet_end INTEGER DEFAULT 7
+            )
+        ''')
+
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS Movie (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                video_path TEXT,
+                total_frames INTEGER,
+                time_per_frame INTEGER,
+                skip_frames INTEGER,
+                current_frame INTEGER,
+                isActive BOOLEAN DEFAULT 0,
+                isRandom BOOLEAN DEFAULT 0,
+                started_at TIMESTAMP,
+                last_updated TIMESTAMP,
+                random_seed INTEGER,
+                progress_generation INTEGER DEFAULT 0
+            )
+        ''')
+
+        conn.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS unique_active_movie
+            ON Movie (isActive)
+            WHERE isActive = 1
+        ''')
+
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS NowPlaying (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                movie_id INTEGER NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS MovieIndex (
+                movie_id INTEGER PRIMARY KEY,
+                file_size INTEGER,
+                file_mtime REAL,
+                frames_indexed INTEGER DEFAULT 0,
+                frame_count INTEGER,
+                keyframes BLOB,
+                complete BOOLEAN DEFAULT 0
+            )
+        ''')
+
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS MovieIndexChunk (
+                movie_id INTEGER NOT NULL,
+                chunk INTEGER NOT NULL,
+                keyframes BLOB,
+                PRIMARY KEY (movie_id, chunk)
+            )
+        ''')
+
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS DisplayState (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                fingerprint BLOB,
+                skipped_refreshes INTEGER DEFAULT 0,
+                updated_at TIMESTAMP,
+                movie_id INTEGER,
+                frame INTEGER,
+                shown_at REAL
+            )
+        ''')
+        conn.execute("INSERT OR IGNORE INTO DisplayState (id) VALUES (1)")
+
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS UploadSession (
+                id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                sha256 TEXT,
+                received INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS Display (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                host TEXT NOT NULL,
+                port INTEGER,
+                resolution TEXT NOT NULL,
+                movie_id INTEGER,
+                time_per_frame INTEGER DEFAULT 60,
+                skip_frames INTEGER DEFAULT 1,
+                current_frame INTEGER DEFAULT 0,
+                last_updated TIMESTAMP,
+                last_push_at REAL,
+                last_pushed_frame INTEGER,
+                last_error TEXT
+            )
+        ''')
+
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS PlaylistEntry (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                position INTEGER NOT NULL,
+                movie_id INTEGER NOT NULL,
+                time_per_frame INTEGER,
+                skip_frames INTEGER,
+                isRandom BOOLEAN
+            )
+        ''')
+
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS PlaylistState (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                entry_id INTEGER,
+                repeat BOOLEAN DEFAULT 1,
+                time_per_frame INTEGER,
+                skip_frames INTEGER,
+                isRandom BOOLEAN
+            )
+        ''')
+        conn.execute("INSERT OR IGNORE INTO PlaylistState (id) VALUES (1)")
+
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS SchemaVersion (
+                version INTEGER
+            )
+        ''')
+
+        # A brand new DB already has every column, so no migration applies
+        if is_new_db:
+            conn.execute("INSERT INTO SchemaVersion (version) VALUES (?)", (SCHEMA_VERSION,))
 
     # Apply migrations for older DBs
     run_migrations()
@@ -72,9 +230,7 @@ def init_db():
 
 def get_settings():
     conn = get_db_connection()
-    settings = conn.execute("SELECT * FROM Settings LIMIT 1").fetchone()
-    conn.close()
-    return settings
+    return conn.execute("SELECT * FROM Settings LIMIT 1").fetchone()
 
 def insert_default_settings():
     config_data = config.read_toml_file("config.toml")
@@ -83,28 +239,151 @@ def insert_default_settings():
     height = config_data.get("TARGET_HEIGHT", 480)
     resolution = f"{width},{height}"
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("INSERT INTO Settings (VideoRootPath, Resolution) VALUES (?, ?)", (video_root, resolution))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("INSERT INTO Settings (VideoRootPath, Resolution) VALUES (?, ?)", (video_root, resolution))
 
 def update_video_root_path():
     config_data = config.read_toml_file("config.toml")
     new_path = config_data.get("VIDEO_DIRECTORY")
     if new_path:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("UPDATE Settings SET VideoRootPath = ? WHERE id = 1", (new_path,))
-        conn.commit()
-        conn.close()
+        with transaction() as conn:
+            conn.execute("UPDATE Settings SET VideoRootPath = ? WHERE id = 1", (new_path,))
 
-def update_current_frame(movie_id, current_frame):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE Movie SET current_frame = ? WHERE id = ?", (current_frame, movie_id))
-    conn.commit()
-    conn.close()
+def advance_current_frame(movie_id, from_frame, to_frame, random_seed=None):
+    """
+    Move current_frame from from_frame to to_frame, unless someone else (the
+    web UI) changed it in the meantime. random_seed, if given, is stored with
+    it (random playback moving on to its next pass). Returns True if the row
+    was updated.
+    """
+    with transaction() as conn:
+        cur = conn.execute('''
+            UPDATE Movie SET current_frame = ?, random_seed = COALESCE(?, random_seed)
+            WHERE id = ? AND current_frame = ?
+        ''', (to_frame, random_seed, movie_id, from_frame))
+        return cur.rowcount > 0
+
+def _progress_base(movie):
+    return (movie['current_frame'], movie['random_seed'], movie['progress_generation'], movie['last_updated'])
+
+def _position(movie):
+    """The part of _progress_base that a journal record's position applies against."""
+    return (movie['current_frame'], movie['random_seed'], movie['progress_generation'])
+
+def _reset_progress(conn, movie_id):
+    """
+    For writers of a movie's position other than play_video's advance (the
+    web UI, playlist starts): fold the journal in, then bump the movie's
+    progress_generation so no record from before the write applies after
+    it, even when the write restores the values the record started from.
+    """
+    checkpoint_progress()
+    conn.execute('UPDATE Movie SET progress_generation = progress_generation + 1 WHERE id = ?', (movie_id,))
+
+def _journaled():
+    """The progress journal's record while journaling is on, else None."""
+    return _journal.read() if progress.PROGRESS_CHECKPOINT_SECONDS > 0 else None
+
+def _with_progress(movie, record):
+    """
+    movie with the journaled progress applied where the record is still
+    ahead of it. The position (current_frame, random_seed) and last_updated
+    apply separately, so a position set from the web UI keeps the schedule.
+    """
+    if movie is None or record is None or movie['id'] != record['movie_id']:
+        return movie
+    journaled = {}
+    if _position(movie) == record['base'][:3]:
+        journaled.update(current_frame=record['current_frame'], random_seed=record['random_seed'])
+    if movie['last_updated'] == record['base'][3]:
+        journaled['last_updated'] = record['last_updated']
+    return {**dict(movie), **journaled} if journaled else movie
+
+def journal_progress(movie, to_frame, random_seed, last_updated, fingerprint=None, frame=None):
+    """
+    Record one frame of progress (what play_video would otherwise commit:
+    current_frame, random_seed, last_updated and the panel's fingerprint,
+    None for a skipped refresh) as one write to the progress journal. The
+    getters here read through the journal, and checkpoint_progress() folds
+    it into the database.
+
+    Returns False when the frame has to be committed instead: journaling is
+    off (PROGRESS_CHECKPOINT_SECONDS = 0), a checkpoint is due, or the movie
+    or display state changed in the database since the journal started (the
+    web UI, or another movie).
+    """
+    if progress.PROGRESS_CHECKPOINT_SECONDS <= 0 or _journal.checkpoint_due():
+        return False
+    with transaction() as conn:
+        row = conn.execute('SELECT * FROM Movie WHERE id = ?', (movie['id'],)).fetchone()
+        state = conn.execute('SELECT * FROM DisplayState WHERE id = 1').fetchone()
+    if not row or not state:
+        return False
+
+    last = _journal.last
+    if last:
+        if (last['movie_id'] != movie['id'] or _progress_base(row) != last['base']
+                or movie['current_frame'] != last['current_frame'] or state['shown_at'] != last['base_shown_at']
+                or state['skipped_refreshes'] != last['base_skipped']):
+            return False
+        record = dict(last)
+    else:
+        # The first frame after a start (last_updated NULL) is committed, so
+        # restarting a movie can never pick up this journal
+        if row['last_updated'] is None or _progress_base(row) != _progress_base(movie):
+            return False
+        record = {'movie_id': movie['id'], 'base': _progress_base(row),
+                  'base_shown_at': state['shown_at'], 'base_skipped': state['skipped_refreshes'],
+                  'shown_at': state['shown_at'], 'frame': state['frame'], 'fingerprint': None,
+                  'skipped': state['skipped_refreshes']}
+
+    record.update(current_frame=to_frame, last_updated=last_updated,
+                  random_seed=record.get('random_seed', row['random_seed']) if random_seed is None else random_seed)
+    if fingerprint is None:
+        record['skipped'] += 1
+    else:
+        record.update(fingerprint=fingerprint, frame=frame, shown_at=time.time())
+    _journal.write(record)
+    return True
+
+def checkpoint_progress():
+    """
+    Fold the progress journal into the database (the parts the database
+    still holds the base of) and start a fresh journal. Also how the player
+    reconciles after a restart.
+    """
+    record = _journal.read()
+    if record:
+        base_frame, base_seed, base_generation, base_updated = record['base']
+        with transaction(immediate=True) as conn:
+            # A new generation: once folded in, the record never applies again
+            position = conn.execute('''
+                UPDATE Movie SET current_frame = ?, random_seed = ?, progress_generation = progress_generation + 1
+                WHERE id = ? AND current_frame IS ? AND random_seed IS ? AND progress_generation IS ?
+            ''', (record['current_frame'], record['random_seed'], record['movie_id'], base_frame, base_seed,
+                  base_generation))
+            conn.execute('UPDATE Movie SET last_updated = ? WHERE id = ? AND last_updated IS ?',
+                         (record['last_updated'], record['movie_id'], base_updated))
+            if record['fingerprint']:
+                conn.execute('''
+                    UPDATE DisplayState SET fingerprint = ?, movie_id = ?, frame = ?, shown_at = ?,
+                                            updated_at = CURRENT_TIMESTAMP
+                    WHERE id = 1 AND shown_at IS ?
+                ''', (record['fingerprint'], record['movie_id'], record['frame'], record['shown_at'],
+                      record['base_shown_at']))
+            conn.execute('UPDATE DisplayState SET skipped_refreshes = ? WHERE id = 1 AND skipped_refreshes IS ?',
+                         (record['skipped'], record['base_skipped']))
+            # A stale journal, or one whose movie has been replaced since,
+            # must not change what is playing
+            movie = conn.execute('SELECT isActive FROM Movie WHERE id = ?', (record['movie_id'],)).fetchone()
+            if position.rowcount and movie['isActive']:
+                set_now_playing(record['movie_id'])
+    _journal.reset()
+
+def set_movie_last_updated(movie_id, last_updated):
+    """Record the scheduled time (CURRENT_TIMESTAMP format) of the frame just shown."""
+    with transaction() as conn:
+        conn.execute("UPDATE Movie SET last_updated = ? WHERE id = ?", (last_updated, movie_id))
 
 def check_config_against_settings():
     config_data = config.read_toml_file("config.toml")
@@ -126,11 +405,12 @@ def check_config_against_settings():
 
         choice = input("\nWould you like to update the database settings to match config.toml? (y/n): ").strip().lower()
         if choice == 'y':
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute("UPDATE Settings SET VideoRootPath = ?, Resolution = ? WHERE id = 1", (config_path, config_res))
-            conn.commit()
-            conn.close()
+            with transaction() as conn:
+                conn.execute("UPDATE Settings SET VideoRootPath = ?, Resolution = ? WHERE id = 1", (config_path, config_res))
+            if config_res != db_res:
+                from utils import prerender
+                for movie in get_all_movies():
+                    prerender.invalidate(movie['id'])
             print("[CONFIG UPDATED] Database settings updated to match config.toml.\n")
         else:
             print("[CONFIG SKIPPED] Database settings were not changed.\n")
@@ -138,172 +418,623 @@ def check_config_against_settings():
 
 def get_all_movies():
     conn = get_db_connection()
-    movies = conn.execute('SELECT * FROM Movie').fetchall()
-    conn.close()
-    return movies
+    record = _journaled()
+    return [_with_progress(movie, record) for movie in conn.execute('SELECT * FROM Movie').fetchall()]
 
 def get_movie_by_id(movie_id):
     conn = get_db_connection()
-    movie = conn.execute('SELECT * FROM Movie WHERE id = ?', (movie_id,)).fetchone()
-    conn.close()
-    return movie
+    return _with_progress(conn.execute('SELECT * FROM Movie WHERE id = ?', (movie_id,)).fetchone(), _journaled())
 
 def get_movie_by_path(video_path):
     conn = get_db_connection()
-    movie = conn.execute('SELECT * FROM Movie WHERE video_path = ?', (video_path,)).fetchone()
-    conn.close()
-    return movie
+    return conn.execute('SELECT * FROM Movie WHERE video_path = ?', (video_path,)).fetchone()
 
 def insert_movie(video_path, total_frames):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('''
-        INSERT INTO Movie (video_path, total_frames, time_per_frame, skip_frames, current_frame, isActive, isRandom)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (video_path, total_frames, 60, 1, 1, 0, 0))
-    conn.commit()
-    movie_id = cur.lastrowid
-    movie = conn.execute('SELECT * FROM Movie WHERE id = ?', (movie_id,)).fetchone()
-    conn.close()
-    return movie
+    with transaction() as conn:
+        cur = conn.execute('''
+            INSERT INTO Movie (video_path, total_frames, time_per_frame, skip_frames, current_frame, isActive, isRandom, random_seed)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (video_path, total_frames, 60, 1, 1, 0, 0, shuffle.new_seed()))
+        movie_id = cur.lastrowid
+        return conn.execute('SELECT * FROM Movie WHERE id = ?', (movie_id,)).fetchone()
+
+def set_total_frames(movie_id, total_frames):
+    with transaction() as conn:
+        conn.execute("UPDATE Movie SET total_frames = ? WHERE id = ?", (total_frames, movie_id))
 
 def update_settings(payload):
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    cur.execute('''
-        UPDATE Settings SET
-            use_quiet_hours = ?,
-            quiet_start = ?,
-            quiet_end = ?
-        WHERE id = 1
-    ''', (
-        int(payload.get('use_quiet_hours', 0)),
-        int(payload.get('quiet_start', 22)),
-        int(payload.get('quiet_end', 7)),
-    ))
-    conn.commit()
-    updated = cur.execute("SELECT * FROM Settings WHERE id = 1").fetchone()
-    conn.close()
+    with transaction() as conn:
+        conn.execute('''
+            UPDATE Settings SET
+                use_quiet_hours = ?,
+                quiet_start = ?,
+                quiet_end = ?
+            WHERE id = 1
+        ''', (
+            int(payload.get('use_quiet_hours', 0)),
+            int(payload.get('quiet_start', 22)),
+            int(payload.get('quiet_end', 7)),
+        ))
+        updated = conn.execute("SELECT * FROM Settings WHERE id = 1").fetchone()
+    scheduler.notify_playback_changed()
     return updated
 
 
 def update_movie(payload):
-    conn = get_db_connection()
-    cur = conn.cursor()   
-
-    cur.execute('''
-        UPDATE Movie SET
-            time_per_frame = ?,
-            skip_frames = ?,
-            current_frame = ?,
-            isRandom = ?,
-            total_frames = ?
-        WHERE id = ?
-    ''', (
-        int(payload['time_per_frame']),
-        int(payload['skip_frames']),
-        int(payload['current_frame']),
-        int(payload.get('isRandom', 0)),
-        int(payload['total_frames']),
-        int(payload['id'])
-    ))
-
-    conn.commit()
-    updated_movie = conn.execute('SELECT * FROM Movie WHERE id = ?', (payload['id'],)).fetchone()
-    conn.close()
+    with transaction(immediate=True) as conn:
+        _reset_progress(conn, payload['id'])
+        previous = conn.execute('SELECT * FROM Movie WHERE id = ?', (payload['id'],)).fetchone()
+
+        current_frame = int(payload['current_frame'])
+        is_random = int(payload.get('isRandom', 0))
+        random_seed = previous['random_seed'] if previous else None
+        if is_random and previous and (not previous['isRandom'] or random_seed is None
+                                       or previous['skip_frames'] != int(payload['skip_frames'])
+                                       or previous['total_frames'] != int(payload['total_frames'])):
+            # Switching random order on (or changing its lattice) starts a
+            # fresh pass, so every frame is visited before any repeats
+            random_seed = shuffle.new_seed()
+            current_frame = shuffle.frame_at(0, int(payload['total_frames']), int(payload['skip_frames']), random_seed)
+
+        conn.execute('''
+            UPDATE Movie SET
+                time_per_frame = ?,
+                skip_frames = ?,
+                current_frame = ?,
+                isRandom = ?,
+                total_frames = ?,
+                random_seed = ?
+            WHERE id = ?
+        ''', (
+            int(payload['time_per_frame']),
+            int(payload['skip_frames']),
+            current_frame,
+            is_random,
+            int(payload['total_frames']),
+            random_seed,
+            int(payload['id'])
+        ))
+
+        updated_movie = conn.execute('SELECT * FROM Movie WHERE id = ?', (payload['id'],)).fetchone()
+
+    # Pre-rendered frames follow the old schedule; drop them
+    if previous and any(previous[k] != updated_movie[k] for k in ('skip_frames', 'current_frame', 'total_frames',
+                                                                  'isRandom', 'random_seed')):
+        from utils import prerender
+        prerender.invalidate(updated_movie['id'])
+    scheduler.notify_playback_changed()
     return updated_movie
 
 
 def get_active_movie():
+    """The movie playing, as played: with its playlist entry's settings and the journaled progress applied."""
     conn = get_db_connection()
     movie = conn.execute("SELECT * FROM Movie WHERE isActive = 1 LIMIT 1").fetchone()
-    conn.close()
-    return movie
+    return _with_progress(_with_playlist_settings(conn, movie), _journaled())
 
 def set_now_playing(movie_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM NowPlaying")  # always just one
-    cur.execute("INSERT INTO NowPlaying (movie_id) VALUES (?)", (movie_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        # Always just one row, only rewritten when the movie changes
+        result = conn.execute("SELECT movie_id FROM NowPlaying LIMIT 1").fetchone()
+        if not result or result['movie_id'] != movie_id:
+            conn.execute("DELETE FROM NowPlaying")
+            conn.execute("INSERT INTO NowPlaying (movie_id) VALUES (?)", (movie_id,))
 
 def get_now_playing():
     conn = get_db_connection()
+    record = _journaled()
+    if record:
+        movie = conn.execute('SELECT * FROM Movie WHERE id = ?', (record['movie_id'],)).fetchone()
+        if movie and movie['isActive'] and _position(movie) == record['base'][:3]:
+            # Playing since the last checkpoint
+            return record['movie_id']
     result = conn.execute("SELECT movie_id FROM NowPlaying LIMIT 1").fetchone()
-    conn.close()
     return result['movie_id'] if result else None
 
 
 def set_active_movie(movie_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE Movie SET isActive = 0")
-    cur.execute("UPDATE Movie SET isActive = 1 WHERE id = ?", (movie_id,))
-    conn.commit()
-    conn.close()
+    with transaction(immediate=True) as conn:
+        _reset_progress(conn, movie_id)
+        # Starting a movie by hand leaves the playlist
+        conn.execute("UPDATE PlaylistState SET entry_id = NULL WHERE id = 1")
+        conn.execute("UPDATE Movie SET isActive = 0")
+        # last_updated = NULL makes the first frame due immediately
+        conn.execute('''
+            UPDATE Movie SET isActive = 1, started_at = CURRENT_TIMESTAMP, last_updated = NULL
+            WHERE id = ?
+        ''', (movie_id,))
+    scheduler.notify_playback_changed()
 
 def clear_active_movie():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE Movie SET isActive = 0")
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("UPDATE PlaylistState SET entry_id = NULL WHERE id = 1")
+        conn.execute("UPDATE Movie SET isActive = 0")
+    scheduler.notify_playback_changed()
 
 
 def delete_movie(movie_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT * FROM Movie WHERE id = ?', (movie_id,))
-    movie = cur.fetchone()
+    with transaction(immediate=True) as conn:
+        movie = conn.execute('SELECT * FROM Movie WHERE id = ?', (movie_id,)).fetchone()
+        if movie:
+            conn.execute('DELETE FROM Movie WHERE id = ?', (movie_id,))
+            conn.execute('DELETE FROM MovieIndex WHERE movie_id = ?', (movie_id,))
+            conn.execute('DELETE FROM MovieIndexChunk WHERE movie_id = ?', (movie_id,))
+            conn.execute('UPDATE Display SET movie_id = NULL WHERE movie_id = ?', (movie_id,))
+            conn.execute('''
+                UPDATE PlaylistState SET entry_id = NULL
+                WHERE entry_id IN (SELECT id FROM PlaylistEntry WHERE movie_id = ?)
+            ''', (movie_id,))
+            conn.execute('DELETE FROM PlaylistEntry WHERE movie_id = ?', (movie_id,))
+            _renumber_playlist(conn)
     if movie:
-        cur.execute('DELETE FROM Movie WHERE id = ?', (movie_id,))
-        conn.commit()
-    conn.close()
+        scheduler.notify_playback_changed()
     return movie
 
-def get_schema_version():
+# Columns of Display that update_display() accepts
+DISPLAY_FIELDS = ('name', 'host', 'port', 'resolution', 'movie_id', 'time_per_frame', 'skip_frames', 'current_frame')
+
+def get_displays():
+    """Every display target, with the video_path and total_frames of its movie."""
     conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        # Try to fetch the version
-        version = cur.execute("SELECT version FROM SchemaVersion").fetchone()
-        if version:
-            return version['version']
+    return conn.execute('''
+        SELECT Display.*, Movie.video_path, Movie.total_frames
+        FROM Display LEFT JOIN Movie ON Movie.id = Display.movie_id
+        ORDER BY Display.id
+    ''').fetchall()
+
+def get_display(display_id):
+    conn = get_db_connection()
+    return conn.execute('''
+        SELECT Display.*, Movie.video_path, Movie.total_frames
+        FROM Display LEFT JOIN Movie ON Movie.id = Display.movie_id
+        WHERE Display.id = ?
+    ''', (display_id,)).fetchone()
+
+def insert_display(name, host, port, resolution):
+    with transaction() as conn:
+        cur = conn.execute('INSERT INTO Display (name, host, port, resolution) VALUES (?, ?, ?, ?)',
+                           (name, host, port, resolution))
+    scheduler.notify_playback_changed()
+    return get_display(cur.lastrowid)
+
+def update_display(display_id, payload):
+    """
+    Change some of a display's DISPLAY_FIELDS. Giving it another movie starts
+    that movie from current_frame (default 0) with the first frame due now.
+    """
+    fields = {k: payload[k] for k in DISPLAY_FIELDS if k in payload}
+    with transaction(immediate=True) as conn:
+        previous = conn.execute('SELECT * FROM Display WHERE id = ?', (display_id,)).fetchone()
+        if not previous:
+            return None
+        if 'movie_id' in fields and fields['movie_id'] != previous['movie_id']:
+            fields.setdefault('current_frame', 0)
+            fields['last_updated'] = None
+        if fields:
+            assignments = ", ".join(f"{column} = ?" for column in fields)
+            conn.execute(f'UPDATE Display SET {assignments} WHERE id = ?', (*fields.values(), display_id))
+    scheduler.notify_playback_changed()
+    return get_display(display_id)
+
+def delete_display(display_id):
+    with transaction() as conn:
+        cur = conn.execute('DELETE FROM Display WHERE id = ?', (display_id,))
+    scheduler.notify_playback_changed()
+    return cur.rowcount > 0
+
+def advance_display_frame(display_id, from_frame, to_frame):
+    """Like advance_current_frame, for a display target."""
+    with transaction() as conn:
+        cur = conn.execute('UPDATE Display SET current_frame = ? WHERE id = ? AND current_frame = ?',
+                           (to_frame, display_id, from_frame))
+        return cur.rowcount > 0
+
+def set_display_last_updated(display_id, last_updated):
+    with transaction() as conn:
+        conn.execute('UPDATE Display SET last_updated = ? WHERE id = ?', (last_updated, display_id))
+
+def record_display_push(display_id, error, frame=None):
+    """Record the outcome of pushing a frame to a display (error None on success)."""
+    with transaction() as conn:
+        if error is None:
+            conn.execute('UPDATE Display SET last_push_at = ?, last_pushed_frame = ?, last_error = NULL WHERE id = ?',
+                         (time.time(), frame, display_id))
         else:
-            # Table exists but no row yet
-            cur.execute("INSERT INTO SchemaVersion (version) VALUES (1)")
-            conn.commit()
+            conn.execute('UPDATE Display SET last_error = ? WHERE id = ?', (error, display_id))
+
+# Settings a playlist entry can override; NULL keeps the movie's own. They
+# apply while the entry plays and are never written to the Movie row.
+PLAYLIST_SETTINGS = ('time_per_frame', 'skip_frames', 'isRandom')
+# Columns of PlaylistEntry that update_playlist_entry() accepts
+PLAYLIST_FIELDS = ('movie_id',) + PLAYLIST_SETTINGS
+
+def get_playlist():
+    """Playlist entries in play order, with the video_path and total_frames of their movie."""
+    conn = get_db_connection()
+    return conn.execute('''
+        SELECT PlaylistEntry.*, Movie.video_path, Movie.total_frames
+        FROM PlaylistEntry JOIN Movie ON Movie.id = PlaylistEntry.movie_id
+        ORDER BY PlaylistEntry.position, PlaylistEntry.id
+    ''').fetchall()
+
+def get_playlist_entry(entry_id):
+    conn = get_db_connection()
+    return conn.execute('''
+        SELECT PlaylistEntry.*, Movie.video_path, Movie.total_frames
+        FROM PlaylistEntry JOIN Movie ON Movie.id = PlaylistEntry.movie_id
+        WHERE PlaylistEntry.id = ?
+    ''', (entry_id,)).fetchone()
+
+def get_playlist_state():
+    """The entry playing (entry_id, NULL when the playlist is not running) and whether it repeats."""
+    conn = get_db_connection()
+    return conn.execute("SELECT * FROM PlaylistState WHERE id = 1").fetchone()
+
+def _renumber_playlist(conn, entry_id=None, position=None):
+    """Close the gaps in PlaylistEntry.position, moving entry_id to position (clamped) if given."""
+    ids = [row['id'] for row in conn.execute('SELECT id FROM PlaylistEntry ORDER BY position, id')]
+    if entry_id in ids:
+        ids.remove(entry_id)
+        ids.insert(min(max(0, position), len(ids)), entry_id)
+    conn.executemany('UPDATE PlaylistEntry SET position = ? WHERE id = ?', list(enumerate(ids)))
+
+def insert_playlist_entry(movie_id, position=None):
+    """Add a movie to the playlist, at the end unless position is given."""
+    with transaction(immediate=True) as conn:
+        cur = conn.execute('''
+            INSERT INTO PlaylistEntry (position, movie_id)
+            VALUES ((SELECT COUNT(*) FROM PlaylistEntry), ?)
+        ''', (movie_id,))
+        if position is not None:
+            _renumber_playlist(conn, cur.lastrowid, position)
+    scheduler.notify_playback_changed()
+    return get_playlist_entry(cur.lastrowid)
+
+def update_playlist_entry(entry_id, payload):
+    """
+    Change some of an entry's PLAYLIST_FIELDS and/or its position. Settings
+    are applied when the entry next starts playing.
+    """
+    fields = {k: payload[k] for k in PLAYLIST_FIELDS if k in payload}
+    with transaction(immediate=True) as conn:
+        if not conn.execute('SELECT 1 FROM PlaylistEntry WHERE id = ?', (entry_id,)).fetchone():
+            return None
+        if fields:
+            assignments = ", ".join(f"{column} = ?" for column in fields)
+            conn.execute(f'UPDATE PlaylistEntry SET {assignments} WHERE id = ?', (*fields.values(), entry_id))
+        if payload.get('position') is not None:
+            _renumber_playlist(conn, entry_id, payload['position'])
+    scheduler.notify_playback_changed()
+    return get_playlist_entry(entry_id)
+
+def delete_playlist_entry(entry_id):
+    """
+    Remove an entry. Removing the one playing leaves its movie playing on
+    its own, as if started by hand.
+    """
+    with transaction(immediate=True) as conn:
+        cur = conn.execute('DELETE FROM PlaylistEntry WHERE id = ?', (entry_id,))
+        conn.execute('UPDATE PlaylistState SET entry_id = NULL WHERE id = 1 AND entry_id = ?', (entry_id,))
+        _renumber_playlist(conn)
+    scheduler.notify_playback_changed()
+    return cur.rowcount > 0
+
+def _with_playlist_settings(conn, movie):
+    """
+    movie with the settings of the playlist entry playing it, as they were
+    when the entry started (PlaylistState keeps a copy, so editing the entry
+    mid-pass does not change the schedule under the player).
+    """
+    if movie is None:
+        return movie
+    state = conn.execute('''
+        SELECT PlaylistState.* FROM PlaylistState
+        JOIN PlaylistEntry ON PlaylistEntry.id = PlaylistState.entry_id
+        WHERE PlaylistState.id = 1 AND PlaylistEntry.movie_id = ?
+    ''', (movie['id'],)).fetchone()
+    overrides = {key: state[key] for key in PLAYLIST_SETTINGS if state and state[key] is not None}
+    return {**dict(movie), **overrides} if overrides else movie
+
+def _entry_playback(movie, entry):
+    """
+    How `entry` starts: its settings (or the movie's own) from the first
+    frame of a pass. A random pass moves on to the next seed, so the first
+    frame is known before the switch and can be pre-rendered.
+    """
+    time_per_frame, skip_frames, is_random = (
+        movie[key] if entry[key] is None else entry[key] for key in PLAYLIST_SETTINGS)
+    random_seed = movie['random_seed']
+    current_frame = 0
+    if is_random:
+        random_seed = (random_seed or 0) + 1
+        current_frame = shuffle.frame_at(0, movie['total_frames'], skip_frames, random_seed)
+    return {'time_per_frame': time_per_frame, 'skip_frames': skip_frames, 'isRandom': int(bool(is_random)),
+            'current_frame': current_frame, 'random_seed': random_seed}
+
+def _next_playlist_entry(conn):
+    """(entry after the playing one, its movie), wrapping when the playlist repeats; None at the end."""
+    state = conn.execute("SELECT * FROM PlaylistState WHERE id = 1").fetchone()
+    current = conn.execute('SELECT * FROM PlaylistEntry WHERE id = ?', (state['entry_id'],)).fetchone()
+    if not current:
+        return None
+    entry = conn.execute('''
+        SELECT * FROM PlaylistEntry WHERE position > ? ORDER BY position, id LIMIT 1
+    ''', (current['position'],)).fetchone()
+    if not entry and state['repeat']:
+        entry = conn.execute('SELECT * FROM PlaylistEntry ORDER BY position, id LIMIT 1').fetchone()
+    if not entry:
+        return None
+    movie = conn.execute('SELECT * FROM Movie WHERE id = ?', (entry['movie_id'],)).fetchone()
+    return (entry, movie) if movie else None
+
+def get_next_playlist_title():
+    """
+    The Movie row of the title after the playing one as it will look once
+    started (see advance_playlist), or None.
+    """
+    with transaction() as conn:
+        upcoming = _next_playlist_entry(conn)
+    if not upcoming:
+        return None
+    entry, movie = upcoming
+    return {**dict(movie), **_entry_playback(movie, entry), 'isActive': 1}
+
+def _start_playlist_entry(conn, entry, last_updated):
+    _reset_progress(conn, entry['movie_id'])
+    movie = conn.execute('SELECT * FROM Movie WHERE id = ?', (entry['movie_id'],)).fetchone()
+    playback = _entry_playback(movie, entry)
+    conn.execute("UPDATE Movie SET isActive = 0")
+    # Only the position is the movie's; the entry's settings live in PlaylistState
+    conn.execute('''
+        UPDATE Movie SET current_frame = ?, random_seed = ?, isActive = 1, started_at = CURRENT_TIMESTAMP,
+            last_updated = ?
+        WHERE id = ?
+    ''', (playback['current_frame'], playback['random_seed'], last_updated, movie['id']))
+    conn.execute('''
+        UPDATE PlaylistState SET entry_id = ?, time_per_frame = ?, skip_frames = ?, isRandom = ? WHERE id = 1
+    ''', (entry['id'], *(entry[key] for key in PLAYLIST_SETTINGS)))
+    return _with_playlist_settings(conn, conn.execute('SELECT * FROM Movie WHERE id = ?', (movie['id'],)).fetchone())
+
+def start_playlist(entry_id=None, repeat=None):
+    """
+    Play the playlist from entry_id (default the first entry) with the first
+    frame due now. repeat, if given, sets whether it starts over after the
+    last entry. Returns the movie started, or None if there is no such entry.
+    """
+    with transaction(immediate=True) as conn:
+        if entry_id is None:
+            entry = conn.execute('SELECT * FROM PlaylistEntry ORDER BY position, id LIMIT 1').fetchone()
+        else:
+            entry = conn.execute('SELECT * FROM PlaylistEntry WHERE id = ?', (entry_id,)).fetchone()
+        if not entry:
+            return None
+        if repeat is not None:
+            conn.execute("UPDATE PlaylistState SET repeat = ? WHERE id = 1", (int(bool(repeat)),))
+        movie = _start_playlist_entry(conn, entry, None)
+    scheduler.notify_playback_changed()
+    return movie
+
+def advance_playlist(movie_id, last_updated):
+    """
+    Called, within the caller's transaction, once movie_id has shown the last
+    frame of its pass: start the next playlist title with its first frame
+    due one interval after last_updated, or stop at the end of a playlist
+    that does not repeat. Returns the movie started, or None (also when
+    movie_id is not playing from the playlist).
+    """
+    with transaction() as conn:
+        state = conn.execute("SELECT * FROM PlaylistState WHERE id = 1").fetchone()
+        current = conn.execute('SELECT * FROM PlaylistEntry WHERE id = ?', (state['entry_id'],)).fetchone()
+        if not current or current['movie_id'] != movie_id:
+            return None
+        upcoming = _next_playlist_entry(conn)
+        if not upcoming:
+            conn.execute("UPDATE PlaylistState SET entry_id = NULL WHERE id = 1")
+            conn.execute("UPDATE Movie SET isActive = 0")
+            return None
+        return _start_playlist_entry(conn, upcoming[0], last_updated)
+
+def get_display_state():
+    conn = get_db_connection()
+    state = conn.execute("SELECT * FROM DisplayState WHERE id = 1").fetchone()
+    record = _journaled()
+    if state is None or record is None:
+        return state
+    # Each part applies while the database still holds its base
+    journaled = {}
+    if record['fingerprint'] and state['shown_at'] == record['base_shown_at']:
+        journaled.update(fingerprint=record['fingerprint'], movie_id=record['movie_id'], frame=record['frame'],
+                         shown_at=record['shown_at'])
+    if state['skipped_refreshes'] == record['base_skipped']:
+        journaled['skipped_refreshes'] = record['skipped']
+    return {**dict(state), **journaled} if journaled else state
+
+def set_display_fingerprint(fingerprint, movie_id=None, frame=None):
+    """Record what the panel now shows: a movie frame, or something else (movie_id None)."""
+    with transaction() as conn:
+        conn.execute('''
+            UPDATE DisplayState SET fingerprint = ?, movie_id = ?, frame = ?, shown_at = ?,
+                                    updated_at = CURRENT_TIMESTAMP
+            WHERE id = 1
+        ''', (fingerprint, movie_id, frame, time.time()))
+
+def increment_skipped_refreshes():
+    with transaction() as conn:
+        conn.execute("UPDATE DisplayState SET skipped_refreshes = skipped_refreshes + 1 WHERE id = 1")
+
+def get_movie_index(movie_id):
+    conn = get_db_connection()
+    return conn.execute('SELECT * FROM MovieIndex WHERE movie_id = ?', (movie_id,)).fetchone()
+
+def start_movie_index(movie_id, file_size, file_mtime):
+    with transaction() as conn:
+        conn.execute('DELETE FROM MovieIndexChunk WHERE movie_id = ?', (movie_id,))
+        conn.execute('''
+            INSERT OR REPLACE INTO MovieIndex (movie_id, file_size, file_mtime, frames_indexed, frame_count, keyframes, complete)
+            VALUES (?, ?, ?, 0, NULL, NULL, 0)
+        ''', (movie_id, file_size, file_mtime))
+
+def save_movie_index_chunk(movie_id, chunk, keyframes, frames_indexed):
+    with transaction() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO MovieIndexChunk (movie_id, chunk, keyframes)
+            VALUES (?, ?, ?)
+        ''', (movie_id, chunk, keyframes))
+        conn.execute('UPDATE MovieIndex SET frames_indexed = ? WHERE movie_id = ?', (frames_indexed, movie_id))
+
+def finish_movie_index(movie_id, frame_count):
+    with transaction(immediate=True) as conn:
+        # Keyframes are sparse, so the merged list is small enough to keep on the index row
+        rows = conn.execute('SELECT keyframes FROM MovieIndexChunk WHERE movie_id = ? ORDER BY chunk', (movie_id,)).fetchall()
+        keyframes = b''.join(row['keyframes'] for row in rows)
+        conn.execute('''
+            UPDATE MovieIndex SET frames_indexed = ?, frame_count = ?, keyframes = ?, complete = 1
+            WHERE movie_id = ?
+        ''', (frame_count, frame_count, keyframes, movie_id))
+        conn.execute('UPDATE Movie SET total_frames = ? WHERE id = ?', (frame_count, movie_id))
+
+def create_upload_session(session_id, filename, size, sha256):
+    with transaction() as conn:
+        conn.execute('INSERT INTO UploadSession (id, filename, size, sha256) VALUES (?, ?, ?, ?)',
+                     (session_id, filename, size, sha256))
+        return conn.execute('SELECT * FROM UploadSession WHERE id = ?', (session_id,)).fetchone()
+
+def get_upload_session(session_id):
+    conn = get_db_connection()
+    return conn.execute('SELECT * FROM UploadSession WHERE id = ?', (session_id,)).fetchone()
+
+def get_upload_sessions():
+    conn = get_db_connection()
+    return conn.execute('SELECT * FROM UploadSession').fetchall()
+
+def advance_upload_session(session_id, from_offset, to_offset):
+    """Record bytes received up to to_offset, if no other request moved it first."""
+    with transaction() as conn:
+        cur = conn.execute('UPDATE UploadSession SET received = ? WHERE id = ? AND received = ?',
+                           (to_offset, session_id, from_offset))
+        return cur.rowcount > 0
+
+def delete_upload_session(session_id):
+    with transaction() as conn:
+        conn.execute('DELETE FROM UploadSession WHERE id = ?', (session_id,))
+
+def get_schema_version():
+    with transaction() as conn:
+        try:
+            # Try to fetch the version
+            version = conn.execute("SELECT version FROM SchemaVersion").fetchone()
+            if version:
+                return version['version']
+            else:
+                # Table exists but no row yet
+                conn.execute("INSERT INTO SchemaVersion (version) VALUES (1)")
+                return 1
+        except sqlite3.OperationalError:
+            # Table doesn't exist — create it and initialize
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS SchemaVersion (
+                    version INTEGER
+                )
+            ''')
+            conn.execute("INSERT INTO SchemaVersion (version) VALUES (1)")
             return 1
-    except sqlite3.OperationalError:
-        # Table doesn't exist — create it and initialize
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS SchemaVersion (
-                version INTEGER
-            )
-        ''')
-        cur.execute("INSERT INTO SchemaVersion (version) VALUES (1)")
-        conn.commit()
-        return 1
-    finally:
-        conn.close()
 
 
 def run_migrations():
     current_version = get_schema_version()
-    conn = get_db_connection()
-    cur = conn.cursor()
 
     if current_version < 3:
         print("🔧 Applying schema migration to version 3...")
 
-        try:
-            cur.execute("ALTER TABLE Settings ADD COLUMN use_quiet_hours BOOLEAN DEFAULT 0")
-            cur.execute("ALTER TABLE Settings ADD COLUMN quiet_start INTEGER DEFAULT 22")
-            cur.execute("ALTER TABLE Settings ADD COLUMN quiet_end INTEGER DEFAULT 7")
-        except sqlite3.OperationalError as e:
-            print("⚠️ Warning during migration to v3:", e)
-
-        cur.execute("UPDATE SchemaVersion SET version = 3")
-        conn.commit()
\ No newline at end of file
+        with transaction() as conn:
+            try:
+                conn.execute("ALTER TABLE Settings ADD COLUMN use_quiet_hours BOOLEAN DEFAULT 0")
+                conn.execute("ALTER TABLE Settings ADD COLUMN quiet_start INTEGER DEFAULT 22")
+                conn.execute("ALTER TABLE Settings ADD COLUMN quiet_end INTEGER DEFAULT 7")
+            except sqlite3.OperationalError as e:
+                print("⚠️ Warning during migration to v3:", e)
+
+            conn.execute("UPDATE SchemaVersion SET version = 3")
+
+    if current_version < 4:
+        print("🔧 Applying schema migration to version 4...")
+
+        with transaction() as conn:
+            for column in ("started_at", "last_updated"):
+                try:
+                    conn.execute(f"ALTER TABLE Movie ADD COLUMN {column} TIMESTAMP")
+                except sqlite3.OperationalError as e:
+                    print("⚠️ Warning during migration to v4:", e)
+
+            conn.execute("UPDATE SchemaVersion SET version = 4")
+
+    if current_version < 5:
+        print("🔧 Applying schema migration to version 5...")
+
+        with transaction() as conn:
+            for column, kind in (("movie_id", "INTEGER"), ("frame", "INTEGER"), ("shown_at", "REAL")):
+                try:
+                    conn.execute(f"ALTER TABLE DisplayState ADD COLUMN {column} {kind}")
+                except sqlite3.OperationalError as e:
+                    print("⚠️ Warning during migration to v5:", e)
+
+            conn.execute("UPDATE SchemaVersion SET version = 5")
+
+    if current_version < 6:
+        print("🔧 Applying schema migration to version 6...")
+
+        with transaction() as conn:
+            try:
+                conn.execute("ALTER TABLE Movie ADD COLUMN random_seed INTEGER")
+            except sqlite3.OperationalError as e:
+                print("⚠️ Warning during migration to v6:", e)
+            for (movie_id,) in conn.execute("SELECT id FROM Movie WHERE random_seed IS NULL").fetchall():
+                conn.execute("UPDATE Movie SET random_seed = ? WHERE id = ?", (shuffle.new_seed(), movie_id))
+
+            conn.execute("UPDATE SchemaVersion SET version = 6")
+
+    if current_version < 7:
+        print("🔧 Applying schema migration to version 7...")
+
+        with transaction() as conn:
+            for column, kind in (("time_per_frame", "INTEGER"), ("skip_frames", "INTEGER"), ("isRandom", "BOOLEAN")):
+                try:
+                    conn.execute(f"ALTER TABLE PlaylistState ADD COLUMN {column} {kind}")
+                except sqlite3.OperationalError as e:
+                    print("⚠️ Warning during migration to v7:", e)
+
+            conn.execute("UPDATE SchemaVersion SET version = 7")
+
+    if current_version < 8:
+        print("🔧 Applying schema migration to version 8...")
+
+        with transaction() as conn:
+            try:
+                conn.execute("ALTER TABLE Movie ADD COLUMN progress_generation INTEGER DEFAULT 0")
+            except sqlite3.OperationalError as e:
+                print("⚠️ Warning during migration to v8:", e)
+
+            conn.execute("UPDATE SchemaVersion SET version = 8")
+
+    if current_version < 9:
+        print("🔧 Applying schema migration to version 9...")
+
+        with transaction() as conn:
+            # Per-frame timestamps were never read; DROP COLUMN needs SQLite 3.35
+            try:
+                conn.execute("ALTER TABLE MovieIndexChunk DROP COLUMN timestamps")
+            except sqlite3.OperationalError as e:
+                print("⚠️ Warning during migration to v9:", e)
+                conn.execute("UPDATE MovieIndexChunk SET timestamps = NULL")
+
+            conn.execute("UPDATE SchemaVersion SET version = 9")
+
+
+# Time every query helper for /metrics (left unwrapped when METRICS_ENABLED is off)
+_UNTIMED = {'get_db_connection', 'close_db_connection', 'transaction', 'init_db', 'run_migrations',
+            'get_schema_version', 'check_config_against_settings'}
+metrics.instrument_functions(globals(), metrics.DB_QUERY_SECONDS, [
+    name for name, value in list(globals().items())
+    if callable(value) and getattr(value, '__module__', None) == __name__
+    and not name.startswith('_') and name not in _UNTIMED
+])
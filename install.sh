@@ -251,14 +251,14 @@ fi
 
 # Install Python deps via pip only; no hardware-extras prompts or auto-apt.
 set +e
-pip install -e .
+pip install -e '.[server]'
 PIP_STATUS=$?
 set -e
 if [ $PIP_STATUS -ne 0 ]; then
   warn "pip install failed. If the error mentions 'lgpio' or '-llgpio' on Raspberry Pi, install system packages and retry:"
   echo "  sudo apt install -y swig liblgpio-dev"
   warn "If errors mention 'Python.h' missing on Pi, see README Troubleshooting for Path A/Path B guidance."
-  error "Aborting due to pip install failure. After installing system packages, re-run ./install.sh or run 'pip install -e .' inside your venv."
+  error "Aborting due to pip install failure. After installing system packages, re-run ./install.sh or run 'pip install -e .[server]' inside your venv."
   exit 1
 fi
 
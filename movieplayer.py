@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
 
-import threading
+# First, so the startup report counts the imports below
+from utils import startup
+
+import os
 import time
-import requests
 import logging
 import database
 
-from utils import video_utils, eframe_inky
+from utils import video_utils, eframe_inky, events, fanout, frame_diff, frame_index, metrics, prerender, scheduler, webserver
 
 def setup_logger(log_level):
     logging.basicConfig(level=log_level,
@@ -20,63 +22,129 @@ def init_database():
         database.insert_default_settings()
     else:
         database.check_config_against_settings()
+    # Progress journaled since the last checkpoint survives a crash or restart
+    database.checkpoint_progress()
+
+
+def show_requested_frames(logger):
+    """Show the frames asked for with scheduler.request_refresh (the web UI's display update button)."""
+    for movie_id in scheduler.take_refresh_requests():
+        movie = database.get_movie_by_id(movie_id)
+        settings = database.get_settings()
+        if not movie or not settings or not video_utils.process_video(movie, settings):
+            logger.warning(f"Could not show the current frame of movie {movie_id} as requested.")
+            continue
+        frame_path = os.path.join(f"static/{movie_id}", "frame.jpg")
+        if eframe_inky.show_on_inky(frame_path):
+            database.set_display_fingerprint(frame_diff.fingerprint_file(frame_path), movie_id, movie['current_frame'])
 
 
 def run_webui():
-    # Launch Flask server in a background thread
-    # threading.Thread(target=lambda: webui.app.run(host="0.0.0.0", port=8000), daemon=True).start()
-
-    def start_flask():
-        from webui import app
-        app.run(host="0.0.0.0", port=8000, debug=False)
-    
-    thread = threading.Thread(target=start_flask, daemon=True)
-    thread.start()
-
-    # Wait until Flask server responds
-    for _ in range(30):  # wait up to ~15 seconds
-        try:
-            res = requests.get("http://127.0.0.1:8000/")
-            if res.status_code == 200:
-                print("[INFO] Flask server is up.")
-                break
-        except requests.exceptions.ConnectionError:
-            time.sleep(0.5)
-    else:
-        print("[ERROR] Flask server did not start in time.")
+    # The web UI runs in its own process unless WEBUI_SERVER = "thread"; both
+    # modes are listening (or have failed) when this returns
+    try:
+        if webserver.WEBUI_SERVER == "thread":
+            webserver.serve_in_thread()
+            print("[INFO] Flask server is up.")
+            return
+        # /metrics runs in the other process; publish this one's metrics to it
+        metrics.start_export()
+        if webserver.WebServerProcess().start():
+            print("[INFO] Web UI process is up.")
+        else:
+            print("[ERROR] Web UI process did not start in time.")
+    except OSError as e:
+        print(f"[ERROR] Could not start the web UI: {e}")
 
 
 def main():
-    from database import get_active_movie, set_now_playing
+    from database import get_active_movie, get_settings, set_display_fingerprint
 
     logger = setup_logger(logging.INFO)
-    wait_counter = 0
+    idle_logged = False
+    held_due = None
+    quiet_logged_until = None
+    # Last state announced on /events; the first pass announces both
+    announced_movie = announced_quiet = object()
+    session = video_utils.CaptureSession()
+    prerender.PrerenderWorker().start()
+    # Display targets on other frames (Display table) run on their own thread
+    fanout.FanoutPlayer().start()
+    frame_index.resume_pending(get_settings())
+    startup.phase_done("workers")
 
     movie = get_active_movie()
-    eframe_inky.show_startup_status(movie)
-        
-
+    startup_image = eframe_inky.show_startup_status(movie)
+    if startup_image:
+        # The panel no longer shows the last movie frame
+        set_display_fingerprint(frame_diff.fingerprint_file(startup_image))
+    startup.phase_done("startup screen")
+
+    # Sleep until the next frame is due. Web UI changes (start, stop, new
+    # settings) call scheduler.notify_playback_changed() and wake us early,
+    # after which the due time is recomputed from the database.
     while True:
+        seen = scheduler.generation()
+        show_requested_frames(logger)
         movie = get_active_movie()
+        settings = get_settings()
+
+        movie_id = movie['id'] if movie else None
+        if movie_id != announced_movie:
+            events.publish(events.PLAYBACK, movie_id=movie_id, state="started" if movie else "stopped")
+            announced_movie = movie_id
+        quiet = video_utils.should_skip_due_to_quiet_hours(settings)
+        if quiet != announced_quiet:
+            events.publish(events.QUIET_HOURS, active=quiet, enabled=bool(int(settings['use_quiet_hours'])))
+            announced_quiet = quiet
 
         if not movie:
-            if wait_counter % 12 == 0:
+            session.release()
+            if not idle_logged:
                 print("[INFO] No active movie. Waiting...")
-            wait_counter += 1
-            time.sleep(5)
+                idle_logged = True
+            startup.report()
+            scheduler.wait(None, seen)
+            continue
+        idle_logged = False
+
+        now = time.time()
+        if quiet:
+            due = scheduler.next_due_time(movie, now)
+            if due <= now and due != held_due:
+                # Count each held-back frame once, not every wake-up
+                metrics.QUIET_HOURS_SKIPS.inc()
+                held_due = due
+            resume_at = video_utils.quiet_hours_end(settings)
+            if resume_at != quiet_logged_until:
+                # Once per quiet period, not on every wake-up
+                logger.info(f"Quiet hours; next frame at {resume_at.strftime('%Y-%m-%d %H:%M:%S')}")
+                quiet_logged_until = resume_at
+            startup.report()
+            scheduler.wait(resume_at.timestamp() - now, seen)
             continue
 
-        movie_id = movie['id']
-        set_now_playing(movie_id)
-        wait_counter = 0
-
-        video_utils.play_video(logger)
+        due = scheduler.next_due_time(movie, now)
+        if due > now:
+            startup.report()
+            scheduler.wait(due - now, seen)
+            continue
 
-        # Sleep based on DB-defined interval (in minutes)
-        time.sleep(movie['time_per_frame'] * 60)
+        interval = movie['time_per_frame'] * 60
+        shown = video_utils.play_video(logger, session, scheduler.schedule_anchor(due, interval, now))
+        startup.phase_done("first frame")
+        startup.report()
+        if not shown:
+            # Nothing was shown (eg an unreadable frame); retry next interval
+            scheduler.wait(interval, seen)
 
 
 if __name__ == "__main__":
+    startup.phase_done("imports")
+    # Probing the panel (and importing its driver) overlaps the next phases
+    startup.in_background("panel detection", eframe_inky.detect_panel)
     init_database()  # Initialize the database
+    startup.phase_done("database")
     run_webui()  # Start Flask
+    startup.phase_done("web UI")
     main()       # Start movie playback
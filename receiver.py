@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Lightweight display receiver for fan-out mode.
+
+Run this on each extra frame instead of the full player. It listens for
+frames pushed by the host's fan-out player (see utils/wire.py for the
+protocol), acknowledges them at once and refreshes the panel in the
+background; if several frames arrive during one refresh only the newest is
+shown. No database, video files or web UI are needed on the receiver:
+
+    movieframe-receiver [--port 8765] [--save last_frame.jpg]
+"""
+
+import argparse
+import io
+import os
+import socketserver
+import threading
+
+from utils import config, eframe_inky, wire
+
+config_data = config.read_toml_file("config.toml")
+# Same keys as the host's (utils/fanout.py); config.toml is optional here
+RECEIVER_PORT = int(config_data.get("RECEIVER_PORT", wire.DEFAULT_PORT))
+FANOUT_TIMEOUT_SECONDS = float(config_data.get("FANOUT_TIMEOUT_SECONDS", wire.DEFAULT_TIMEOUT_SECONDS))
+
+
+class LatestFrame:
+    """One-slot mailbox between the network handler and the panel thread."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.frame = None
+
+    def put(self, header, data):
+        with self.condition:
+            self.frame = (header, data)
+            self.condition.notify()
+
+    def take(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.frame is not None)
+            frame, self.frame = self.frame, None
+            return frame
+
+
+def show_frames(mailbox, save_path):
+    while True:
+        header, data = mailbox.take()
+        print(f"[INFO] Showing {header.get('display')}: movie {header.get('movie_id')} frame {header.get('frame')}")
+        if save_path:
+            tmp_path = f"{save_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, save_path)
+        eframe_inky.show_on_inky(io.BytesIO(data))
+
+
+def make_handler(mailbox):
+    class FrameHandler(socketserver.BaseRequestHandler):
+        def handle(self):
+            self.request.settimeout(FANOUT_TIMEOUT_SECONDS)
+            width, height = eframe_inky.get_inky_resolution()
+            reply = {"ok": True, "width": width, "height": height}
+            try:
+                kind, header, payload = wire.read_message(self.request)
+                if kind == wire.KIND_FRAME:
+                    if (header.get("width"), header.get("height")) != (width, height):
+                        reply = {**reply, "ok": False,
+                                 "error": f"Frame is {header.get('width')}x{header.get('height')}, panel is {width}x{height}"}
+                    else:
+                        mailbox.put(header, payload)
+                elif kind != wire.KIND_INFO:
+                    reply = {**reply, "ok": False, "error": f"Unknown message kind {kind!r}"}
+                wire.write_message(self.request, wire.KIND_REPLY, reply)
+            except (OSError, ValueError, wire.ProtocolError) as e:
+                print(f"[WARN] Bad request from {self.client_address[0]}: {e}")
+
+    return FrameHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Receive frames pushed by a fan-out host.")
+    parser.add_argument("--host", default="0.0.0.0", help="address to listen on (default all)")
+    parser.add_argument("--port", type=int, default=RECEIVER_PORT,
+                        help=f"port to listen on (default {RECEIVER_PORT})")
+    parser.add_argument("--save", metavar="PATH", help="also write the last received frame to PATH")
+    args = parser.parse_args()
+
+    mailbox = LatestFrame()
+    threading.Thread(target=show_frames, args=(mailbox, args.save), daemon=True).start()
+
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    with socketserver.ThreadingTCPServer((args.host, args.port), make_handler(mailbox)) as server:
+        print(f"[INFO] Receiver listening on {args.host}:{args.port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import pytest
+
+from utils import progress
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(progress, "PROGRESS_CHECKPOINT_SECONDS", 600)
+    import database
+    database.close_db_connection()
+    monkeypatch.setattr(database, "_journal", progress.Journal(f"{database.DB_PATH}-progress"))
+    database.init_db()
+    yield database
+    database.close_db_connection()
+
+
+def _play_to(database, frame, minute):
+    """What play_video does between checkpoints: journal one frame of progress."""
+    movie = database.get_active_movie()
+    assert database.journal_progress(movie, frame, None, f"2026-01-01 00:{minute:02d}:00")
+
+
+def test_rewind_to_checkpointed_frame_is_not_lost(database):
+    movie = database.insert_movie("movie.mp4", 300)
+    payload = {'id': movie['id'], 'time_per_frame': 1, 'skip_frames': 10, 'current_frame': 50,
+               'isRandom': 0, 'total_frames': 300}
+    database.update_movie(payload)
+    database.set_active_movie(movie['id'])
+    database.set_movie_last_updated(movie['id'], "2026-01-01 00:00:00")
+
+    for minute, frame in enumerate((60, 70, 80), start=1):
+        _play_to(database, frame, minute)
+    assert database.get_active_movie()['current_frame'] == 80
+
+    # The web UI sets the frame the database already held at the checkpoint
+    database.update_movie(payload)
+    assert database.get_active_movie()['current_frame'] == 50
+    assert database.get_movie_by_id(movie['id'])['current_frame'] == 50
+
+    # The player's next frame commits instead of journaling from the stale
+    # record, and a checkpoint does not bring the old progress back
+    assert not database.journal_progress({**dict(database.get_active_movie()), 'current_frame': 80}, 90, None,
+                                         "2026-01-01 00:04:00")
+    database.checkpoint_progress()
+    assert database.get_active_movie()['current_frame'] == 50
+
+
+def test_restart_keeps_journaled_progress(database):
+    movie = database.insert_movie("movie.mp4", 300)
+    database.update_movie({'id': movie['id'], 'time_per_frame': 1, 'skip_frames': 10, 'current_frame': 0,
+                           'isRandom': 0, 'total_frames': 300})
+    database.set_active_movie(movie['id'])
+    database.set_movie_last_updated(movie['id'], "2026-01-01 00:00:00")
+    _play_to(database, 10, 1)
+    _play_to(database, 20, 2)
+
+    # Starting the movie again folds the journal in before invalidating it
+    database.set_active_movie(movie['id'])
+    assert database.get_active_movie()['current_frame'] == 20
@@ -1,8 +1,21 @@
-"""Convenience re-exports for utils submodules."""
+"""
+Convenience re-exports for utils submodules.
 
-# Explicit re-exports to satisfy linters
-from . import video_utils as video_utils
-from . import eframe_inky as eframe_inky
-from . import config as config
+Submodules are imported on first access (`utils.video_utils`, or
+`from utils import video_utils`), so importing one light module such as
+utils.config does not pull in OpenCV, numpy or the Inky driver.
+"""
 
-__all__ = ["video_utils", "eframe_inky", "config"]
\ No newline at end of file
+import importlib
+
+__all__ = ["video_utils", "eframe_inky", "config", "dir_index", "palette", "frame_archive", "frame_index", "prerender", "ingest", "uploads", "decoders", "letterbox", "render_cache", "scene_index", "shuffle", "progress", "fanout", "metrics", "events", "startup", "webserver", "scheduler", "frame_diff", "wire"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted([*globals(), *__all__])
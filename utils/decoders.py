@@ -0,0 +1,318 @@
+import glob
+import os
+import shutil
+import subprocess
+import cv2
+import numpy as np
+from utils import config, letterbox
+
+try:
+    # Optional: FFmpeg decoding with lowres / skip_loop_filter and scaling in
+    # swscale (pip install av)
+    import av
+except ImportError:
+    av = None
+
+config_data = config.read_toml_file("config.toml")
+# "auto" picks the first available of pyav, v4l2m2m, opencv; or name one
+DECODE_BACKEND = config_data.get("DECODE_BACKEND", "auto")
+# Skip the in-loop deblocking filter (pyav). Its artefacts are far below what
+# survives downscaling to a panel, and it is a large share of H.264 decode time.
+DECODE_SKIP_LOOP_FILTER = bool(config_data.get("DECODE_SKIP_LOOP_FILTER", True))
+# Let codecs with reduced-resolution decoding (MPEG-4 part 2, MJPEG; not
+# H.264) decode at 1/2..1/8 size (pyav). It saves memory bandwidth but the
+# lowres IDCT is not SIMD-optimised, so measure with benchmarks/bench_decode.py.
+DECODE_LOWRES = bool(config_data.get("DECODE_LOWRES", False))
+# Ask OpenCV's FFmpeg backend for whatever hardware decoding it can find.
+# Off by default: hardware decoders may round colours differently, and which
+# one OpenCV finds can change between runs (render_tag keys on this setting).
+DECODE_HW_ACCELERATION = bool(config_data.get("DECODE_HW_ACCELERATION", False))
+FFMPEG_BINARY = config_data.get("FFMPEG_BINARY", "ffmpeg")
+
+# OpenCV FOURCC -> FFmpeg codec name with a *_v4l2m2m decoder
+_V4L2_CODECS = {
+    "avc1": "h264", "h264": "h264", "x264": "h264",
+    "hev1": "hevc", "hvc1": "hevc", "hevc": "hevc",
+    "mp4v": "mpeg4", "fmp4": "mpeg4", "xvid": "mpeg4", "divx": "mpeg4",
+    "vp80": "vp8", "vp90": "vp9",
+}
+
+_ffmpeg_decoders = None
+_backend_cache = {}
+
+
+def output_size(source_width, source_height, target_size):
+    """
+    The size the letterbox step scales the whole source to (fitted for pad,
+    covering for crop modes), or the source size if that would upscale.
+    """
+    new_width, new_height, _, _ = letterbox.for_size(*target_size).geometry(source_width, source_height)
+    if new_width >= source_width or new_height >= source_height:
+        return source_width, source_height
+    return new_width, new_height
+
+
+class OpenCVDecoder:
+    """cv2.VideoCapture, full-resolution decode; hardware accelerated where OpenCV can."""
+
+    name = "opencv"
+
+    def __init__(self, video_path, target_size=None):
+        params = []
+        if DECODE_HW_ACCELERATION and hasattr(cv2, "CAP_PROP_HW_ACCELERATION"):
+            params = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+        self.cap = cv2.VideoCapture(video_path, cv2.CAP_ANY, params)
+        if not self.cap.isOpened():
+            self.cap.release()
+            raise OSError(f"OpenCV cannot open {video_path}")
+
+    def grab(self):
+        return self.cap.grab()
+
+    def seek(self, frame_number):
+        return self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+
+    def read(self):
+        ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def release(self):
+        self.cap.release()
+
+
+class PyAVDecoder:
+    """
+    FFmpeg through PyAV. Uses frame threading, skips the loop filter,
+    optionally asks for lowres output (DECODE_LOWRES), and converts straight
+    to the panel-sized BGR frame in swscale.
+    """
+
+    name = "pyav"
+
+    def __init__(self, video_path, target_size=None):
+        if av is None:
+            raise OSError("PyAV is not installed")
+        self.container = av.open(video_path)
+        try:
+            self.stream = self.container.streams.video[0]
+        except IndexError:
+            self.container.close()
+            raise OSError(f"No video stream in {video_path}")
+        self.stream.thread_type = "AUTO"
+        context = self.stream.codec_context
+        width, height = context.width, context.height
+
+        options = {}
+        if DECODE_SKIP_LOOP_FILTER:
+            options["skip_loop_filter"] = "all"
+        self.size = output_size(width, height, target_size) if target_size else (width, height)
+        lowres = 0
+        while DECODE_LOWRES and lowres < 3 and (width >> (lowres + 1)) >= self.size[0] and (height >> (lowres + 1)) >= self.size[1]:
+            lowres += 1
+        if lowres:
+            # Decoders without lowres support clamp this to 0
+            options["lowres"] = str(lowres)
+        context.options = options
+
+        self.rate = float(self.stream.average_rate or self.stream.guessed_rate or 25)
+        self.time_base = float(self.stream.time_base)
+        self.start = self.stream.start_time or 0
+        self._frames = self.container.decode(self.stream)
+        self._pending = None
+
+    def _next(self):
+        try:
+            return next(self._frames)
+        except (StopIteration, av.error.FFmpegError):
+            return None
+
+    def _frame_number(self, frame):
+        return round((frame.pts - self.start) * self.time_base * self.rate)
+
+    def grab(self):
+        if self._pending is not None:
+            self._pending = None
+            return True
+        return self._next() is not None
+
+    def seek(self, frame_number):
+        # Seek to the keyframe at or before the target, then decode forward
+        pts = self.start + int(frame_number / self.rate / self.time_base)
+        self.container.seek(pts, stream=self.stream, backward=True)
+        self._frames = self.container.decode(self.stream)
+        while True:
+            frame = self._next()
+            if frame is None:
+                self._pending = None
+                return False
+            if frame.pts is not None and self._frame_number(frame) >= frame_number:
+                self._pending = frame
+                return True
+
+    def read(self):
+        frame, self._pending = self._pending or self._next(), None
+        if frame is None:
+            return None
+        return frame.to_ndarray(width=self.size[0], height=self.size[1], format="bgr24")
+
+    def release(self):
+        self.container.close()
+
+
+class FFmpegCLIDecoder:
+    """
+    One ffmpeg process per frame, decoding with `decoder` (eg the V4L2
+    memory-to-memory hardware decoder h264_v4l2m2m) and scaling to the panel
+    size before the frame is copied out. Seeking is by timestamp (-ss before
+    -i, which ffmpeg makes frame accurate), so grab() and seek() are free.
+    """
+
+    name = "v4l2m2m"
+
+    def __init__(self, video_path, target_size=None, decoder=None):
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            cap.release()
+            raise OSError(f"Cannot probe {video_path}")
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.rate = cap.get(cv2.CAP_PROP_FPS) or 25
+        if decoder is None:
+            codec = _V4L2_CODECS.get(_fourcc(cap))
+            decoder = f"{codec}_v4l2m2m" if codec else None
+        cap.release()
+        if decoder is None or decoder not in _available_ffmpeg_decoders():
+            raise OSError(f"ffmpeg has no decoder {decoder} for {video_path}")
+        self.video_path = video_path
+        self.decoder = decoder
+        self.size = output_size(width, height, target_size) if target_size else (width, height)
+        self.position = 0
+
+    def grab(self):
+        self.position += 1
+        return True
+
+    def seek(self, frame_number):
+        self.position = frame_number
+        return True
+
+    def read(self):
+        width, height = self.size
+        command = [FFMPEG_BINARY, "-v", "error", "-c:v", self.decoder,
+                   "-ss", f"{self.position / self.rate:.6f}", "-i", self.video_path,
+                   "-frames:v", "1", "-vf", f"scale={width}:{height}",
+                   "-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+        try:
+            result = subprocess.run(command, capture_output=True, timeout=60)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"[ERROR] ffmpeg decode failed: {e}")
+            return None
+        if result.returncode != 0 or len(result.stdout) < width * height * 3:
+            return None
+        self.position += 1
+        return np.frombuffer(result.stdout, dtype=np.uint8, count=width * height * 3).reshape(height, width, 3)
+
+    def release(self):
+        pass
+
+
+BACKENDS = {"pyav": PyAVDecoder, "v4l2m2m": FFmpegCLIDecoder, "opencv": OpenCVDecoder}
+
+
+def _fourcc(cap):
+    code = int(cap.get(cv2.CAP_PROP_FOURCC))
+    return "".join(chr((code >> (8 * i)) & 0xFF) for i in range(4)).strip("\0 ").lower()
+
+
+def _available_ffmpeg_decoders():
+    global _ffmpeg_decoders
+    if _ffmpeg_decoders is None:
+        _ffmpeg_decoders = set()
+        if shutil.which(FFMPEG_BINARY):
+            try:
+                output = subprocess.run([FFMPEG_BINARY, "-hide_banner", "-decoders"],
+                                        capture_output=True, text=True, timeout=10).stdout
+            except (OSError, subprocess.TimeoutExpired):
+                output = ""
+            for line in output.splitlines():
+                fields = line.split()
+                if len(fields) >= 2 and fields[0].startswith("V"):
+                    _ffmpeg_decoders.add(fields[1])
+    return _ffmpeg_decoders
+
+
+def _has_v4l2_decoder_device():
+    for name_file in glob.glob("/sys/class/video4linux/video*/name"):
+        try:
+            with open(name_file) as f:
+                if "dec" in f.read().lower():
+                    return True
+        except OSError:
+            continue
+    return False
+
+
+def available_backends():
+    """Backend names usable on this machine, in preference order."""
+    names = []
+    if av is not None:
+        names.append("pyav")
+    if _has_v4l2_decoder_device() and any(d.endswith("_v4l2m2m") for d in _available_ffmpeg_decoders()):
+        names.append("v4l2m2m")
+    names.append("opencv")
+    return names
+
+
+def open_decoder(video_path, target_size=None, backend=None):
+    """
+    Open video_path with the configured backend (DECODE_BACKEND), or with
+    the first available one that can handle the file when set to "auto".
+    Frames come out at roughly target_size (panel size) where the backend
+    can scale during decode, otherwise at source size. Returns None if no
+    backend can open the file.
+    """
+    backend = backend or DECODE_BACKEND
+    names = available_backends() if backend == "auto" else [backend]
+    for name in names:
+        try:
+            return BACKENDS[name](video_path, target_size)
+        except (OSError, KeyError) as e:
+            if backend != "auto":
+                print(f"[ERROR] Decode backend {name} unavailable for {video_path}: {e}")
+        except Exception as e:
+            print(f"[WARN] Decode backend {name} failed to open {video_path}: {e}")
+    return None
+
+
+def backend_for(video_path):
+    """Name of the backend open_decoder would use for a file (part of render cache keys)."""
+    if DECODE_BACKEND != "auto":
+        return DECODE_BACKEND
+    names = available_backends()
+    if "v4l2m2m" not in names or names[0] != "v4l2m2m":
+        return names[0]
+    try:
+        mtime = os.path.getmtime(video_path)
+    except OSError:
+        return "opencv"
+    cached = _backend_cache.get(video_path)
+    if cached is None or cached[0] != mtime:
+        cap = cv2.VideoCapture(video_path)
+        codec = _V4L2_CODECS.get(_fourcc(cap))
+        cap.release()
+        name = "v4l2m2m" if codec and f"{codec}_v4l2m2m" in _available_ffmpeg_decoders() else "opencv"
+        cached = _backend_cache[video_path] = (mtime, name)
+    return cached[1]
+
+
+def render_tag(video_path):
+    """
+    backend_for plus the options that change its pixels, so render cache keys
+    change with DECODE_HW_ACCELERATION, DECODE_SKIP_LOOP_FILTER and DECODE_LOWRES.
+    """
+    name = backend_for(video_path)
+    if name == "opencv" and DECODE_HW_ACCELERATION:
+        return "opencv+hw"
+    if name == "pyav":
+        return f"pyav+slf{int(DECODE_SKIP_LOOP_FILTER)}+lowres{int(DECODE_LOWRES)}"
+    return name
@@ -0,0 +1,174 @@
+import os
+import threading
+from utils import config
+
+try:
+    # Optional: event-driven refreshes on Linux (pip install inotify_simple)
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+config_data = config.read_toml_file("config.toml")
+# Seconds between background rescans (a rescan only lists directories whose
+# mtime changed, so it is cheap)
+REFRESH_SECONDS = int(config_data.get("DIR_INDEX_REFRESH_SECONDS", 60))
+# Every Nth rescan also re-stats files in unchanged directories, which catches
+# files rewritten in place (that does not touch the directory mtime)
+FULL_RESCAN_EVERY = int(config_data.get("DIR_INDEX_FULL_RESCAN_EVERY", 10))
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.wmv')
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+class DirectoryIndex:
+    """
+    Incrementally maintained size/listing cache for a directory tree.
+
+    Each directory is remembered with its mtime and its files' (inode, mtime,
+    size). A rescan skips listing directories whose mtime is unchanged, and
+    totals are kept up to date so readers get them in O(1). Rescans run on a
+    background thread, woken by inotify when available, by refresh_soon(), or
+    every REFRESH_SECONDS.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._dirs = {}  # dirpath -> (dir mtime, {name: (inode, mtime, size)}, [subdirs])
+        self._total_bytes = 0
+        self._top_level = []
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._wakeup = threading.Event()
+        self._passes = 0
+        self._restat = False
+        self._watcher = None
+        self._watched = {}
+
+    # -- readers ---------------------------------------------------------
+
+    def total_bytes(self):
+        self._ready.wait()
+        return self._total_bytes
+
+    def size_gb(self):
+        return self.total_bytes() / (1024**3)
+
+    def video_files(self):
+        """Top-level video filenames (what list_video_files returns)."""
+        self._ready.wait()
+        return list(self._top_level)
+
+    # -- maintenance -----------------------------------------------------
+
+    def start(self):
+        threading.Thread(target=self._run, name=f"dir-index:{self.root}", daemon=True).start()
+
+    def refresh_soon(self):
+        self._wakeup.set()
+
+    def refresh(self, restat_files=False):
+        seen = set()
+        dirs = {}
+        stack = [self.root]
+        while stack:
+            dirpath = stack.pop()
+            try:
+                dir_mtime = os.stat(dirpath).st_mtime
+            except OSError:
+                continue
+            seen.add(dirpath)
+            previous = self._dirs.get(dirpath)
+
+            if previous and previous[0] == dir_mtime:
+                files = dict(previous[1])
+                if restat_files:
+                    for name in list(files):
+                        try:
+                            st = os.stat(os.path.join(dirpath, name))
+                            files[name] = (st.st_ino, st.st_mtime, st.st_size)
+                        except FileNotFoundError:
+                            del files[name]
+                subdirs = previous[2]
+            else:
+                files, subdirs = {}, []
+                try:
+                    with os.scandir(dirpath) as entries:
+                        for entry in entries:
+                            try:
+                                if entry.is_dir(follow_symlinks=False):
+                                    subdirs.append(entry.path)
+                                elif entry.is_file():
+                                    st = entry.stat()
+                                    files[entry.name] = (st.st_ino, st.st_mtime, st.st_size)
+                            except FileNotFoundError:
+                                continue
+                except OSError:
+                    continue
+            dirs[dirpath] = (dir_mtime, files, subdirs)
+            stack.extend(subdirs)
+
+        total = sum(size for _, files, _ in dirs.values() for _, _, size in files.values())
+        root_files = dirs.get(self.root, (None, {}, []))[1]
+        top_level = sorted(name for name in root_files if name.lower().endswith(VIDEO_EXTENSIONS))
+        with self._lock:
+            self._dirs = dirs
+            self._total_bytes = total
+            self._top_level = top_level
+        self._ready.set()
+        if self._watcher:
+            self._watch(seen)
+
+    def _run(self):
+        self._start_watcher()
+        while True:
+            self._wakeup.clear()
+            self._passes += 1
+            restat = self._restat or self._passes % FULL_RESCAN_EVERY == 0
+            self._restat = False
+            try:
+                self.refresh(restat_files=restat)
+            except Exception as e:
+                print(f"[ERROR] Directory index refresh failed for {self.root}: {e}")
+                self._ready.set()
+            self._wakeup.wait(REFRESH_SECONDS)
+
+    def _start_watcher(self):
+        if INotify is None:
+            return
+        try:
+            self._watcher = INotify()
+        except OSError:
+            return
+        threading.Thread(target=self._watch_loop, name=f"dir-watch:{self.root}", daemon=True).start()
+
+    def _watch(self, dirpaths):
+        mask = (inotify_flags.CREATE | inotify_flags.DELETE | inotify_flags.MOVED_FROM
+                | inotify_flags.MOVED_TO | inotify_flags.CLOSE_WRITE)
+        for dirpath in dirpaths:
+            if dirpath not in self._watched:
+                try:
+                    self._watched[dirpath] = self._watcher.add_watch(dirpath, mask)
+                except OSError:
+                    pass
+
+    def _watch_loop(self):
+        while True:
+            # Coalesce bursts (eg a large copy) into one rescan
+            if self._watcher.read(read_delay=500):
+                # A file may have been rewritten in place, which the
+                # directory mtime does not reveal
+                self._restat = True
+                self._wakeup.set()
+
+
+def get_index(root):
+    """The shared, self-refreshing index for a directory (started on first use)."""
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = DirectoryIndex(root)
+            _indexes[root] = index
+            index.start()
+    return index
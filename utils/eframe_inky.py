@@ -1,11 +1,11 @@
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFont, PngImagePlugin
 import datetime
+import json
 import os
 import socket
-import qrcode
-from utils import config
-from dotenv import load_dotenv
-from inky.auto import auto
+import threading
+import numpy as np
+from utils import config, metrics, palette
 
 # Resolve project paths (for bundled fonts fallback)
 HERE = os.path.dirname(os.path.abspath(__file__))
@@ -33,34 +33,86 @@ def _load_font(candidates, size):
 # since I'm not writing my code directly on the raspberry pi, I'm using the .env
 # to handle whether or not I want to expose the actual inky hardware
 
-# Load environment variables from .env file
-load_dotenv()
+# Set by detect_panel(). Detection (and importing inky, which is slow) waits
+# until the panel is first needed; the player runs it on a thread at startup
+# (startup.in_background) while it does other startup work.
+use_fake_data = None
+inky = None
+_detect_lock = threading.Lock()
 
-use_fake_data = os.getenv("ENVIRONMENT") == "development"
 
-# Attempt to initialize Inky when not in development mode, but avoid
-# interactive prompts and fail gracefully if detection isn't possible.
-inky = None
-if not use_fake_data:
-    # Allow forcing model/colour via environment, eg: INKY_TYPE=spectra73 INKY_COLOUR=red
-    forced_type = os.getenv("INKY_TYPE")
-    forced_colour = os.getenv("INKY_COLOUR")
-    try:
-        if forced_type or forced_colour:
-            try:
-                inky = auto(ask_user=False, verbose=True, type=forced_type, colour=forced_colour)
-            except TypeError:
-                # Older inky.auto may not accept type/colour kwargs; fall back to plain auto
+def detect_panel():
+    """Detect the Inky board once; later calls (from any thread) wait for and reuse the result."""
+    global use_fake_data, inky
+    with _detect_lock:
+        if use_fake_data is not None:
+            return inky
+        from dotenv import load_dotenv
+
+        # Load environment variables from .env file
+        load_dotenv()
+        use_fake_data = os.getenv("ENVIRONMENT") == "development"
+        if use_fake_data:
+            return None
+
+        # Attempt to initialize Inky, but avoid interactive prompts and fail
+        # gracefully if detection isn't possible.
+        # Allow forcing model/colour via environment, eg: INKY_TYPE=spectra73 INKY_COLOUR=red
+        forced_type = os.getenv("INKY_TYPE")
+        forced_colour = os.getenv("INKY_COLOUR")
+        try:
+            from inky.auto import auto
+
+            if forced_type or forced_colour:
+                try:
+                    inky = auto(ask_user=False, verbose=True, type=forced_type, colour=forced_colour)
+                except TypeError:
+                    # Older inky.auto may not accept type/colour kwargs; fall back to plain auto
+                    inky = auto(ask_user=False, verbose=True)
+            else:
                 inky = auto(ask_user=False, verbose=True)
-        else:
-            inky = auto(ask_user=False, verbose=True)
-    except Exception:
-        print("[WARN] Failed to initialise Inky (auto). If you have a board attached, you can set INKY_TYPE (eg 'spectra73')"
-              " and INKY_COLOUR ('red'|'yellow'|'black') in .env. Falling back to non-hardware mode.")
-        use_fake_data = True
-        inky = None
+        except Exception:
+            print("[WARN] Failed to initialise Inky (auto). If you have a board attached, you can set INKY_TYPE (eg 'spectra73')"
+                  " and INKY_COLOUR ('red'|'yellow'|'black') in .env. Falling back to non-hardware mode.")
+            use_fake_data = True
+            inky = None
+        return inky
+
+
+config_data = config.read_toml_file("config.toml")
+# "driver" hands the image to inky.set_image (PIL quantize + dither on every
+# frame); "lut" quantizes with a cached lookup table and fills the panel
+# buffer directly.
+QUANTIZER = config_data.get("INKY_QUANTIZER", "driver")
+DITHER = config_data.get("INKY_DITHER", "ordered")
+DITHER_STRENGTH = float(config_data.get("INKY_DITHER_STRENGTH", 48))
+PALETTE_CACHE_DIR = config_data.get("PALETTE_CACHE_DIR", "cache")
+# The startup screen without its timestamp, reused while the IP address,
+# active movie and panel size stay the same
+STARTUP_CACHE_PATH = config_data.get("STARTUP_CACHE_PATH", "cache/startup_status.png")
+
+_luts = {}
+
+def _set_image_lut(rgb, saturation):
+    """
+    Fill inky.buf from a cached RGB->palette LUT, given an HxWx3 RGB array.
+    Returns False when the driver is not one we know the native palette
+    order for.
+    """
+    colours, remap = palette.panel_palette(inky, saturation)
+    if colours is None:
+        return False
+    if rgb.shape[1::-1] != (inky.width, inky.height):
+        raise ValueError(f"Image must be ({inky.width}x{inky.height}) pixels!")
+    key = colours.tobytes()
+    if key not in _luts:
+        _luts[key] = palette.load_lut(colours, PALETTE_CACHE_DIR)
+    indices = palette.quantize(rgb, _luts[key], DITHER, DITHER_STRENGTH)
+    inky.buf = palette.to_native_buffer(indices, remap).reshape((inky.rows, inky.cols))
+    return True
 
 def get_inky_resolution():
+    detect_panel()
     # Default to the common Inky Impression 7.3" resolution if hardware is unavailable
     if use_fake_data or inky is None:
         return [800, 480]
@@ -69,19 +121,47 @@ def get_inky_resolution():
         return [width, height]
 
 def show_on_inky(imagepath, saturation=0.5):
+    """Push an image to the panel. Returns True if the panel was refreshed."""
+    detect_panel()
     if use_fake_data or inky is None:
         print("[DEV/NON-HW] Would display image on Inky: skipping hardware update.")
-        return
+        return False
     # Open the image file and load it into a PIL Image
     try:
         image = Image.open(imagepath)
-        inky.set_image(image, saturation=saturation)
-        print("\n frame being displayed on inky")
-        inky.show()
+        with metrics.REFRESH_SECONDS.time():
+            if QUANTIZER != "lut" or not _set_image_lut(np.asarray(image.convert("RGB")), saturation):
+                inky.set_image(image, saturation=saturation)
+            print("\n frame being displayed on inky")
+            inky.show()
+        return True
     except FileNotFoundError:
         print(f"Error: Image file not found at {imagepath}")
     except Exception as e:
         print(f"Error: Unable to open the image. {e}")
+    return False
+
+def show_frame_on_inky(frame, saturation=0.5):
+    """
+    Push a rendered BGR frame (as produced by video_utils) to the panel
+    straight from memory. Returns True if the panel was refreshed.
+    """
+    detect_panel()
+    if use_fake_data or inky is None:
+        print("[DEV/NON-HW] Would display frame on Inky: skipping hardware update.")
+        return False
+    try:
+        # Reversed channel view, no copy; the LUT quantizer reads it as is
+        rgb = frame[..., ::-1]
+        with metrics.REFRESH_SECONDS.time():
+            if QUANTIZER != "lut" or not _set_image_lut(rgb, saturation):
+                inky.set_image(Image.fromarray(np.ascontiguousarray(rgb)), saturation=saturation)
+            print("\n frame being displayed on inky")
+            inky.show()
+        return True
+    except Exception as e:
+        print(f"Error: Unable to display the frame. {e}")
+    return False
 
 def get_local_ip():
     try:
@@ -93,12 +173,20 @@ def get_local_ip():
     except Exception:
         return "Unavailable"
 
-def show_startup_status(movie=None):
-    DEV_MODE = config.read_toml_file("config.toml").get("DEVELOPMENT_MODE", False)
+def _small_font():
+    return _load_font([
+        os.path.join(FONTS_DIR_PRIMARY, "Lato-Regular.ttf"),
+        os.path.join(FONTS_DIR_PRIMARY, "Lato-Light.ttf"),
+        os.path.join(FONTS_DIR_PRIMARY, "Lato-Bold.ttf"),
+        os.path.join(FONTS_DIR_FALLBACK, "AncizarSans-VariableFont_wght.ttf"),
+        os.path.join(FONTS_DIR_FALLBACK, "AncizarSans-Italic-VariableFont_wght.ttf"),
+    ], 24)
 
-    WIDTH = 800
-    HEIGHT = 480
-    image = Image.new("RGB", (WIDTH, HEIGHT), (255, 255, 255))
+def _render_startup_base(width, height, movie_path, url, small_font):
+    """The startup screen without the "Service started" line."""
+    import qrcode
+
+    image = Image.new("RGB", (width, height), (255, 255, 255))
     draw = ImageDraw.Draw(image)
 
     # Prefer Lato from project fonts, then fall back to bundled Ancizar if present
@@ -108,35 +196,70 @@ def show_startup_status(movie=None):
         os.path.join(FONTS_DIR_FALLBACK, "AncizarSans-VariableFont_wght.ttf"),
         os.path.join(FONTS_DIR_FALLBACK, "AncizarSans-Italic-VariableFont_wght.ttf"),
     ], 36)
-    small_font = _load_font([
-        os.path.join(FONTS_DIR_PRIMARY, "Lato-Regular.ttf"),
-        os.path.join(FONTS_DIR_PRIMARY, "Lato-Light.ttf"),
-        os.path.join(FONTS_DIR_PRIMARY, "Lato-Bold.ttf"),
-        os.path.join(FONTS_DIR_FALLBACK, "AncizarSans-VariableFont_wght.ttf"),
-        os.path.join(FONTS_DIR_FALLBACK, "AncizarSans-Italic-VariableFont_wght.ttf"),
-    ], 24)
 
     draw.text((20, 20), "E-Paper Movie Frame", font=title_font, fill=(0, 0, 0))
-    draw.text((20, 80), f"Service started: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", font=small_font, fill=(0, 0, 0))
 
-    if movie:
-        draw.text((20, 140), f"Now playing: {movie['video_path']}", font=small_font, fill=(0, 0, 0))
+    if movie_path:
+        draw.text((20, 140), f"Now playing: {movie_path}", font=small_font, fill=(0, 0, 0))
     else:
         draw.text((20, 140), "No movie is currently active", font=small_font, fill=(0, 0, 0))
 
-    ip = get_local_ip()
-    url = f"http://{ip}:8000" if ip != "Unavailable" else "http://<your-pi-ip>:8000"
     draw.text((20, 200), f"Web UI: {url}", font=small_font, fill=(0, 0, 0))
 
-    if ip != "Unavailable":
+    if "<your-pi-ip>" not in url:
         qr = qrcode.make(url)
         qr = qr.resize((120, 120))
-        image.paste(qr, (WIDTH - 140, HEIGHT - 140))
+        image.paste(qr, (width - 140, height - 140))
+    return image
+
+def _cached_startup_base(key):
+    try:
+        with Image.open(STARTUP_CACHE_PATH) as cached:
+            if cached.text.get("key") == key:
+                return cached.convert("RGB")
+    except (OSError, ValueError, AttributeError):
+        pass
+    return None
+
+def _store_startup_base(image, key):
+    info = PngImagePlugin.PngInfo()
+    info.add_text("key", key)
+    try:
+        os.makedirs(os.path.dirname(STARTUP_CACHE_PATH) or ".", exist_ok=True)
+        tmp_path = f"{STARTUP_CACHE_PATH}.tmp"
+        image.save(tmp_path, format="PNG", pnginfo=info)
+        os.replace(tmp_path, STARTUP_CACHE_PATH)
+    except OSError as e:
+        print(f"[WARN] Could not cache the startup screen: {e}")
+
+def show_startup_status(movie=None):
+    """Render the startup screen; returns its path if it reached the panel, else None."""
+    from utils import webserver
+
+    DEV_MODE = config.read_toml_file("config.toml").get("DEVELOPMENT_MODE", False)
+
+    width, height = get_inky_resolution()
+    movie_path = movie['video_path'] if movie else None
+    ip = get_local_ip()
+    url = f"http://{ip}:{webserver.WEBUI_PORT}" if ip != "Unavailable" else f"http://<your-pi-ip>:{webserver.WEBUI_PORT}"
+    small_font = _small_font()
+
+    # Everything but the timestamp depends only on these
+    key = json.dumps([ip, url, movie_path, width, height])
+    image = _cached_startup_base(key)
+    if image is None:
+        image = _render_startup_base(width, height, movie_path, url, small_font)
+        _store_startup_base(image, key)
+
+    draw = ImageDraw.Draw(image)
+    draw.text((20, 80), f"Service started: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", font=small_font, fill=(0, 0, 0))
 
     image_path = "startup_frame.jpg"
     image.save(image_path)
 
     if not DEV_MODE:
-        show_on_inky(image_path)
+        if show_on_inky(image_path):
+            return image_path
     else:
-        print(f"[DEV_MODE] Skipping e-ink update. Saved {image_path}")
\ No newline at end of file
+        print(f"[DEV_MODE] Skipping e-ink update. Saved {image_path}")
+    return None
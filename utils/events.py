@@ -0,0 +1,144 @@
+import collections
+import itertools
+import json
+import threading
+import time
+from utils import config, metrics
+
+config_data = config.read_toml_file("config.toml")
+# Seconds between SSE comments on an idle stream, so proxies and browsers
+# keep the connection open
+EVENTS_HEARTBEAT_SECONDS = float(config_data.get("EVENTS_HEARTBEAT_SECONDS", 15))
+# Events queued for one slow client before its oldest are dropped
+EVENTS_CLIENT_BACKLOG = int(config_data.get("EVENTS_CLIENT_BACKLOG", 32))
+# Open /events streams at most. Each holds a request thread for as long as
+# its tab is open; the web UI process adds this many threads to
+# WEBUI_THREADS for them, and pages past the cap poll /events/latest instead
+EVENTS_MAX_STREAMS = int(config_data.get("EVENTS_MAX_STREAMS", 4))
+
+# Event kinds published by the player (see docs: Live Updates)
+FRAME = "frame"
+PLAYBACK = "playback"
+QUIET_HOURS = "quiet_hours"
+
+_lock = threading.Lock()
+_ids = itertools.count(1)
+_subscribers = set()
+_latest = {}  # kind -> last event, replayed to new subscribers
+_forward = None
+
+
+class Subscription:
+    """One client's queue. Wakes on publish; drops its oldest events when full."""
+
+    def __init__(self, backlog=EVENTS_CLIENT_BACKLOG):
+        self.condition = threading.Condition()
+        self.queue = collections.deque(maxlen=backlog)
+
+    def put(self, event):
+        with self.condition:
+            self.queue.append(event)
+            self.condition.notify()
+
+    def get(self, timeout):
+        """The next event, or None after timeout seconds without one."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.queue, timeout):
+                return None
+            return self.queue.popleft()
+
+
+def publish(kind, **data):
+    """
+    Send an event to every subscriber in this process, and to the web UI
+    process when it runs separately (see forward_events).
+    """
+    event = dispatch({"event": kind, "data": {**data, "time": time.time()}})
+    if _forward is not None:
+        try:
+            _forward(event)
+        except OSError:
+            pass
+
+
+def dispatch(event):
+    """Deliver an already built event locally; the web UI process calls this for forwarded ones."""
+    with _lock:
+        event = {**event, "id": next(_ids)}
+        _latest[event["event"]] = event
+        subscribers = list(_subscribers)
+    for subscription in subscribers:
+        subscription.put(event)
+    return event
+
+
+def forward_events(send):
+    """Also call send(event) on every publish(), for a web UI in another process."""
+    global _forward
+    _forward = send
+
+
+def encode(event):
+    """An event as one line of JSON, for the player -> web UI channel."""
+    return json.dumps({"event": event["event"], "data": event["data"]}).encode() + b"\n"
+
+
+def sse_format(event):
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+def latest(after=0):
+    """
+    The latest event of each kind newer than id `after`, oldest first: what
+    a page polls when it could not get a stream. With after=0 they are
+    marked "replayed", as a new stream's are.
+    """
+    with _lock:
+        found = sorted((event for event in _latest.values() if event["id"] > after), key=lambda event: event["id"])
+    if not after:
+        found = [{**event, "data": {**event["data"], "replayed": True}} for event in found]
+    return found
+
+
+def subscribe():
+    """A new client's Subscription, or None when EVENTS_MAX_STREAMS are already open."""
+    with _lock:
+        if len(_subscribers) >= EVENTS_MAX_STREAMS:
+            return None
+        subscription = Subscription()
+        _subscribers.add(subscription)
+    return subscription
+
+
+def unsubscribe(subscription):
+    with _lock:
+        _subscribers.discard(subscription)
+
+
+def stream(subscription, heartbeat=EVENTS_HEARTBEAT_SECONDS):
+    """
+    Server-Sent Events text for one subscribed client: the latest event of
+    each kind, then everything published until the client disconnects. All
+    clients share the publisher; none of them touch the database.
+    """
+    with _lock:
+        replay = sorted(_latest.values(), key=lambda event: event["id"])
+    try:
+        yield "retry: 5000\n\n"
+        for event in replay:
+            # Marked so pages can tell old news from a change since they loaded
+            yield sse_format({**event, "data": {**event["data"], "replayed": True}})
+        while True:
+            event = subscription.get(heartbeat)
+            yield ": keepalive\n\n" if event is None else sse_format(event)
+    finally:
+        unsubscribe(subscription)
+
+
+def _collect_metrics():
+    with _lock:
+        count = len(_subscribers)
+    return [("movieframe_event_subscribers", "gauge", "Browsers connected to /events", count)]
+
+
+metrics.register_collector(_collect_metrics)
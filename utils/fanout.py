@@ -0,0 +1,183 @@
+import logging
+import socket
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from utils import config, scheduler, video_utils, wire
+
+config_data = config.read_toml_file("config.toml")
+# Port receivers listen on unless a display names another
+RECEIVER_PORT = int(config_data.get("RECEIVER_PORT", wire.DEFAULT_PORT))
+# Connect/send/acknowledge timeout for one push
+FANOUT_TIMEOUT_SECONDS = float(config_data.get("FANOUT_TIMEOUT_SECONDS", wire.DEFAULT_TIMEOUT_SECONDS))
+# Threads pushing frames to receivers, however many displays there are
+FANOUT_SEND_WORKERS = int(config_data.get("FANOUT_SEND_WORKERS", 4))
+
+# Pause before the next pass after a fan-out tick failed
+RETRY_SECONDS = 60
+
+# Raised for malformed or rejected messages (see utils/wire.py)
+ProtocolError = wire.ProtocolError
+
+logger = logging.getLogger(__name__)
+
+
+def _exchange(host, port, kind, header, payload=b""):
+    with socket.create_connection((host, port), timeout=FANOUT_TIMEOUT_SECONDS) as sock:
+        wire.write_message(sock, kind, header, payload)
+        reply_kind, reply, _ = wire.read_message(sock)
+    if reply_kind != wire.KIND_REPLY:
+        raise ProtocolError(f"Unexpected reply kind {reply_kind!r}")
+    return reply
+
+
+def push_frame(display, jpeg_bytes, frame):
+    """Send one rendered frame to a display's receiver. Raises OSError or ProtocolError."""
+    width, height = display_resolution(display)
+    reply = _exchange(display['host'], display['port'] or RECEIVER_PORT, wire.KIND_FRAME, {
+        "display": display['name'],
+        "movie_id": display['movie_id'],
+        "frame": frame,
+        "width": width,
+        "height": height,
+    }, jpeg_bytes)
+    if not reply.get("ok"):
+        raise ProtocolError(reply.get("error") or "Receiver rejected the frame")
+
+
+def query_receiver(host, port=None):
+    """Ask a receiver for its panel size: {"width": ..., "height": ...}."""
+    return _exchange(host, port or RECEIVER_PORT, wire.KIND_INFO, {})
+
+
+def display_resolution(display):
+    return tuple(int(x) for x in display['resolution'].split(','))
+
+
+class FanoutPlayer:
+    """
+    Plays movies on every row of the Display table from one thread.
+
+    Each tick collects the displays that are due, groups them by movie and
+    decodes each distinct frame once (several displays on the same movie and
+    frame share the decode; different resolutions are letterboxed from the
+    same decoded frame, and repeats are served by the render cache). Pushes
+    run on a small pool of FANOUT_SEND_WORKERS threads, so a slow or offline
+    receiver delays only its own frame, and the number of threads does not
+    grow with the number of displays.
+    """
+
+    def __init__(self):
+        self.sessions = {}  # movie id -> CaptureSession
+        self.sender = ThreadPoolExecutor(max_workers=FANOUT_SEND_WORKERS, thread_name_prefix="fanout-send")
+        self.thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="fanout", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        scheduler.notify_playback_changed()
+        if self.thread:
+            self.thread.join()
+        self.sender.shutdown(wait=True)
+        for session in self.sessions.values():
+            session.release()
+
+    def run(self):
+        from database import get_displays, get_settings
+
+        while not self._stop.is_set():
+            seen = scheduler.generation()
+            displays = [d for d in get_displays() if d['movie_id'] is not None]
+            settings = get_settings()
+            self._release_idle(displays)
+
+            if not displays:
+                scheduler.wait(None, seen)
+                continue
+
+            now = time.time()
+            if video_utils.should_skip_due_to_quiet_hours(settings):
+                scheduler.wait(video_utils.quiet_hours_end(settings).timestamp() - now, seen)
+                continue
+
+            due_times = {d['id']: scheduler.next_due_time(d, now) for d in displays}
+            due = [d for d in displays if due_times[d['id']] <= now]
+            if not due:
+                scheduler.wait(min(due_times.values()) - now, seen)
+                continue
+
+            try:
+                self.tick(due, settings, due_times, now)
+            except Exception:
+                logger.exception("Fan-out tick failed")
+                scheduler.wait(RETRY_SECONDS, seen)
+
+    def _release_idle(self, displays):
+        playing = {d['movie_id'] for d in displays}
+        for movie_id in list(self.sessions):
+            if movie_id not in playing:
+                self.sessions.pop(movie_id).release()
+
+    def tick(self, displays, settings, due_times=None, now=None):
+        """Render, push and advance every display in `displays` (all due now)."""
+        from database import transaction, advance_display_frame, set_display_last_updated
+
+        now = time.time() if now is None else now
+        by_movie = defaultdict(list)
+        for display in displays:
+            by_movie[display['movie_id']].append(display)
+
+        for movie_id, targets in by_movie.items():
+            video_path = f"{settings['VideoRootPath']}/{targets[0]['video_path']}"
+            resolutions = {display_resolution(d) for d in targets}
+            # Let the decoder scale only when every display wants the same size
+            decode_size = next(iter(resolutions)) if len(resolutions) == 1 else None
+            session = self.sessions.setdefault(movie_id, video_utils.CaptureSession())
+            decoded = {}
+
+            # Ascending frame order keeps the shared decoder moving forward
+            def scheduled_frame(display):
+                return display['current_frame'] if display['current_frame'] < display['total_frames'] else 0
+
+            for display in sorted(targets, key=scheduled_frame):
+                current_frame = scheduled_frame(display)
+                decode_frame = video_utils.display_frame_number(movie_id, video_path, current_frame)
+
+                def decode(frame_number=decode_frame):
+                    if frame_number not in decoded:
+                        decoded[frame_number] = session.read(movie_id, video_path, frame_number, decode_size)
+                    return decoded[frame_number]
+
+                data = video_utils.render_frame(video_path, decode_frame, display_resolution(display), decode)
+                if data is None:
+                    logger.error(f"Could not read frame {decode_frame} of {video_path} for display {display['name']}")
+                    self._record_push(display['id'], "Could not read frame")
+                else:
+                    self.sender.submit(self._push, display, data, decode_frame)
+
+                interval = display['time_per_frame'] * 60
+                due = due_times[display['id']] if due_times else now
+                next_frame = video_utils.next_frame_number(current_frame, display['skip_frames'], display['total_frames'])
+                with transaction(immediate=True):
+                    advance_display_frame(display['id'], display['current_frame'], next_frame)
+                    set_display_last_updated(display['id'], scheduler.format_timestamp(
+                        scheduler.schedule_anchor(due, interval, now)))
+
+    def _push(self, display, data, frame):
+        try:
+            push_frame(display, data, frame)
+        except (OSError, ProtocolError) as e:
+            logger.warning(f"Push to display {display['name']} ({display['host']}) failed: {e}")
+            self._record_push(display['id'], str(e))
+        else:
+            self._record_push(display['id'], None, frame)
+
+    def _record_push(self, display_id, error, frame=None):
+        from database import record_display_push
+        record_display_push(display_id, error, frame)
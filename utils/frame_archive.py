@@ -0,0 +1,150 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import numpy as np
+
+# Baked archive layout (little endian):
+#   header: magic, width, height, frame count, index offset, source size, source mtime,
+#           settings digest (see settings_digest)
+#   data:   concatenated display-ready JPEG frames
+#   index:  `count` entries of (frame number, absolute offset, length), sorted by frame
+MAGIC = b"EMFBAKE2"
+HEADER = struct.Struct("<8sIIIQQd20s")
+INDEX_DTYPE = np.dtype([("frame", "<u4"), ("offset", "<u8"), ("length", "<u4")])
+
+_lock = threading.Lock()
+_open_archives = {}  # movie id -> (archive mtime, FrameArchive or None if unreadable)
+
+
+def archive_path(movie_id):
+    return os.path.join(f"static/{movie_id}", "baked.bin")
+
+
+def settings_digest(settings):
+    """Digest of the render settings a frame was baked with (a dict, see video_utils.archive_settings)."""
+    return hashlib.sha1(repr(sorted(settings.items())).encode()).digest()
+
+
+class FrameArchive:
+    """Read-only, memory-mapped view of a baked archive."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, self.width, self.height, count, index_offset, self.source_size, self.source_mtime,
+             self.settings) = HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a baked frame archive of this version; bake it again")
+            # A copy, so the index holds no pointer into the mapping and close() can unmap it
+            self.index = np.frombuffer(self._mmap, dtype=INDEX_DTYPE, count=count, offset=index_offset).copy()
+        except (ValueError, struct.error):
+            self._mmap.close()
+            raise
+
+    def matches(self, video_path, resolution, settings):
+        try:
+            stat = os.stat(video_path)
+        except OSError:
+            return False
+        return ((self.width, self.height) == tuple(resolution)
+                and (self.source_size, self.source_mtime) == (stat.st_size, stat.st_mtime)
+                and self.settings == settings_digest(settings))
+
+    def get(self, frame_number):
+        """The encoded frame as a memoryview into the mapping, or None."""
+        frames = self.index["frame"]
+        i = int(np.searchsorted(frames, frame_number))
+        if i >= len(frames) or frames[i] != frame_number:
+            return None
+        offset = int(self.index["offset"][i])
+        length = int(self.index["length"][i])
+        with self._lock:
+            if self._mmap is None:
+                return None
+            return memoryview(self._mmap)[offset:offset + length]
+
+    def close(self):
+        """Unmap the file. Frames already handed out stay readable; the mapping goes with the last of them."""
+        with self._lock:
+            mapping, self._mmap = self._mmap, None
+        if mapping is not None:
+            try:
+                mapping.close()
+            except BufferError:
+                pass
+
+
+def open_archive(movie_id):
+    """The movie's baked archive, reopened when the file changes; None if absent."""
+    path = archive_path(movie_id)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _lock:
+        cached = _open_archives.get(movie_id)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        if cached and cached[1] is not None:
+            cached[1].close()
+        try:
+            archive = FrameArchive(path)
+        except (OSError, ValueError, struct.error) as e:
+            # Warned once per version of the file, not on every frame
+            print(f"[WARN] Ignoring unreadable baked archive {path}: {e}")
+            archive = None
+        _open_archives[movie_id] = (mtime, archive)
+        return archive
+
+
+def read_frame(movie_id, video_path, resolution, settings, frame_number):
+    """
+    Encoded bytes for a baked frame, or None when there is no archive, it was
+    baked from a different file, at a different resolution or with different
+    render settings, or it lacks the frame.
+    """
+    archive = open_archive(movie_id)
+    if archive is None or not archive.matches(video_path, resolution, settings):
+        return None
+    return archive.get(frame_number)
+
+
+def write_archive(path, width, height, source_size, source_mtime, settings, parts):
+    """
+    Assemble an archive from worker part files.
+
+    `parts` is a list of (part_path, entries) where entries are
+    (frame number, offset within the part, length). Part files are streamed
+    into place and removed. The archive is written to a temporary name and
+    renamed so readers never see a partial file.
+    """
+    entries = [entry for _, part_entries in parts for entry in part_entries]
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(b"\0" * HEADER.size)
+        index = np.zeros(len(entries), dtype=INDEX_DTYPE)
+        i = 0
+        for part_path, part_entries in parts:
+            base = out.tell()
+            with open(part_path, "rb") as part:
+                while True:
+                    block = part.read(1024 * 1024)
+                    if not block:
+                        break
+                    out.write(block)
+            os.remove(part_path)
+            for frame_number, offset, length in part_entries:
+                index[i] = (frame_number, base + offset, length)
+                i += 1
+        index.sort(order="frame")
+        index_offset = out.tell()
+        out.write(index.tobytes())
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, width, height, len(entries), index_offset, source_size, source_mtime,
+                              settings_digest(settings)))
+    os.replace(tmp_path, path)
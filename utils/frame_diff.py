@@ -0,0 +1,42 @@
+import cv2
+import numpy as np
+
+# Size of the luma thumbnail and number of histogram bins in a fingerprint
+THUMB_SIZE = 16
+HIST_BINS = 32
+_THUMB_BYTES = THUMB_SIZE * THUMB_SIZE
+
+
+def fingerprint(image):
+    """
+    Cheap perceptual fingerprint of a BGR (or grayscale) frame: a 16x16 luma
+    thumbnail plus a normalised 32-bin luma histogram, packed into bytes so it
+    can be stored in the database.
+    """
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    thumb = cv2.resize(gray, (THUMB_SIZE, THUMB_SIZE), interpolation=cv2.INTER_AREA)
+    hist = cv2.calcHist([gray], [0], None, [HIST_BINS], [0, 256]).ravel()
+    hist /= max(float(hist.sum()), 1.0)
+    return thumb.astype(np.uint8).tobytes() + hist.astype(np.float32).tobytes()
+
+
+def fingerprint_file(image_path):
+    """Fingerprint an image on disk, decoding the JPEG at 1/8 scale."""
+    gray = cv2.imread(image_path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    return fingerprint(gray) if gray is not None else None
+
+
+def difference(a, b):
+    """
+    0.0 for identical fingerprints up to 1.0 for completely different ones:
+    the larger of the mean thumbnail difference and the histogram distance.
+    """
+    if not a or not b or len(a) != len(b):
+        return 1.0
+    thumb_a = np.frombuffer(a, dtype=np.uint8, count=_THUMB_BYTES).astype(np.int16)
+    thumb_b = np.frombuffer(b, dtype=np.uint8, count=_THUMB_BYTES).astype(np.int16)
+    hist_a = np.frombuffer(a, dtype=np.float32, offset=_THUMB_BYTES)
+    hist_b = np.frombuffer(b, dtype=np.float32, offset=_THUMB_BYTES)
+    thumb_distance = float(np.abs(thumb_a - thumb_b).mean()) / 255.0
+    hist_distance = 0.5 * float(np.abs(hist_a - hist_b).sum())
+    return max(thumb_distance, hist_distance)
@@ -0,0 +1,203 @@
+import os
+from array import array
+from bisect import bisect_right
+import cv2
+
+# Frames per checkpoint. Each chunk's keyframes are committed to SQLite as one
+# row, so an interrupted build resumes from the last committed chunk.
+INDEX_CHUNK_FRAMES = 4096
+
+_keyframe_cache = {}
+
+
+def file_identity(video_path):
+    stat = os.stat(video_path)
+    return stat.st_size, stat.st_mtime
+
+
+def _open_raw(video_path):
+    """Open a capture that reads packets without decoding them."""
+    cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
+    if not cap.isOpened():
+        return None
+    cap.set(cv2.CAP_PROP_FORMAT, -1)
+    return cap
+
+
+def build_index(movie_id, video_path, chunk_frames=INDEX_CHUNK_FRAMES, progress=None):
+    """
+    Scan a video once and record keyframe positions and the exact frame count.
+
+    The scan reads packets in raw mode (no decoding) and commits after every
+    chunk. If an index for the
+    same file already has committed chunks, the scan resumes after them.
+    progress, if given, is called after every chunk with (frames indexed,
+    frames expected from the container header). Returns the exact frame count,
+    or None if the file could not be read.
+    """
+    import database
+
+    try:
+        file_size, file_mtime = file_identity(video_path)
+    except OSError:
+        print(f"[ERROR] Cannot index missing video file: {video_path}")
+        return None
+
+    existing = database.get_movie_index(movie_id)
+    if existing and (existing['file_size'] != file_size or existing['file_mtime'] != file_mtime):
+        existing = None
+    if existing and existing['complete']:
+        return existing['frame_count']
+    if not existing:
+        database.start_movie_index(movie_id, file_size, file_mtime)
+        frames_indexed = 0
+    else:
+        # Resume at the start of the last committed chunk, which may be partial
+        frames_indexed = existing['frames_indexed'] - existing['frames_indexed'] % chunk_frames
+
+    cap = _open_raw(video_path)
+    if cap is None:
+        print(f"[ERROR] Failed to open video file for indexing: {video_path}")
+        return None
+
+    has_keyframe_flag = hasattr(cv2, "CAP_PROP_LRF_HAS_KEY_FRAME")
+    frames_expected = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if frames_indexed:
+        print(f"[INFO] Resuming frame index for movie {movie_id} at frame {frames_indexed}")
+        # Seeking lands on a keyframe, not the checkpoint; packet reads are
+        # cheap so skip forward instead.
+        for _ in range(frames_indexed):
+            if not cap.grab():
+                break
+
+    frame_number = frames_indexed
+    chunk = frames_indexed // chunk_frames
+    keyframes = array('i')
+    try:
+        while cap.grab():
+            if has_keyframe_flag and cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                keyframes.append(frame_number)
+            frame_number += 1
+            if frame_number % chunk_frames == 0:
+                database.save_movie_index_chunk(movie_id, chunk, keyframes.tobytes(), frame_number)
+                chunk += 1
+                keyframes = array('i')
+                if progress:
+                    progress(frame_number, frames_expected)
+    finally:
+        cap.release()
+
+    if frame_number % chunk_frames:
+        database.save_movie_index_chunk(movie_id, chunk, keyframes.tobytes(), frame_number)
+    database.finish_movie_index(movie_id, frame_number)
+    _keyframe_cache.pop(movie_id, None)
+    print(f"[INFO] Indexed movie {movie_id}: {frame_number} frames")
+    return frame_number
+
+
+def build_index_async(movie_id, video_path):
+    """Queue an index build (or resume) as a background ingest job."""
+    import database
+    from utils import ingest
+
+    return ingest.submit("index", movie_id, video_path, database.get_settings())
+
+
+def resume_pending(settings):
+    """Restart index builds that were interrupted (or never started)."""
+    import database
+
+    for movie in database.get_all_movies():
+        index = database.get_movie_index(movie['id'])
+        if not index or not index['complete']:
+            video_path = os.path.join(settings['VideoRootPath'], movie['video_path'])
+            if os.path.exists(video_path):
+                build_index_async(movie['id'], video_path)
+
+
+def _current_index(movie_id, video_path):
+    import database
+
+    index = database.get_movie_index(movie_id)
+    if not index or not index['complete']:
+        return None
+    try:
+        if (index['file_size'], index['file_mtime']) != file_identity(video_path):
+            return None
+    except OSError:
+        return None
+    return index
+
+
+def exact_frame_count(movie_id, video_path):
+    index = _current_index(movie_id, video_path)
+    return index['frame_count'] if index else None
+
+
+def keyframes_for(movie_id, video_path):
+    """Sorted keyframe positions from a complete, up-to-date index, or None."""
+    try:
+        identity = file_identity(video_path)
+    except OSError:
+        return None
+    cached = _keyframe_cache.get(movie_id)
+    if cached and cached[0] == identity:
+        return cached[1]
+
+    index = _current_index(movie_id, video_path)
+    if not index or not index['keyframes']:
+        return None
+    keyframes = array('i')
+    keyframes.frombytes(index['keyframes'])
+    keyframes = keyframes.tolist()
+    _keyframe_cache[movie_id] = (identity, keyframes)
+    return keyframes
+
+
+def keyframe_before(keyframes, frame_number):
+    """The last keyframe at or before frame_number (0 if none)."""
+    i = bisect_right(keyframes, frame_number)
+    return keyframes[i - 1] if i else 0
+
+
+def should_decode_forward(keyframes, position, frame_number):
+    """
+    True when reading sequentially from the decoder position is no more work
+    than seeking: the target is ahead and no keyframe lies between them.
+    """
+    return position <= frame_number and keyframe_before(keyframes, frame_number) <= position
+
+
+def snap_to_keyframe(keyframes, frame_number, window):
+    """
+    Prefer a keyframe within `window` frames after frame_number; those decode
+    without any reference frames. Returns frame_number when there is none.
+    """
+    if not keyframes or window <= 0:
+        return frame_number
+    i = bisect_right(keyframes, frame_number - 1)
+    if i < len(keyframes) and keyframes[i] - frame_number <= window:
+        return keyframes[i]
+    return frame_number
+
+
+def split_by_gop(frames, keyframes, parts):
+    """
+    Split sorted frames into at most `parts` contiguous ranges. With a
+    keyframe index each cut is moved forward to the first frame of a new GOP
+    so no two workers decode the same GOP.
+    """
+    if parts <= 1 or len(frames) <= 1:
+        return [frames]
+    size = -(-len(frames) // parts)
+    cuts = [0]
+    for target in range(size, len(frames), size):
+        cut = max(target, cuts[-1] + 1)
+        if keyframes:
+            while cut < len(frames) and cut - target < size and \
+                    keyframe_before(keyframes, frames[cut]) <= frames[cut - 1]:
+                cut += 1
+        if cut < len(frames) and cut > cuts[-1]:
+            cuts.append(cut)
+    cuts.append(len(frames))
+    return [frames[a:b] for a, b in zip(cuts, cuts[1:]) if a < b]
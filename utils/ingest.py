@@ -0,0 +1,153 @@
+import itertools
+import os
+import queue
+import threading
+import time
+from utils import config, frame_index, video_utils
+
+config_data = config.read_toml_file("config.toml")
+# Jobs processed at once; each one decodes video, so keep this small on a Pi
+INGEST_WORKERS = int(config_data.get("INGEST_WORKERS", 1))
+# Niceness added to ingest threads (Linux) so the player loop keeps the CPU
+INGEST_NICE = int(config_data.get("INGEST_NICE", 10))
+# Build the keyframe index as part of ingesting a new movie
+INGEST_BUILD_INDEX = bool(config_data.get("INGEST_BUILD_INDEX", True))
+# Finished jobs kept for the status endpoint
+MAX_FINISHED_JOBS = 50
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_queue = queue.Queue()
+_ids = itertools.count(1)
+_workers_started = False
+
+
+class IngestJob:
+    """One queued unit of background work on a movie, with its progress."""
+
+    def __init__(self, kind, movie_id, video_path, settings):
+        self.id = next(_ids)
+        self.kind = kind
+        self.movie_id = movie_id
+        self.video_path = video_path
+        self.settings = dict(settings)
+        self.status = "queued"
+        self.stage = None
+        self.progress = 0.0
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "movie_id": self.movie_id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def submit(kind, movie_id, video_path, settings):
+    """
+    Queue a job and return it. kind is "ingest" (probe the file and count
+    frames, render the current frame, build the index), "render" (re-render the current
+    frame) or "index". An identical job that has not finished is returned
+    instead of queueing a duplicate; for renders only a queued one, since a
+    running render may already have read the movie's old settings.
+    """
+    _start_workers()
+    pending = ("queued",) if kind == "render" else ("queued", "running")
+    with _jobs_lock:
+        for job in _jobs.values():
+            if job.kind == kind and job.movie_id == movie_id and job.status in pending:
+                return job
+        job = IngestJob(kind, movie_id, video_path, settings)
+        _jobs[job.id] = job
+        _prune_finished()
+    _queue.put(job)
+    return job
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def list_jobs(movie_id=None):
+    with _jobs_lock:
+        return [job for job in _jobs.values() if movie_id is None or job.movie_id == movie_id]
+
+
+def _prune_finished():
+    finished = sorted((job for job in _jobs.values() if job.finished_at), key=lambda job: job.finished_at)
+    for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job.id]
+
+
+def _start_workers():
+    global _workers_started
+    with _jobs_lock:
+        if _workers_started:
+            return
+        _workers_started = True
+    for n in range(max(1, INGEST_WORKERS)):
+        threading.Thread(target=_worker, name=f"ingest-{n}", daemon=True).start()
+
+
+def _worker():
+    if INGEST_NICE and hasattr(os, "setpriority") and hasattr(threading, "get_native_id"):
+        try:
+            # On Linux niceness is per thread, so this only slows ingest down
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), INGEST_NICE)
+        except OSError:
+            pass
+    while True:
+        job = _queue.get()
+        job.status = "running"
+        try:
+            _run(job)
+            job.status = "done"
+            job.progress = 1.0
+        except Exception as e:
+            print(f"[ERROR] Ingest job {job.id} ({job.kind}) for movie {job.movie_id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        job.finished_at = time.time()
+        job.stage = None
+
+
+def _run(job):
+    import database
+
+    if job.kind in ("ingest", "render"):
+        if job.kind == "ingest":
+            job.stage = "probing"
+            total_frames = video_utils.get_total_frames(job.video_path)
+            if not total_frames:
+                raise ValueError(f"cannot read frames from {job.video_path}")
+            database.set_total_frames(job.movie_id, total_frames)
+
+        job.stage = "rendering frame"
+        job.progress = 0.2 if job.kind == "ingest" else 0.5
+        movie = database.get_movie_by_id(job.movie_id)
+        if movie is None:
+            raise ValueError("movie was deleted")
+        if not video_utils.process_video(movie, job.settings):
+            raise ValueError(f"cannot render frame {movie['current_frame']}")
+
+        if job.kind == "render" or not INGEST_BUILD_INDEX:
+            return
+
+    job.stage = "indexing"
+    start = job.progress
+
+    def report(frames_done, frames_expected):
+        if frames_expected:
+            job.progress = start + (1.0 - start) * min(1.0, frames_done / frames_expected)
+
+    frame_index.build_index(job.movie_id, job.video_path, progress=report)
@@ -0,0 +1,161 @@
+import threading
+import cv2
+import numpy as np
+from utils import config
+
+config_data = config.read_toml_file("config.toml")
+# "pad" fits the whole frame with black bars, "crop" fills the panel and cuts
+# the centre out, "smart" fills the panel and keeps the busiest region
+LETTERBOX_MODE = config_data.get("LETTERBOX_MODE", "pad")
+# Downscaling: "fast" halves the frame while it is at least twice the target
+# (an exact 2x bilinear resize averages each 2x2 block, so this is a box
+# filter) and interpolates the remaining <2x linearly; "area" uses INTER_AREA
+# in one step (best quality, slowest for large non-integer ratios); "linear"
+# is one bilinear resize (cheapest, but aliases fine detail beyond 2x)
+LETTERBOX_INTERPOLATION = config_data.get("LETTERBOX_INTERPOLATION", "fast")
+
+# Width of the thumbnail smart crop scores edge energy on
+_SMART_CROP_THUMB = 64
+
+_local = threading.local()
+
+
+class Letterbox:
+    """
+    Fits frames to a fixed target size into a reused output buffer.
+
+    The geometry (scaled size, source crop, destination rectangle) is
+    computed once per source size. Each frame is resized straight into the
+    destination region of a preallocated canvas; the black bars are only
+    cleared when the geometry changes. apply() returns that canvas, so its
+    contents are only valid until the next call.
+    """
+
+    def __init__(self, width, height, mode=None, interpolation=None):
+        self.width = width
+        self.height = height
+        self.mode = mode or LETTERBOX_MODE
+        self.interpolation = interpolation or LETTERBOX_INTERPOLATION
+        self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        self._geometry = {}
+        self._last_geometry = None
+
+    def geometry(self, source_width, source_height):
+        """
+        (scaled width, scaled height, x offset, y offset): the size the whole
+        source is resized to and where its top-left lands on the canvas.
+        Negative offsets mean that side is cropped.
+        """
+        key = (source_width, source_height)
+        cached = self._geometry.get(key)
+        if cached is None:
+            source_aspect = source_width / source_height
+            wider = source_aspect > self.width / self.height
+            if self.mode == "pad":
+                # Match the target on the axis that limits the fit
+                if wider:
+                    new_width, new_height = self.width, max(1, int(self.width / source_aspect))
+                else:
+                    new_width, new_height = max(1, int(self.height * source_aspect)), self.height
+            else:
+                # Cover the target and overhang on the other axis
+                if wider:
+                    new_width, new_height = max(self.width, round(self.height * source_aspect)), self.height
+                else:
+                    new_width, new_height = self.width, max(self.height, round(self.width / source_aspect))
+            cached = (new_width, new_height, (self.width - new_width) // 2, (self.height - new_height) // 2)
+            self._geometry[key] = cached
+        return cached
+
+    def apply(self, image):
+        source_height, source_width = image.shape[:2]
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        geometry = self.geometry(source_width, source_height)
+        new_width, new_height, x_offset, y_offset = geometry
+
+        if self.mode == "pad":
+            if geometry != self._last_geometry:
+                self.canvas[:] = 0
+                self._last_geometry = geometry
+            roi = self.canvas[y_offset:y_offset + new_height, x_offset:x_offset + new_width]
+            self._resize_into(image, roi)
+            return self.canvas
+
+        # Crop modes: choose the source window that maps onto the panel, then
+        # resize only that window
+        crop_width = min(source_width, round(self.width * source_width / new_width))
+        crop_height = min(source_height, round(self.height * source_height / new_height))
+        if self.interpolation == "fast":
+            # Halve the whole frame rather than the window: a crop window is
+            # not contiguous, which makes every halving slower
+            while crop_width >= 2 * self.width and crop_height >= 2 * self.height:
+                image = _halve(image)
+                source_height, source_width = image.shape[:2]
+                crop_width, crop_height = crop_width // 2, crop_height // 2
+        if self.mode == "smart":
+            x, y = smart_crop_origin(image, crop_width, crop_height)
+        else:
+            x, y = (source_width - crop_width) // 2, (source_height - crop_height) // 2
+        self._resize_into(image[y:y + crop_height, x:x + crop_width], self.canvas)
+        return self.canvas
+
+    def _resize_into(self, image, dst):
+        height, width = dst.shape[:2]
+        if image.shape[1] == width and image.shape[0] == height:
+            dst[:] = image
+            return
+        if self.interpolation == "fast":
+            while image.shape[1] >= 2 * width and image.shape[0] >= 2 * height:
+                image = _halve(image)
+            interpolation = cv2.INTER_LINEAR
+        elif self.interpolation == "area":
+            downscale = image.shape[1] > width or image.shape[0] > height
+            interpolation = cv2.INTER_AREA if downscale else cv2.INTER_LINEAR
+        else:
+            interpolation = cv2.INTER_LINEAR
+        cv2.resize(image, (width, height), dst=dst, interpolation=interpolation)
+
+
+def _halve(image):
+    # Bilinear at exactly half samples between pixel centres: each output
+    # pixel is the mean of a 2x2 block, at a fraction of INTER_AREA's cost
+    return cv2.resize(image, (image.shape[1] // 2, image.shape[0] // 2), interpolation=cv2.INTER_LINEAR)
+
+
+def smart_crop_origin(image, crop_width, crop_height):
+    """
+    Top-left corner of the crop_width x crop_height window with the most edge
+    energy, searched along the one axis that is being cropped on a small
+    grayscale thumbnail.
+    """
+    source_height, source_width = image.shape[:2]
+    scale = _SMART_CROP_THUMB / max(source_width, source_height)
+    # Subsample to ~4x the thumbnail first; INTER_AREA over a whole frame at a
+    # non-integer ratio would cost more than the crop itself
+    step = max(1, max(source_width, source_height) // (_SMART_CROP_THUMB * 4))
+    thumb = cv2.resize(image[::step, ::step], (max(1, round(source_width * scale)), max(1, round(source_height * scale))),
+                       interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY) if thumb.ndim == 3 else thumb
+    energy = np.abs(cv2.Sobel(gray, cv2.CV_32F, 1, 0)) + np.abs(cv2.Sobel(gray, cv2.CV_32F, 0, 1))
+
+    def best_start(profile, window, limit):
+        window = max(1, min(len(profile), round(window * scale)))
+        sums = np.convolve(profile, np.ones(window, dtype=np.float32), mode="valid")
+        return min(limit, round(int(np.argmax(sums)) / scale))
+
+    x = best_start(energy.sum(axis=0), crop_width, source_width - crop_width) if crop_width < source_width else 0
+    y = best_start(energy.sum(axis=1), crop_height, source_height - crop_height) if crop_height < source_height else 0
+    return x, y
+
+
+def for_size(width, height, mode=None):
+    """This thread's reusable Letterbox for a target size and mode."""
+    engines = getattr(_local, "engines", None)
+    if engines is None:
+        engines = _local.engines = {}
+    key = (width, height, mode or LETTERBOX_MODE)
+    engine = engines.get(key)
+    if engine is None:
+        engine = engines[key] = Letterbox(width, height, key[2])
+    return engine
@@ -0,0 +1,250 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from utils import config
+
+config_data = config.read_toml_file("config.toml")
+# Collect timings and counters for /metrics. When off, the hooks below hand
+# back the undecorated functions and a shared no-op timer.
+METRICS_ENABLED = bool(config_data.get("METRICS_ENABLED", True))
+# Where the player publishes its metrics, and how often, when the web UI runs
+# in its own process (see combined_snapshot)
+METRICS_EXPORT_PATH = config_data.get("METRICS_EXPORT_PATH", "cache/metrics-player.json")
+METRICS_EXPORT_SECONDS = float(config_data.get("METRICS_EXPORT_SECONDS", 15))
+
+# Upper bounds in seconds: sub-millisecond DB queries up to e-ink refreshes
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = {}
+_collectors = []
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = self._values or {(): 0}
+            return [{"labels": dict(key), "value": value} for key, value in values.items()]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}  # label key -> [per-bucket counts + overflow, sum]
+
+    def observe(self, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            value = self._values.get(key)
+            if value is None:
+                value = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            value[0][index] += 1
+            value[1] += seconds
+
+    def time(self, **labels):
+        """Context manager observing the time spent inside it."""
+        return _Timer(self, labels) if METRICS_ENABLED else _NULL_TIMER
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        if not items:
+            # Export zeros until the first observation, as Prometheus expects
+            items = [((), [0] * (len(self.buckets) + 1), 0.0)]
+        samples = []
+        for key, counts, total in items:
+            cumulative, running = [], 0
+            for count in counts:
+                running += count
+                cumulative.append(running)
+            samples.append({
+                "labels": dict(key),
+                "buckets": dict(zip([*map(str, self.buckets), "+Inf"], cumulative)),
+                "count": running,
+                "sum": total,
+            })
+        return samples
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def counter(name, help_text):
+    return _registry.setdefault(name, Counter(name, help_text))
+
+
+def histogram(name, help_text, buckets=DEFAULT_BUCKETS):
+    return _registry.setdefault(name, Histogram(name, help_text, buckets))
+
+
+def register_collector(collect):
+    """
+    Add a callable run at scrape time that returns extra metrics as
+    (name, kind, help, value) tuples, for numbers another module already
+    keeps (eg render cache counters).
+    """
+    _collectors.append(collect)
+
+
+def timed(histogram, **labels):
+    """Decorator observing each call's duration; returns fn unchanged when metrics are off."""
+    def decorate(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, **labels)
+        return wrapper
+    return decorate
+
+
+def instrument_functions(namespace, histogram, names):
+    """Wrap the named functions in a module namespace with timed(), labelled by function name."""
+    if not METRICS_ENABLED:
+        return
+    for name in names:
+        namespace[name] = timed(histogram, function=name)(namespace[name])
+
+
+def snapshot():
+    """Every metric as {name: {"type", "help", "samples"}}."""
+    result = {}
+    for metric in list(_registry.values()):
+        result[metric.name] = {"type": metric.kind, "help": metric.help, "samples": metric.samples()}
+    for collect in _collectors:
+        for name, kind, help_text, value in collect():
+            result[name] = {"type": kind, "help": help_text, "samples": [{"labels": {}, "value": value}]}
+    return result
+
+
+def start_export(path=METRICS_EXPORT_PATH, interval=METRICS_EXPORT_SECONDS):
+    """Write snapshot() to path every interval seconds from a daemon thread."""
+    if not METRICS_ENABLED:
+        return
+
+    def export():
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        while True:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot(), f)
+            os.replace(tmp_path, path)
+            time.sleep(interval)
+
+    threading.Thread(target=export, name="metrics-export", daemon=True).start()
+
+
+def combined_snapshot(path=METRICS_EXPORT_PATH, interval=METRICS_EXPORT_SECONDS):
+    """
+    snapshot() merged with the player's export when that is fresh (written
+    by another process within three intervals). Samples are then labelled
+    process="player" or process="webui".
+    """
+    own = snapshot()
+    try:
+        if time.time() - os.path.getmtime(path) > 3 * interval:
+            return own
+        with open(path) as f:
+            exported = json.load(f)
+    except (OSError, ValueError):
+        return own
+
+    merged = {}
+    for process, metrics in (("player", exported), ("webui", own)):
+        for name, metric in metrics.items():
+            entry = merged.setdefault(name, {"type": metric["type"], "help": metric["help"], "samples": []})
+            entry["samples"] += [{**sample, "labels": {**sample["labels"], "process": process}}
+                                 for sample in metric["samples"]]
+    return merged
+
+
+def _label_text(labels, extra=()):
+    pairs = [*labels.items(), *extra]
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def prometheus_text(metrics=None):
+    """A snapshot (default snapshot()) in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for name, metric in (metrics or snapshot()).items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for sample in metric["samples"]:
+            labels = sample["labels"]
+            if metric["type"] == "histogram":
+                for bound, count in sample["buckets"].items():
+                    lines.append(f"{name}_bucket{_label_text(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_sum{_label_text(labels)} {sample['sum']}")
+                lines.append(f"{name}_count{_label_text(labels)} {sample['count']}")
+            else:
+                lines.append(f"{name}{_label_text(labels)} {sample['value']}")
+    return "\n".join(lines) + "\n"
+
+
+# Render pipeline metrics, shared by the modules that record them
+DECODE_SECONDS = histogram("movieframe_decode_seconds", "Time to seek to and decode one frame")
+RESIZE_SECONDS = histogram("movieframe_resize_seconds", "Time to letterbox one frame to the panel size")
+ENCODE_SECONDS = histogram("movieframe_encode_seconds", "Time to JPEG-encode one rendered frame")
+REFRESH_SECONDS = histogram("movieframe_refresh_seconds", "Time to push one image to the e-ink panel")
+DB_QUERY_SECONDS = histogram("movieframe_db_query_seconds", "Time spent in database.py helpers, by function")
+PLAY_VIDEO_SECONDS = histogram("movieframe_play_video_seconds", "Time for one play_video tick")
+PROCESS_VIDEO_SECONDS = histogram("movieframe_process_video_seconds", "Time for one process_video call")
+FRAMES_DISPLAYED = counter("movieframe_frames_displayed_total", "Frames the player showed or deliberately left on the panel")
+REFRESHES_SKIPPED = counter("movieframe_refreshes_skipped_total", "Panel refreshes skipped because the frame looked unchanged")
+QUIET_HOURS_SKIPS = counter("movieframe_quiet_hours_skips_total", "Times playback was held back by quiet hours")
+DECODE_FAILURES = counter("movieframe_decode_failures_total", "Frames that could not be decoded")
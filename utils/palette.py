@@ -0,0 +1,107 @@
+import functools
+import hashlib
+import os
+import numpy as np
+
+# Inky drivers whose buffer we can fill directly: number of palette colours
+# used for quantization, and the remap from palette order to the panel's
+# native colour index (None means the order already matches).
+SUPPORTED_PANELS = {
+    "inky.inky_ac073tc1a": (7, None),        # Impression 7.3" (7 colour)
+    "inky.inky_uc8159": (7, None),           # Impression 5.7"/4" (7 colour)
+    "inky.inky_e673": (6, [0, 1, 2, 3, 5, 6]),     # Impression 7.3" Spectra 6
+    "inky.inky_e640": (6, [0, 1, 2, 3, 5, 6]),     # Impression 4" Spectra 6
+    "inky.inky_el133uf1": (6, [0, 1, 2, 3, 5, 6]),  # Impression 13.3" Spectra 6
+}
+
+# Bits kept per channel when indexing the lookup table (6 -> 64^3 = 256 KB)
+LUT_BITS = 6
+
+# 8x8 Bayer matrix, normalised to [-0.5, 0.5)
+_BAYER_8 = np.array([
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21],
+], dtype=np.float32) / 64.0 - 0.5
+
+
+def panel_palette(display, saturation=0.5):
+    """
+    The RGB palette (n x 3 uint8) the driver would quantize against, and the
+    native index remap, or (None, None) for unsupported drivers.
+    """
+    panel = SUPPORTED_PANELS.get(type(display).__module__)
+    if panel is None:
+        return None, None
+    colours, remap = panel
+    blended = display._palette_blend(saturation)
+    palette = np.array(blended[:colours * 3], dtype=np.uint8).reshape(colours, 3)
+    return palette, (np.array(remap, dtype=np.uint8) if remap else None)
+
+
+def build_lut(palette, bits=LUT_BITS):
+    """3D table mapping quantized RGB to the nearest palette index."""
+    levels = 1 << bits
+    # Centre of each bucket in 0..255
+    axis = (np.arange(levels, dtype=np.float32) + 0.5) * (256.0 / levels)
+    r, g, b = np.meshgrid(axis, axis, axis, indexing="ij")
+    grid = np.stack([r, g, b], axis=-1).reshape(-1, 1, 3)
+    distances = ((grid - palette.astype(np.float32).reshape(1, -1, 3)) ** 2).sum(axis=2)
+    return distances.argmin(axis=1).astype(np.uint8).reshape(levels, levels, levels)
+
+
+def load_lut(palette, cache_dir, bits=LUT_BITS):
+    """Build the LUT for a palette once and reuse it from disk afterwards."""
+    key = hashlib.sha1(palette.tobytes() + bytes([bits])).hexdigest()[:16]
+    path = os.path.join(cache_dir, f"palette_lut_{key}.npy")
+    try:
+        lut = np.load(path)
+        if lut.shape == (1 << bits,) * 3:
+            return lut
+    except (OSError, ValueError):
+        pass
+    lut = build_lut(palette, bits)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp.npy"
+        np.save(tmp_path, lut)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[WARN] Could not cache palette LUT at {path}: {e}")
+    return lut
+
+
+@functools.lru_cache(maxsize=4)
+def _threshold(height, width, strength):
+    """Bayer offsets tiled to the frame size (cached; frames rarely change size)."""
+    tiled = np.tile(_BAYER_8, (height // 8 + 1, width // 8 + 1))[:height, :width]
+    return np.rint(tiled * strength).astype(np.int16)
+
+
+def quantize(rgb, lut, dither="ordered", strength=48.0, bits=LUT_BITS):
+    """
+    Map an HxWx3 uint8 RGB array to palette indices with one table lookup
+    per pixel. `dither` is "ordered" (8x8 Bayer threshold added before the
+    lookup, fully vectorized and deterministic) or "none".
+    """
+    shift = 8 - bits
+    if dither == "ordered":
+        work = rgb.astype(np.int16)
+        work += _threshold(rgb.shape[0], rgb.shape[1], strength)[..., None]
+        np.clip(work, 0, 255, out=work)
+        indices = work.astype(np.uint8) >> shift
+    else:
+        indices = rgb >> shift
+    flat = indices[..., 0].astype(np.int32) << (2 * bits)
+    flat |= indices[..., 1].astype(np.int32) << bits
+    flat |= indices[..., 2]
+    return np.take(lut.reshape(-1), flat)
+
+
+def to_native_buffer(indices, remap):
+    return remap[indices] if remap is not None else indices
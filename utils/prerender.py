@@ -0,0 +1,222 @@
+import os
+import shutil
+import threading
+from utils import video_utils, frame_archive
+
+# How many upcoming frames to keep rendered ahead of current_frame (0 disables)
+PRERENDER_DEPTH = int(video_utils.config_data.get("PRERENDER_DEPTH", 8))
+# Upper bound on the on-disk size of each movie's ring buffer
+PRERENDER_MAX_MB = float(video_utils.config_data.get("PRERENDER_MAX_MB", 64))
+
+# Set whenever the schedule changes so the worker re-plans straight away
+_wakeup = threading.Event()
+
+
+def ring_root(movie_id):
+    return os.path.join(f"static/{movie_id}", "prerender")
+
+
+def ring_dir(movie_id, resolution):
+    # Resolution is part of the path so a resolution change can never serve
+    # a frame rendered for the old panel size.
+    return os.path.join(ring_root(movie_id), f"{resolution[0]}x{resolution[1]}")
+
+
+def _ring_entries(directory):
+    """Return {frame_number: (path, size)} for completed frames in a ring dir."""
+    entries = {}
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return entries
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        if ext != ".jpg" or not stem.isdigit():
+            continue
+        path = os.path.join(directory, name)
+        try:
+            entries[int(stem)] = (path, os.path.getsize(path))
+        except FileNotFoundError:
+            continue
+    return entries
+
+
+def notify():
+    """Wake the worker so it tops the buffer back up."""
+    _wakeup.set()
+
+
+def invalidate(movie_id):
+    """Drop every pre-rendered frame for a movie and wake the worker."""
+    shutil.rmtree(ring_root(movie_id), ignore_errors=True)
+    _wakeup.set()
+
+
+def upcoming_frames(movie, depth, stop_at_end=False):
+    """
+    The next `depth` frames play_video will show, starting at current_frame.
+    With stop_at_end the list ends with the last frame of the current pass
+    (a playlist moves on to its next title there).
+    """
+    total_frames = movie['total_frames']
+    frame = movie['current_frame']
+    if frame >= total_frames:
+        frame = 0
+    frames = []
+    seed = None
+    for _ in range(min(depth, total_frames)):
+        if frame in frames:
+            break
+        frames.append(frame)
+        if stop_at_end and video_utils.is_last_frame(movie, frame):
+            break
+        frame, seed = video_utils.next_movie_frame(movie, frame, seed)
+    return frames
+
+
+def pop_ready_frame(movie_id, resolution, frame_number):
+    """
+    Return the path of a pre-rendered frame if one is ready, else None.
+
+    The caller takes ownership of the file (it is expected to read and
+    remove it).
+    """
+    path = os.path.join(ring_dir(movie_id, resolution), f"{frame_number}.jpg")
+    return path if os.path.isfile(path) else None
+
+
+class PrerenderWorker:
+    """
+    Background thread that keeps the active movie's next frames rendered.
+
+    Frames are decoded, letterboxed and JPEG-encoded into
+    static/<movie_id>/prerender/<WxH>/<frame>.jpg so play_video only has to
+    move a finished file into place. The buffer is bounded by both
+    PRERENDER_DEPTH frames and PRERENDER_MAX_MB bytes. When a playlist title
+    is within PRERENDER_DEPTH frames of its end, the rest of the buffer holds
+    the next title's first frames, decoded with a second decoder that is
+    kept open once that title starts.
+    """
+
+    def __init__(self, depth=PRERENDER_DEPTH, max_mb=PRERENDER_MAX_MB, idle_seconds=30):
+        self.depth = depth
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.idle_seconds = idle_seconds
+        self.session = video_utils.CaptureSession()
+        self.next_session = video_utils.CaptureSession()  # the next playlist title
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.depth <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="prerender", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        _wakeup.set()
+        if self._thread:
+            self._thread.join()
+        self.session.release()
+        self.next_session.release()
+
+    def _run(self):
+        while not self._stop.is_set():
+            _wakeup.clear()
+            try:
+                self.fill()
+            except Exception as e:
+                print(f"[ERROR] Pre-render pass failed: {e}")
+                self.session.release()
+                self.next_session.release()
+            _wakeup.wait(self.idle_seconds)
+
+    def fill(self):
+        from database import get_active_movie, get_next_playlist_title, get_settings
+
+        movie = get_active_movie()
+        settings = get_settings()
+        if not movie or not settings:
+            self.session.release()
+            self.next_session.release()
+            return
+
+        resolution = [int(x) for x in settings['Resolution'].split(',')]
+        next_title = get_next_playlist_title()
+        wanted = upcoming_frames(movie, self.depth, stop_at_end=next_title is not None)
+        upcoming = []
+        if next_title and len(wanted) < self.depth:
+            upcoming = upcoming_frames(next_title, self.depth - len(wanted))
+
+        if self.next_session.key and self.next_session.key[0] == movie['id']:
+            # The title prefetched for just started: its decoder is already open
+            self.session, self.next_session = self.next_session, self.session
+        if upcoming and next_title['id'] == movie['id']:
+            # The playlist plays this movie again
+            wanted += [frame_number for frame_number in upcoming if frame_number not in wanted]
+            upcoming = []
+
+        if not self._fill_ring(movie, wanted, resolution, settings, self.session):
+            return
+        if upcoming:
+            self._fill_ring(next_title, upcoming, resolution, settings, self.next_session)
+        else:
+            self.next_session.release()
+
+    def _fill_ring(self, movie, wanted, resolution, settings, session):
+        """Render the missing frames of `wanted` into the movie's ring. Returns False when interrupted."""
+        movie_id = movie['id']
+        video_path = os.path.join(settings['VideoRootPath'], movie['video_path'])
+        directory = ring_dir(movie_id, resolution)
+
+        self._prune(movie_id, directory, set(wanted))
+        entries = _ring_entries(directory)
+        used_bytes = sum(size for _, size in entries.values())
+
+        os.makedirs(directory, exist_ok=True)
+        baked_settings = video_utils.archive_settings(movie_id, video_path)
+        missing = [frame_number for frame_number in wanted if frame_number not in entries
+                   and frame_archive.read_frame(movie_id, video_path, resolution, baked_settings, frame_number) is None]
+        # Render the soonest missing frames, in file order: in random order
+        # this lets the decoder read forward instead of seeking when two of
+        # them share a GOP
+        for frame_number in sorted(missing[:max(0, len(wanted) - len(entries))]):
+            if self._stop.is_set() or _wakeup.is_set():
+                return False
+            if used_bytes >= self.max_bytes:
+                break
+
+            decode_frame = video_utils.display_frame_number(movie_id, video_path, frame_number)
+            # The ring file is the only copy written; a render cache hit is still used
+            data = video_utils.render_frame(video_path, decode_frame, resolution,
+                                            lambda: session.read(movie_id, video_path, decode_frame, resolution),
+                                            store=False)
+            if data is None:
+                print(f"[WARN] Pre-render could not read frame {frame_number} from {video_path}")
+                break
+
+            path = os.path.join(directory, f"{frame_number}.jpg")
+            tmp_path = os.path.join(directory, f".{frame_number}.jpg")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+            size = os.path.getsize(path)
+            entries[frame_number] = (path, size)
+            used_bytes += size
+        return True
+
+    def _prune(self, movie_id, directory, wanted):
+        root = ring_root(movie_id)
+        if os.path.isdir(root):
+            for name in os.listdir(root):
+                path = os.path.join(root, name)
+                if path != directory:
+                    shutil.rmtree(path, ignore_errors=True)
+        for frame_number, (path, _) in _ring_entries(directory).items():
+            if frame_number not in wanted:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,173 @@
+import math
+import os
+import struct
+import threading
+import time
+import zlib
+from utils import config
+
+config_data = config.read_toml_file("config.toml")
+# Seconds between checkpoints of playback progress into the database. In
+# between, each frame's progress (current_frame, last_updated and what the
+# panel shows) is one small write to the progress journal instead of a
+# database commit. 0 commits every frame, as before.
+PROGRESS_CHECKPOINT_SECONDS = float(config_data.get("PROGRESS_CHECKPOINT_SECONDS", 600))
+
+# Journal layout: two SLOT_SIZE slots written alternately, so a write torn by
+# a power cut leaves the previous record intact. Each slot holds one record
+# (little endian, NULLs as -1 / empty):
+#   magic, sequence number, movie id,
+#   Movie current_frame, random_seed, progress_generation, last_updated as of
+#   the last checkpoint,
+#   current_frame, random_seed, last_updated now,
+#   DisplayState shown_at and skipped_refreshes as of the last checkpoint,
+#   shown_at, frame, fingerprint length and fingerprint of the frame on the
+#   panel (length 0: unchanged since the checkpoint), skipped_refreshes now,
+#   CRC32 of everything before it
+MAGIC = b"EMFPRG02"
+SLOT_SIZE = 1024
+FINGERPRINT_SIZE = 384
+RECORD = struct.Struct(f"<8sQq qqq19s qq19s dq dqH{FINGERPRINT_SIZE}sq")
+_CRC = struct.Struct("<I")
+
+
+def _text(value):
+    return value.encode() if value else b""
+
+
+def _untext(value):
+    return value.rstrip(b"\0").decode() or None
+
+
+def _int(value):
+    return -1 if value is None else value
+
+
+def _unint(value):
+    return None if value < 0 else value
+
+
+def _float(value):
+    return math.nan if value is None else value
+
+
+def _unfloat(value):
+    return None if math.isnan(value) else value
+
+
+def pack(seq, record):
+    fingerprint = record['fingerprint'] or b""
+    base_frame, base_seed, base_generation, base_updated = record['base']
+    data = RECORD.pack(
+        MAGIC, seq, record['movie_id'],
+        base_frame, _int(base_seed), base_generation, _text(base_updated),
+        record['current_frame'], _int(record['random_seed']), _text(record['last_updated']),
+        _float(record['base_shown_at']), record['base_skipped'],
+        _float(record['shown_at']), _int(record['frame']), len(fingerprint), fingerprint, record['skipped'],
+    )
+    return data + _CRC.pack(zlib.crc32(data))
+
+
+def unpack(data):
+    """(sequence number, record) from one slot, or None if it is empty or torn."""
+    if len(data) < RECORD.size + _CRC.size:
+        return None
+    body = data[:RECORD.size]
+    if _CRC.unpack_from(data, RECORD.size)[0] != zlib.crc32(body):
+        return None
+    (magic, seq, movie_id, base_frame, base_seed, base_generation, base_updated, current_frame, random_seed, last_updated,
+     base_shown_at, base_skipped, shown_at, frame, fingerprint_length, fingerprint, skipped) = RECORD.unpack(body)
+    if magic != MAGIC:
+        return None
+    return seq, {
+        'movie_id': movie_id,
+        'base': (base_frame, _unint(base_seed), base_generation, _untext(base_updated)),
+        'current_frame': current_frame,
+        'random_seed': _unint(random_seed),
+        'last_updated': _untext(last_updated),
+        'base_shown_at': _unfloat(base_shown_at),
+        'base_skipped': base_skipped,
+        'shown_at': _unfloat(shown_at),
+        'frame': _unint(frame),
+        'fingerprint': fingerprint[:fingerprint_length] or None,
+        'skipped': skipped,
+    }
+
+
+class Journal:
+    """
+    Playback progress since the last database checkpoint, in a small file
+    beside the database. Only the player writes it; any process can read it.
+
+    Each record carries the database values it started from (its base), so
+    readers apply it only while the database still holds them. The base
+    includes Movie.progress_generation, which every other write of the
+    position bumps: a change from the web UI wins even when it restores the
+    very values the record started from.
+
+    Writes are only fdatasynced with sync=True (DB_SYNCHRONOUS = "FULL").
+    Otherwise, like SQLite with NORMAL, a record survives the player crashing
+    but not necessarily a power cut before the kernel writes it back.
+    """
+
+    def __init__(self, path, sync=False):
+        self.path = path
+        self.sync = sync
+        self.last = None  # record written since the last checkpoint
+        self.checkpointed_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._fd = None
+        self._seq = 0
+        self._written = None  # newest record this process wrote, as on disk
+        self._cached = (None, None)  # (file identity, record) last read from disk
+
+    def read(self):
+        """The newest intact record, or None. The file is only read when another process changed it."""
+        with self._lock:
+            if self._written is not None:
+                return self._written
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                return None
+            identity = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            if self._cached[0] == identity:
+                return self._cached[1]
+            try:
+                with open(self.path, "rb") as f:
+                    data = f.read(2 * SLOT_SIZE)
+            except OSError:
+                return None
+            newest = None
+            for offset in (0, SLOT_SIZE):
+                slot = unpack(data[offset:offset + SLOT_SIZE])
+                if slot and (newest is None or slot[0] > newest[0]):
+                    newest = slot
+            record = newest[1] if newest else None
+            self._cached = (identity, record)
+            return record
+
+    def write(self, record):
+        """Replace the journal's record: one write to the older slot."""
+        with self._lock:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                self._seq = 0
+                for offset in (0, SLOT_SIZE):
+                    slot = unpack(os.pread(self._fd, SLOT_SIZE, offset))
+                    if slot:
+                        self._seq = max(self._seq, slot[0])
+            self._seq += 1
+            os.pwrite(self._fd, pack(self._seq, record), (self._seq % 2) * SLOT_SIZE)
+            if self.sync:
+                os.fdatasync(self._fd)
+            self._written = record
+            self.last = record
+
+    def checkpoint_due(self):
+        return time.monotonic() - self.checkpointed_at >= PROGRESS_CHECKPOINT_SECONDS
+
+    def reset(self):
+        """Start over after a checkpoint; the record on disk goes stale as the database moves past its base."""
+        self.last = None
+        self.checkpointed_at = time.monotonic()
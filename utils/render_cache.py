@@ -0,0 +1,148 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from utils import config, metrics
+
+config_data = config.read_toml_file("config.toml")
+# Directory and disk budget for rendered frames (0 disables the cache)
+RENDER_CACHE_DIR = config_data.get("RENDER_CACHE_DIR", "cache/render")
+RENDER_CACHE_MB = int(config_data.get("RENDER_CACHE_MB", 256))
+
+# Part of every key: bump when decode/resize/encode output changes so stale
+# renders are never served (they age out of the LRU on their own)
+PIPELINE_VERSION = 3
+
+_lock = threading.Lock()
+_entries = None  # OrderedDict key -> size in bytes, least recently used first
+_total_bytes = 0
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+
+def enabled():
+    return RENDER_CACHE_MB > 0
+
+
+def render_key(video_path, frame_number, resolution, **render_settings):
+    """
+    Key for one rendered frame: the source file's identity (path, size,
+    mtime), the decoded frame, the target resolution, the render settings and
+    PIPELINE_VERSION. None if the source file is missing.
+    """
+    try:
+        stat = os.stat(video_path)
+    except OSError:
+        return None
+    parts = [PIPELINE_VERSION, os.path.abspath(video_path), stat.st_size, stat.st_mtime,
+             frame_number, tuple(resolution), sorted(render_settings.items())]
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _path(key):
+    return os.path.join(RENDER_CACHE_DIR, f"{key}.jpg")
+
+
+def _load():
+    """Rebuild the LRU order from disk, oldest mtime first (hits touch the file)."""
+    global _entries, _total_bytes
+    found = []
+    os.makedirs(RENDER_CACHE_DIR, exist_ok=True)
+    with os.scandir(RENDER_CACHE_DIR) as entries:
+        for entry in entries:
+            if entry.name.endswith(".jpg") and entry.is_file():
+                st = entry.stat()
+                found.append((st.st_mtime, entry.name[:-4], st.st_size))
+    found.sort()
+    _entries = OrderedDict((key, size) for _, key, size in found)
+    _total_bytes = sum(size for _, _, size in found)
+
+
+def get(key):
+    """The cached JPEG bytes for key, or None. Counts a hit or a miss."""
+    global _total_bytes
+    if key is None or not enabled():
+        return None
+    with _lock:
+        if _entries is None:
+            _load()
+        try:
+            with open(_path(key), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            # Evicted, possibly by another process sharing the directory
+            _forget(key)
+            _stats["misses"] += 1
+            return None
+        # May have been stored by another process sharing the directory
+        _forget(key)
+        _entries[key] = len(data)
+        _total_bytes += len(data)
+        _stats["hits"] += 1
+    try:
+        os.utime(_path(key))
+    except OSError:
+        pass
+    return data
+
+
+def put(key, data):
+    """Store JPEG bytes under key, evicting least recently used entries over budget."""
+    global _total_bytes
+    if key is None or not enabled():
+        return
+    with _lock:
+        if _entries is None:
+            _load()
+        tmp_path = f"{_path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, _path(key))
+        _forget(key)
+        _entries[key] = len(data)
+        _total_bytes += len(data)
+        _stats["stores"] += 1
+
+        budget = RENDER_CACHE_MB * 1024 * 1024
+        while _total_bytes > budget and len(_entries) > 1:
+            old_key, _ = next(iter(_entries.items()))
+            _forget(old_key)
+            _stats["evictions"] += 1
+            try:
+                os.remove(_path(old_key))
+            except FileNotFoundError:
+                pass
+
+
+def _forget(key):
+    global _total_bytes
+    size = _entries.pop(key, None)
+    if size is not None:
+        _total_bytes -= size
+
+
+def stats():
+    """Counters since this process started, plus the current size of the cache."""
+    with _lock:
+        if _entries is None and enabled():
+            _load()
+        requests = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "hit_rate": round(_stats["hits"] / requests, 3) if requests else None,
+            "entries": len(_entries or ()),
+            "bytes": _total_bytes,
+            "budget_bytes": RENDER_CACHE_MB * 1024 * 1024,
+        }
+
+
+def _collect_metrics():
+    current = stats()
+    return [
+        ("movieframe_render_cache_hits_total", "counter", "Render cache hits", current["hits"]),
+        ("movieframe_render_cache_misses_total", "counter", "Render cache misses", current["misses"]),
+        ("movieframe_render_cache_evictions_total", "counter", "Render cache evictions", current["evictions"]),
+        ("movieframe_render_cache_bytes", "gauge", "Size of the render cache on disk", current["bytes"]),
+    ]
+
+
+metrics.register_collector(_collect_metrics)
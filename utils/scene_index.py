@@ -0,0 +1,171 @@
+import os
+import struct
+import threading
+import cv2
+import numpy as np
+from utils import config
+
+config_data = config.read_toml_file("config.toml")
+# Show the most interesting frame up to this many frames either side of the
+# scheduled frame, within the same shot, once the movie has been analysed
+# (movieframe-analyze). 0 keeps the exact schedule. Keep it at or below half
+# of skip_frames so neighbouring ticks cannot pick the same frame.
+SCENE_SNAP_WINDOW = int(config_data.get("SCENE_SNAP_WINDOW", 0))
+# Mean per-pixel change (0.0 .. 1.0) between consecutive downsampled frames
+# that marks a shot boundary. Fades and most camera motion stay well below.
+SCENE_CUT_THRESHOLD = float(config_data.get("SCENE_CUT_THRESHOLD", 0.12))
+# Width frames are downsampled to before scoring
+SCENE_ANALYSIS_WIDTH = int(config_data.get("SCENE_ANALYSIS_WIDTH", 160))
+
+# Scores file layout (little endian):
+#   header: magic, frame count, source size, source mtime
+#   data:   `count` SCORE_DTYPE records, one per frame
+MAGIC = b"EMFSCN01"
+HEADER = struct.Struct("<8sIQd")
+SCORE_DTYPE = np.dtype([
+    ("brightness", "u1"),      # mean luma, 0 .. 255
+    ("sharpness", "<f2"),      # variance of the Laplacian of the luma
+    ("colourfulness", "<f2"),  # Hasler & Suesstrunk colourfulness
+    ("change", "u1"),          # mean absolute pixel change from the previous frame, 0 .. 255
+])
+_F2_MAX = float(np.finfo(np.float16).max)
+
+_lock = threading.Lock()
+_loaded = {}  # movie id -> ((source size, source mtime, scores mtime), (ranking, shots) or None)
+
+
+def scores_path(movie_id):
+    return os.path.join(f"static/{movie_id}", "scenes.bin")
+
+
+def downsample(frame, width=SCENE_ANALYSIS_WIDTH):
+    height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def score_batch(batch, previous_frame=None):
+    """
+    Score a batch of downsampled BGR frames of one size (an (n, h, w, 3)
+    uint8 array) in a few whole-array operations. previous_frame is the
+    frame before the batch, if any; the first frame's change is 0 without it.
+    """
+    pixels = batch.astype(np.float32)
+    blue, green, red = pixels[..., 0], pixels[..., 1], pixels[..., 2]
+    luma = 0.114 * blue + 0.587 * green + 0.299 * red
+
+    laplacian = (4 * luma[:, 1:-1, 1:-1] - luma[:, :-2, 1:-1] - luma[:, 2:, 1:-1]
+                 - luma[:, 1:-1, :-2] - luma[:, 1:-1, 2:])
+    rg = red - green
+    yb = 0.5 * (red + green) - blue
+    colourfulness = (np.hypot(rg.std(axis=(1, 2)), yb.std(axis=(1, 2)))
+                     + 0.3 * np.hypot(rg.mean(axis=(1, 2)), yb.mean(axis=(1, 2))))
+
+    previous = np.concatenate([pixels[:1] if previous_frame is None else previous_frame[None].astype(np.float32),
+                               pixels[:-1]])
+    change = np.abs(pixels - previous).mean(axis=(1, 2, 3))
+
+    scores = np.zeros(len(batch), dtype=SCORE_DTYPE)
+    scores["brightness"] = np.rint(luma.mean(axis=(1, 2)))
+    scores["sharpness"] = np.minimum(laplacian.var(axis=(1, 2)), _F2_MAX)
+    scores["colourfulness"] = np.minimum(colourfulness, _F2_MAX)
+    scores["change"] = np.rint(change)
+    return scores
+
+
+def frame_change(frame, previous_frame):
+    """The change score of one downsampled frame against the one before it, as score_batch computes it."""
+    return np.rint(np.abs(frame.astype(np.float32) - previous_frame.astype(np.float32)).mean())
+
+
+def write_scores(path, source_size, source_mtime, scores):
+    """Write a scores file under a temporary name and rename it into place."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(scores), source_size, source_mtime))
+        f.write(scores.astype(SCORE_DTYPE, copy=False).tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_scores(path):
+    """(source size, source mtime, scores array); raises OSError or ValueError."""
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f"{path} is truncated")
+        magic, count, source_size, source_mtime = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a scene scores file")
+        scores = np.fromfile(f, dtype=SCORE_DTYPE, count=count)
+    if len(scores) != count:
+        raise ValueError(f"{path} is truncated")
+    return source_size, source_mtime, scores
+
+
+def interestingness(scores, cut_threshold=SCENE_CUT_THRESHOLD):
+    """
+    Per-frame score in 0 .. 1 and shot numbers for a scores array. Sharpness
+    and colourfulness count by their rank within the movie, so the result
+    does not depend on its grain or grade; near-black or blown-out frames
+    (fades, flashes) score close to zero.
+    """
+    count = len(scores)
+    if count == 0:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int32)
+
+    def rank(values):
+        order = np.argsort(values, kind="stable")
+        ranks = np.empty(count, dtype=np.float32)
+        ranks[order] = np.arange(count, dtype=np.float32) / max(1, count - 1)
+        return ranks
+
+    brightness = scores["brightness"].astype(np.float32)
+    exposure = np.clip((brightness - 12) / 36, 0, 1) * np.clip((243 - brightness) / 36, 0, 1)
+    detail = 0.6 * rank(scores["sharpness"].astype(np.float32)) + 0.4 * rank(scores["colourfulness"].astype(np.float32))
+    shots = np.cumsum(scores["change"] >= round(cut_threshold * 255), dtype=np.int32)
+    return exposure * (0.1 + 0.9 * detail), shots
+
+
+def _load(movie_id, video_path):
+    """(ranking, shots) from an up-to-date scores file, or None."""
+    path = scores_path(movie_id)
+    try:
+        source = os.stat(video_path)
+        key = (source.st_size, source.st_mtime, os.path.getmtime(path))
+    except OSError:
+        return None
+    with _lock:
+        cached = _loaded.get(movie_id)
+        if cached and cached[0] == key:
+            return cached[1]
+        try:
+            source_size, source_mtime, scores = read_scores(path)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Ignoring unreadable scene scores {path}: {e}")
+            loaded = None
+        else:
+            # Scores from another version of the file would pick arbitrary frames
+            loaded = interestingness(scores) if (source_size, source_mtime) == key[:2] else None
+        _loaded[movie_id] = (key, loaded)
+        return loaded
+
+
+def best_frame(movie_id, video_path, frame_number, window=None):
+    """
+    The highest scoring frame within `window` (default SCENE_SNAP_WINDOW)
+    frames of frame_number that belongs to the same shot. Returns
+    frame_number when the movie has no up-to-date analysis or the window is 0.
+    """
+    window = SCENE_SNAP_WINDOW if window is None else window
+    if window <= 0:
+        return frame_number
+    loaded = _load(movie_id, video_path)
+    if loaded is None:
+        return frame_number
+    ranking, shots = loaded
+    if not 0 <= frame_number < len(ranking):
+        return frame_number
+    start = max(0, frame_number - window)
+    end = min(len(ranking), frame_number + window + 1)
+    candidates = np.where(shots[start:end] == shots[frame_number], ranking[start:end], -1)
+    return start + int(np.argmax(candidates))
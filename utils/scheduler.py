@@ -0,0 +1,109 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+_condition = threading.Condition()
+_generation = 0
+_forward = None
+_refresh_requests = []  # movie ids the web UI asked to show on the panel now
+
+
+def notify_playback_changed():
+    """Wake the player loop: the active movie, its settings or quiet hours changed."""
+    global _generation
+    with _condition:
+        _generation += 1
+        _condition.notify_all()
+    if _forward is not None:
+        try:
+            _forward()
+        except OSError:
+            pass
+
+
+def request_refresh(movie_id):
+    """
+    Ask the player to show movie_id's current frame on the panel now. Only
+    the player drives the panel (it holds its SPI/GPIO lines), so a web UI in
+    its own process forwards the request instead of queueing it here.
+    """
+    global _generation
+    if _forward is not None:
+        try:
+            _forward(movie_id)
+        except OSError:
+            pass
+        return
+    with _condition:
+        _refresh_requests.append(movie_id)
+        _generation += 1
+        _condition.notify_all()
+
+
+def take_refresh_requests():
+    """The movie ids passed to request_refresh() since the last call, oldest first."""
+    with _condition:
+        requests = _refresh_requests[:]
+        del _refresh_requests[:]
+        return requests
+
+
+def forward_notifications(send):
+    """
+    Also call send() on every notify_playback_changed(), and send(movie_id)
+    instead of queueing a request_refresh(), for a web UI running in its own
+    process to wake the player (see utils/webserver.py).
+    """
+    global _forward
+    _forward = send
+
+
+def generation():
+    with _condition:
+        return _generation
+
+
+def wait(seconds, seen_generation):
+    """
+    Sleep up to `seconds` (None: until notified), returning early if
+    notify_playback_changed() was called since `seen_generation` was read.
+    Returns True when woken by a change. Changes made in this process, or
+    forwarded by the web UI process, are the only early wake-ups.
+    """
+    timeout = None if seconds is None else max(0.0, seconds)
+    with _condition:
+        return _condition.wait_for(lambda: _generation != seen_generation, timeout)
+
+
+def parse_timestamp(value):
+    """SQLite CURRENT_TIMESTAMP text (UTC) to epoch seconds, or None."""
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+
+
+def format_timestamp(epoch_seconds):
+    """Epoch seconds to the CURRENT_TIMESTAMP text format used in the database."""
+    return datetime.fromtimestamp(epoch_seconds, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def next_due_time(movie, now=None):
+    """
+    Wall-clock time (epoch seconds) the next frame is due: one interval after
+    the previous frame's scheduled time, or now if nothing has been shown yet.
+    """
+    now = time.time() if now is None else now
+    last_updated = parse_timestamp(movie['last_updated'])
+    if last_updated is None:
+        return now
+    return last_updated + movie['time_per_frame'] * 60
+
+
+def schedule_anchor(due, interval_seconds, now=None):
+    """
+    The time to record as this frame's slot. Normally the due time, so render
+    time never accumulates into drift; after a long pause (quiet hours, power
+    off) restart the cadence from now instead of replaying missed frames.
+    """
+    now = time.time() if now is None else now
+    return due if now - due < interval_seconds else now
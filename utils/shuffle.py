@@ -0,0 +1,99 @@
+import secrets
+
+# Random order is a seeded permutation of the skip_frames lattice slots: a
+# Feistel network over the next power-of-4 domain, cycle-walked back into
+# range. Both directions are O(1), so only the seed needs storing.
+ROUNDS = 6
+_MASK64 = (1 << 64) - 1
+
+
+def new_seed():
+    return secrets.randbits(32)
+
+
+def slot_count(total_frames, skip_frames):
+    """Frames on the lattice: one pass of random playback."""
+    return -(-max(0, total_frames) // max(1, skip_frames))
+
+
+def _mix(value):
+    """splitmix64 finaliser: a cheap, well-distributed 64-bit hash."""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+def _half_bits(count):
+    bits = max(1, (count - 1).bit_length())
+    return (bits + 1) // 2
+
+
+def _encrypt(value, half, seed):
+    mask = (1 << half) - 1
+    left, right = value >> half, value & mask
+    for round_number in range(ROUNDS):
+        left, right = right, left ^ (_mix((seed << 8) ^ (round_number << 48) ^ right) & mask)
+    return (left << half) | right
+
+
+def _decrypt(value, half, seed):
+    mask = (1 << half) - 1
+    left, right = value >> half, value & mask
+    for round_number in reversed(range(ROUNDS)):
+        left, right = right ^ (_mix((seed << 8) ^ (round_number << 48) ^ left) & mask), left
+    return (left << half) | right
+
+
+def permute(position, count, seed):
+    """The slot at `position` (0 .. count-1) of the permutation for `seed`."""
+    if count <= 1:
+        return 0
+    half = _half_bits(count)
+    value = _encrypt(position, half, seed)
+    # The domain is under 4x count, so this loop runs a few times at most
+    while value >= count:
+        value = _encrypt(value, half, seed)
+    return value
+
+
+def position_of(slot, count, seed):
+    """Inverse of permute(): where `slot` falls in the permutation for `seed`."""
+    if count <= 1:
+        return 0
+    half = _half_bits(count)
+    value = _decrypt(slot, half, seed)
+    while value >= count:
+        value = _decrypt(value, half, seed)
+    return value
+
+
+def frame_at(position, total_frames, skip_frames, seed):
+    """The frame shown at `position` of a random pass."""
+    return permute(position, slot_count(total_frames, skip_frames), seed) * max(1, skip_frames)
+
+
+def position_of_frame(frame, total_frames, skip_frames, seed):
+    """
+    Position of a frame within the random pass. A frame off the lattice
+    (eg set by hand in the web UI) counts as the lattice frame before it.
+    """
+    count = slot_count(total_frames, skip_frames)
+    slot = min(max(0, frame) // max(1, skip_frames), max(0, count - 1))
+    return position_of(slot, count, seed)
+
+
+def next_frame(frame, total_frames, skip_frames, seed):
+    """
+    (frame, seed) to show after `frame`. After the last position of a pass
+    the order restarts with the next seed.
+    """
+    position = position_of_frame(frame, total_frames, skip_frames, seed)
+    if position + 1 < slot_count(total_frames, skip_frames):
+        return frame_at(position + 1, total_frames, skip_frames, seed), seed
+    return frame_at(0, total_frames, skip_frames, seed + 1), seed + 1
+
+
+def remaining(frame, total_frames, skip_frames, seed):
+    """Frames left in the current pass, including `frame`."""
+    return slot_count(total_frames, skip_frames) - position_of_frame(frame, total_frames, skip_frames, seed)
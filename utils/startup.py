@@ -0,0 +1,71 @@
+import logging
+import threading
+import time
+from utils import metrics
+
+# movieplayer imports this module before anything heavy, so this is close to
+# process start
+STARTED = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_phases = []  # (name, seconds, ran in the background)
+_phase_started = STARTED
+_total = None
+
+
+def phase_done(name):
+    """
+    End the current startup phase, which began at the previous phase_done()
+    (or process start), and record it as `name`. No-op once reported.
+    """
+    global _phase_started
+    now = time.perf_counter()
+    with _lock:
+        if _total is None:
+            _phases.append((name, now - _phase_started, False))
+        _phase_started = now
+
+
+def in_background(name, fn):
+    """Run fn on a daemon thread, recording it as a phase overlapping the others. Returns the thread."""
+    def run():
+        started = time.perf_counter()
+        try:
+            fn()
+        finally:
+            with _lock:
+                if _total is None:
+                    _phases.append((name, time.perf_counter() - started, True))
+
+    thread = threading.Thread(target=run, name=name.replace(" ", "-"), daemon=True)
+    thread.start()
+    return thread
+
+
+def report():
+    """Log the time from process start to now by phase, once; later calls do nothing."""
+    global _total
+    with _lock:
+        if _total is not None:
+            return
+        _total = time.perf_counter() - STARTED
+        phases = list(_phases)
+    sequential = ", ".join(f"{name} {seconds:.2f}s" for name, seconds, background in phases if not background)
+    line = f"Startup took {_total:.2f}s: {sequential or 'no phases recorded'}"
+    background = ", ".join(f"{name} {seconds:.2f}s" for name, seconds, background in phases if background)
+    if background:
+        line += f"; in the background: {background}"
+    logger.info(line)
+
+
+def _collect_metrics():
+    with _lock:
+        total = _total
+    if total is None:
+        return []
+    return [("movieframe_startup_seconds", "gauge", "Time from process start to the first frame (or first wait)", total)]
+
+
+metrics.register_collector(_collect_metrics)
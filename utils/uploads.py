@@ -0,0 +1,140 @@
+import hashlib
+import os
+import time
+import uuid
+from utils import config, scheduler
+
+config_data = config.read_toml_file("config.toml")
+# Size of each PUT the upload page sends; the server accepts any chunk size
+UPLOAD_CHUNK_MB = int(config_data.get("UPLOAD_CHUNK_MB", 8))
+# Unfinished sessions older than this are discarded (with their partial file)
+UPLOAD_SESSION_TTL_HOURS = int(config_data.get("UPLOAD_SESSION_TTL_HOURS", 48))
+
+_COPY_BUFFER = 1024 * 1024
+
+
+class OffsetMismatch(Exception):
+    """A chunk did not start where the upload left off."""
+
+    def __init__(self, received):
+        super().__init__(f"expected offset {received}")
+        self.received = received
+
+
+def part_path(settings, session):
+    """Partial file for a session; hidden and not a video extension, so listings skip it."""
+    return os.path.join(settings['VideoRootPath'], f".{session['id']}.part")
+
+
+def create_session(settings, filename, size, sha256=None):
+    """
+    Start a resumable upload of `size` bytes. The partial file is created in
+    VideoRootPath and preallocated, so chunks land in their final location
+    and the finished file is renamed into place rather than copied.
+    """
+    import database
+
+    expire_stale(settings)
+    os.makedirs(settings['VideoRootPath'], exist_ok=True)
+    session = database.create_upload_session(uuid.uuid4().hex, filename, size, sha256.lower() if sha256 else None)
+    fd = os.open(part_path(settings, session), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if size and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except OSError:
+                # Not supported by every filesystem; the file just grows as chunks arrive
+                pass
+    finally:
+        os.close(fd)
+    return session
+
+
+def write_chunk(settings, session, offset, stream, length, chunk_sha256=None):
+    """
+    Write `length` bytes from `stream` at `offset` straight into the partial
+    file and return the new received offset. Chunks must arrive in order:
+    anything not starting at the current offset raises OffsetMismatch so the
+    client can resume from the right place. If chunk_sha256 is given and does
+    not match, nothing is recorded and ValueError is raised.
+    """
+    import database
+
+    received = session['received']
+    if offset != received:
+        raise OffsetMismatch(received)
+    if length <= 0 or offset + length > session['size']:
+        raise ValueError("chunk is empty or runs past the declared size")
+
+    digest = hashlib.sha256() if chunk_sha256 else None
+    buffer = bytearray(min(_COPY_BUFFER, length))
+    view = memoryview(buffer)
+    fd = os.open(part_path(settings, session), os.O_WRONLY)
+    try:
+        position, remaining = offset, length
+        while remaining:
+            n = stream.readinto(view[:min(remaining, len(buffer))])
+            if not n:
+                raise ValueError("connection closed before the chunk was complete")
+            chunk = view[:n]
+            if digest:
+                digest.update(chunk)
+            while chunk:
+                written = os.pwrite(fd, chunk, position)
+                chunk = chunk[written:]
+                position += written
+            remaining -= n
+    finally:
+        os.close(fd)
+
+    if digest and digest.hexdigest() != chunk_sha256.lower():
+        raise ValueError("chunk checksum mismatch")
+    if not database.advance_upload_session(session['id'], offset, offset + length):
+        raise OffsetMismatch(database.get_upload_session(session['id'])['received'])
+    return offset + length
+
+
+def commit_session(settings, session):
+    """
+    Finish an upload: check it is complete (and its checksum, if one was
+    declared), rename it to its final name and return that filename.
+    """
+    import database
+
+    if session['received'] != session['size']:
+        raise ValueError(f"upload incomplete: {session['received']} of {session['size']} bytes received")
+
+    path = part_path(settings, session)
+    if session['sha256']:
+        digest = hashlib.sha256()
+        buffer = bytearray(_COPY_BUFFER)
+        view = memoryview(buffer)
+        with open(path, "rb", buffering=0) as f:
+            while n := f.readinto(buffer):
+                digest.update(view[:n])
+        if digest.hexdigest() != session['sha256']:
+            raise ValueError("file checksum mismatch")
+
+    os.replace(path, os.path.join(settings['VideoRootPath'], session['filename']))
+    database.delete_upload_session(session['id'])
+    return session['filename']
+
+
+def abort_session(settings, session):
+    import database
+
+    try:
+        os.remove(part_path(settings, session))
+    except FileNotFoundError:
+        pass
+    database.delete_upload_session(session['id'])
+
+
+def expire_stale(settings):
+    import database
+
+    cutoff = time.time() - UPLOAD_SESSION_TTL_HOURS * 3600
+    for session in database.get_upload_sessions():
+        if scheduler.parse_timestamp(session['created_at']) < cutoff:
+            print(f"[INFO] Discarding stale upload of {session['filename']}")
+            abort_session(settings, session)
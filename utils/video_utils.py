@@ -2,10 +2,30 @@ import cv2
 import numpy as np
 import os
 import shutil
-from utils import eframe_inky, config
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils import eframe_inky, config, decoders, events, frame_archive, frame_diff, frame_index, letterbox, metrics, render_cache, scene_index, shuffle
 from datetime import datetime, timedelta
 
-DEV_MODE = config.read_toml_file("config.toml").get("DEVELOPMENT_MODE", False)
+config_data = config.read_toml_file("config.toml")
+DEV_MODE = config_data.get("DEVELOPMENT_MODE", False)
+
+# When the requested frame is at most this many frames ahead of the decoder,
+# grab() forward instead of seeking (a seek decodes from the previous keyframe).
+MAX_SEQUENTIAL_GAP = int(config_data.get("MAX_SEQUENTIAL_GAP", 250))
+
+# With a keyframe index, show a keyframe up to this many frames after the
+# scheduled frame instead (cheaper to decode). 0 keeps the exact schedule.
+KEYFRAME_SNAP_WINDOW = int(config_data.get("KEYFRAME_SNAP_WINDOW", 0))
+
+# Skip the e-ink refresh when the new frame differs from the one on the panel
+# by less than this (0.0 identical .. 1.0 unrelated; 0 always refreshes).
+REFRESH_DIFF_THRESHOLD = float(config_data.get("REFRESH_DIFF_THRESHOLD", 0.02))
+
+JPEG_QUALITY = 90
+
+# Encodes fresh renders for the render cache off the display path
+_cache_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render-cache")
 
 def should_skip_due_to_quiet_hours(settings):
     try:
@@ -29,6 +49,14 @@ def should_skip_due_to_quiet_hours(settings):
         print(f"[ERROR] Quiet hour check failed: {e}")
         return False
 
+def quiet_hours_end(settings, now=None):
+    """The local datetime the current quiet-hours window ends."""
+    now = now or datetime.now()
+    end = now.replace(hour=int(settings['quiet_end']), minute=0, second=0, microsecond=0)
+    if end <= now:
+        end += timedelta(days=1)
+    return end
+
 def calculate_playback_time(movie):
     total_frames = movie['total_frames']
     current_frame = movie['current_frame']
@@ -36,8 +64,12 @@ def calculate_playback_time(movie):
     time_per_frame_minutes = movie['time_per_frame']
 
     time_per_frame_ms = time_per_frame_minutes * 60 * 1000
-    adjusted_frames = total_frames - current_frame
-    total_milliseconds = (adjusted_frames / skip_frames) * time_per_frame_ms
+    if movie['isRandom']:
+        # Time left in the current random pass
+        frames_left = shuffle.remaining(current_frame, total_frames, skip_frames, movie['random_seed'] or 0)
+    else:
+        frames_left = (total_frames - current_frame) / skip_frames
+    total_milliseconds = frames_left * time_per_frame_ms
 
     years, remainder = divmod(total_milliseconds, 31536000000)
     days, remainder = divmod(remainder, 86400000)
@@ -59,15 +91,223 @@ def get_total_frames(video_path):
     captured_video.release()
     return total_frames
 
+def next_frame_number(current_frame, skip_frames, total_frames):
+    next_frame = current_frame + skip_frames
+    if next_frame >= total_frames:
+        next_frame = 0
+    return next_frame
+
+def next_movie_frame(movie, current_frame, random_seed=None):
+    """
+    (next frame, random seed) after current_frame: the next step of the
+    movie's random order when isRandom is set (see utils/shuffle.py), else
+    skip_frames on. The seed is None in sequential order. random_seed
+    overrides the movie's, to look further ahead than one pass.
+    """
+    if not movie['isRandom']:
+        return next_frame_number(current_frame, movie['skip_frames'], movie['total_frames']), None
+    seed = (movie['random_seed'] or 0) if random_seed is None else random_seed
+    return shuffle.next_frame(current_frame, movie['total_frames'], movie['skip_frames'], seed)
+
+def is_last_frame(movie, frame):
+    """Whether the frame after `frame` starts a new pass through the movie."""
+    if movie['isRandom']:
+        return shuffle.remaining(frame, movie['total_frames'], movie['skip_frames'], movie['random_seed'] or 0) <= 1
+    return frame + movie['skip_frames'] >= movie['total_frames']
+
 def extract_frame_as_image(cap, frame_number):
     cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
     ret, frame = cap.read()
     return frame if ret else None
 
-def save_frame_as_image(frame, movie_id):
+class CaptureSession:
+    """
+    Long-lived decoder (see utils/decoders.py) for the active movie.
+
+    The decoder is keyed by (movie id, path, file mtime, target size) and is
+    only reopened when one of those changes or a decode fails. Frames ahead
+    of the decoder position are reached with grab() rather than a seek when
+    that is cheaper: per the movie's keyframe index when one exists,
+    otherwise when the gap is at most max_gap frames.
+    """
+
+    def __init__(self, max_gap=MAX_SEQUENTIAL_GAP):
+        self.max_gap = max_gap
+        self.decoder = None
+        self.key = None
+        self.position = 0  # index of the frame the next read() will return
+        self.keyframes = None
+
+    def _open(self, key, video_path, target_size):
+        self.release()
+        decoder = decoders.open_decoder(video_path, target_size)
+        if decoder is None:
+            print(f"[ERROR] Failed to open video file: {video_path}")
+            return False
+        self.decoder = decoder
+        self.key = key
+        self.position = 0
+        return True
+
+    def _read_at(self, frame_number):
+        gap = frame_number - self.position
+        if self.keyframes:
+            forward = frame_index.should_decode_forward(self.keyframes, self.position, frame_number)
+        else:
+            forward = 0 <= gap <= self.max_gap
+        if forward:
+            for _ in range(gap):
+                if not self.decoder.grab():
+                    return None
+        elif not self.decoder.seek(frame_number):
+            return None
+        frame = self.decoder.read()
+        if frame is None:
+            return None
+        self.position = frame_number + 1
+        return frame
+
+    def read(self, movie_id, video_path, frame_number, target_size=None):
+        """
+        Decode one frame as a BGR array, at roughly target_size (width,
+        height) when the decoder can scale while decoding.
+        """
+        try:
+            mtime = os.path.getmtime(video_path)
+        except OSError:
+            print(f"[ERROR] Video file not found: {video_path}")
+            self.release()
+            return None
+
+        target_size = tuple(target_size) if target_size else None
+        key = (movie_id, video_path, mtime, target_size)
+        if key != self.key and not self._open(key, video_path, target_size):
+            return None
+        self.keyframes = frame_index.keyframes_for(movie_id, video_path)
+
+        with metrics.DECODE_SECONDS.time():
+            frame = self._read_at(frame_number)
+        if frame is None:
+            # Decoder may be wedged; reopen once and retry with a fresh seek
+            if not self._open(key, video_path, target_size):
+                metrics.DECODE_FAILURES.inc()
+                return None
+            with metrics.DECODE_SECONDS.time():
+                frame = self._read_at(frame_number)
+            if frame is None:
+                metrics.DECODE_FAILURES.inc()
+                self.release()
+        return frame
+
+    def release(self):
+        if self.decoder is not None:
+            self.decoder.release()
+        self.decoder = None
+        self.key = None
+        self.position = 0
+        self.keyframes = None
+
+def display_frame_number(movie_id, video_path, frame_number):
+    """
+    The frame actually decoded for a scheduled frame: the best scored frame
+    nearby once the movie has been analysed (see SCENE_SNAP_WINDOW),
+    otherwise a nearby keyframe (see KEYFRAME_SNAP_WINDOW).
+    """
+    chosen = scene_index.best_frame(movie_id, video_path, frame_number)
+    if chosen != frame_number or KEYFRAME_SNAP_WINDOW <= 0:
+        return chosen
+    keyframes = frame_index.keyframes_for(movie_id, video_path)
+    return frame_index.snap_to_keyframe(keyframes, frame_number, KEYFRAME_SNAP_WINDOW)
+
+def _render_key(video_path, frame_number, resolution):
+    return render_cache.render_key(video_path, frame_number, resolution, quality=JPEG_QUALITY,
+                                   decoder=decoders.render_tag(video_path), fit=letterbox.LETTERBOX_MODE,
+                                   interpolation=letterbox.LETTERBOX_INTERPOLATION)
+
+def archive_settings(movie_id, video_path):
+    """
+    What, besides the source file and resolution, decides a baked frame: a
+    baked archive made with other settings is not used (see frame_archive).
+    """
+    scores_mtime = None
+    if scene_index.SCENE_SNAP_WINDOW > 0:
+        # Analysing the movie changes which frames display_frame_number picks
+        try:
+            scores_mtime = os.path.getmtime(scene_index.scores_path(movie_id))
+        except OSError:
+            pass
+    return {"pipeline": render_cache.PIPELINE_VERSION, "quality": JPEG_QUALITY,
+            "fit": letterbox.LETTERBOX_MODE, "interpolation": letterbox.LETTERBOX_INTERPOLATION,
+            "scene_snap": scene_index.SCENE_SNAP_WINDOW, "keyframe_snap": KEYFRAME_SNAP_WINDOW,
+            "scenes": scores_mtime}
+
+def decode_jpeg(data):
+    """Decode JPEG bytes (or a memoryview into a baked archive) to a BGR array, in memory."""
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+def _store_render(key, image):
+    with metrics.ENCODE_SECONDS.time():
+        ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if ok:
+        render_cache.put(key, encoded.tobytes())
+
+def render_image(video_path, frame_number, resolution, decode):
+    """
+    Like render_frame, but returns the display-ready BGR array for handing
+    straight to the panel. A cache hit is decoded in memory; a fresh render
+    is returned as is and JPEG-encoded for the cache on a background thread.
+    The array may be this thread's letterbox canvas, so use it before
+    rendering again.
+    """
+    key = _render_key(video_path, frame_number, resolution)
+    data = render_cache.get(key)
+    if data is not None:
+        return decode_jpeg(data)
+
+    frame = decode()
+    if frame is None:
+        return None
+    with metrics.RESIZE_SECONDS.time():
+        final_frame = letterbox.for_size(resolution[0], resolution[1]).apply(frame)
+    if key is not None and render_cache.enabled():
+        _cache_writer.submit(_store_render, key, final_frame.copy())
+    return final_frame
+
+def render_frame(video_path, frame_number, resolution, decode, store=True):
+    """
+    Display-ready JPEG bytes for a frame, served from the render cache when
+    possible. decode() is only called on a miss and returns the BGR frame (or
+    None, in which case this returns None). store=False only reads the cache.
+    """
+    key = _render_key(video_path, frame_number, resolution)
+    data = render_cache.get(key)
+    if data is not None:
+        return data
+
+    frame = decode()
+    if frame is None:
+        return None
+    # The engine's canvas is reused for the next frame; it is encoded right away
+    with metrics.RESIZE_SECONDS.time():
+        final_frame = letterbox.for_size(resolution[0], resolution[1]).apply(frame)
+    with metrics.ENCODE_SECONDS.time():
+        ok, encoded = cv2.imencode(".jpg", final_frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ok:
+        return None
+    data = encoded.tobytes()
+    if store:
+        render_cache.put(key, data)
+    return data
+
+def save_frame_bytes(data, movie_id):
+    """Write an encoded frame to static/<movie_id>/frame.jpg (atomically, for the web UI)."""
     directory = f"static/{movie_id}"
     os.makedirs(directory, exist_ok=True)
-    cv2.imwrite(f"{directory}/frame.jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    tmp_path = f"{directory}/.frame.jpg"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, f"{directory}/frame.jpg")
+    return f"{directory}/frame.jpg"
 
 def list_video_files(directory):
     video_files = []
@@ -77,63 +317,92 @@ def list_video_files(directory):
     return video_files
 
 # Function to process a video, extract a specific frame, resize it, and save as an image
+@metrics.timed(metrics.PROCESS_VIDEO_SECONDS)
 def process_video(movie, settings):
     video_path = f"{settings['VideoRootPath']}/{movie['video_path']}"
-    print(f"[DEBUG] Attempting to open video: {video_path}")
-    captured_video = cv2.VideoCapture(video_path)
+    resolution = [int(x) for x in settings['Resolution'].split(',')]
 
-    resolution_string = settings['Resolution'].split(',')
-    resolution = [int(x) for x in resolution_string]
-    
-    # Extract the specified frame from the video
-    movie_frame = extract_frame_as_image(captured_video, movie['current_frame'])
-    # progress_animation(30)
-    # Resize the frame with black borders to the target dimensions    
-    final_size_frame = resize_with_black_borders(movie_frame, resolution[0], resolution[1])
-    # progress_animation(60)
-    # Save the resized frame as an image
-    save_frame_as_image(final_size_frame, movie['id'])
-    captured_video.release()    
+    def decode():
+        print(f"[DEBUG] Attempting to open video: {video_path}")
+        session = CaptureSession()
+        frame = session.read(movie['id'], video_path, movie['current_frame'], resolution)
+        session.release()
+        return frame
 
+    data = render_frame(video_path, movie['current_frame'], resolution, decode)
+    if data is None:
+        print(f"[ERROR] Could not read frame {movie['current_frame']} from {video_path}")
+        return False
+    save_frame_bytes(data, movie['id'])
+    return True
 
-def resize_with_black_borders(image, target_width, target_height):
-    original_height, original_width = image.shape[:2]
-    original_aspect_ratio = original_width / original_height
-    target_aspect_ratio = target_width / target_height
 
-    if original_aspect_ratio > target_aspect_ratio:
-        new_width = target_width
-        new_height = int(target_width / original_aspect_ratio)
-    else:
-        new_height = target_height
-        new_width = int(target_height * original_aspect_ratio)
+def ensure_preview(movie, settings):
+    """
+    Bring static/<id>/frame.jpg up to date before the web UI shows it. The
+    player does not write it on every tick: if the panel shows a newer frame
+    of this movie than the file, render that frame now (normally a render
+    cache hit).
+    """
+    from database import get_display_state
 
-    resized_image = cv2.resize(image, (new_width, new_height))
-    canvas = np.zeros((target_height, target_width, 3), dtype=np.uint8)
-    x_offset = (target_width - new_width) // 2
-    y_offset = (target_height - new_height) // 2
-    canvas[y_offset:y_offset + new_height, x_offset:x_offset + new_width] = resized_image
-    return canvas
+    state = get_display_state()
+    if not state or state['movie_id'] != movie['id'] or state['frame'] is None:
+        return
+    try:
+        if os.path.getmtime(f"static/{movie['id']}/frame.jpg") >= state['shown_at']:
+            return
+    except OSError:
+        pass
+
+    video_path = os.path.join(settings['VideoRootPath'], movie['video_path'])
+    resolution = [int(x) for x in settings['Resolution'].split(',')]
+
+    def decode():
+        session = CaptureSession()
+        frame = session.read(movie['id'], video_path, state['frame'], resolution)
+        session.release()
+        return frame
 
-def play_video(logger):
-    from database import get_active_movie, get_settings, update_current_frame
+    data = render_frame(video_path, state['frame'], resolution, decode)
+    if data is not None:
+        save_frame_bytes(data, movie['id'])
 
-    movie = get_active_movie()
-    settings = get_settings()
+def resize_with_black_borders(image, target_width, target_height):
+    """Letterbox an image onto a new black target-sized canvas (see utils/letterbox.py)."""
+    return letterbox.for_size(target_width, target_height, "pad").apply(image).copy()
+
+@metrics.timed(metrics.PLAY_VIDEO_SECONDS)
+def play_video(logger, session=None, scheduled_at=None):
+    """
+    Render and display the active movie's current frame, then advance it.
+    Returns True if a frame was shown (or deliberately left unrefreshed).
+    """
+    from database import (transaction, get_active_movie, get_settings, advance_current_frame,
+                          set_movie_last_updated, get_display_state, set_display_fingerprint,
+                          increment_skipped_refreshes, advance_playlist, journal_progress,
+                          checkpoint_progress, set_now_playing)
+    from utils import prerender, scheduler
+
+    # One consistent snapshot for everything this tick reads...
+    with transaction():
+        movie = get_active_movie()
+        settings = get_settings()
+        state = get_display_state()
 
     if should_skip_due_to_quiet_hours(settings):
         logger.info("Playback skipped due to quiet hours.")
-        return
+        metrics.QUIET_HOURS_SKIPS.inc()
+        return False
 
     if not movie or not settings:
         logger.warning("No active movie or settings found.")
-        return
+        return False
 
     video_path = os.path.join(settings['VideoRootPath'], movie['video_path'])
     resolution = [int(x) for x in settings['Resolution'].split(',')]
     current_frame = movie['current_frame']
     total_frames = movie['total_frames']
-    skip_frames = movie['skip_frames']
     time_per_frame = movie['time_per_frame']
     movie_id = movie['id']
 
@@ -141,33 +410,81 @@ def play_video(logger):
         current_frame = 0
 
     logger.info(f"Rendering frame - {current_frame} of {total_frames}")
-    cap = cv2.VideoCapture(video_path)
-    frame = extract_frame_as_image(cap, current_frame)
-    if frame is None:
+    decode_frame = display_frame_number(movie_id, video_path, current_frame)
+
+    # The frame stays in memory from render to panel; the web UI preview is
+    # written on demand by ensure_preview()
+    baked = frame_archive.read_frame(movie_id, video_path, resolution,
+                                     archive_settings(movie_id, video_path), current_frame)
+    ready_path = None if baked is not None else prerender.pop_ready_frame(movie_id, resolution, current_frame)
+    if baked is not None:
+        logger.info("Using baked frame.")
+        image = decode_jpeg(baked)
+    elif ready_path:
+        logger.info("Using pre-rendered frame.")
+        with open(ready_path, "rb") as f:
+            image = decode_jpeg(f.read())
+        os.remove(ready_path)
+    else:
+        def decode():
+            if session is not None:
+                return session.read(movie_id, video_path, decode_frame, resolution)
+            one_shot = CaptureSession()
+            frame = one_shot.read(movie_id, video_path, decode_frame, resolution)
+            one_shot.release()
+            return frame
+
+        image = render_image(video_path, decode_frame, resolution, decode)
+    if image is None:
         logger.error(f"[ERROR] Could not read frame {current_frame} from {video_path}")
-        cap.release()
-        return
-
-    final_frame = resize_with_black_borders(frame, resolution[0], resolution[1])
-    save_frame_as_image(final_frame, movie_id)
-    
-    image_path = os.path.join(f"static/{movie_id}", "frame.jpg")
+        return False
 
-    if DEV_MODE:
-        print("[DEV_MODE] Frame saved to static only.")
+    fingerprint = frame_diff.fingerprint(image)
+    change = frame_diff.difference(fingerprint, state['fingerprint'] if state else None)
+    refresh_skipped = REFRESH_DIFF_THRESHOLD > 0 and change < REFRESH_DIFF_THRESHOLD
+    if refresh_skipped:
+        logger.info(f"Frame unchanged on screen (difference {change:.3f}); skipping refresh.")
+        metrics.REFRESHES_SKIPPED.inc()
+    elif DEV_MODE:
+        print("[DEV_MODE] Skipping panel update; the web UI preview shows the frame.")
     else:
-        eframe_inky.show_on_inky(image_path)
+        eframe_inky.show_frame_on_inky(image)
 
     y, d, h, m = calculate_playback_time(movie)
     logger.info(f"Estimated playback time: {y}y {d}d {h}h {m}m")
     logger.info(f"Next frame will be displayed at: {render_future_date(time_per_frame)}")
 
-    next_frame = current_frame + skip_frames
-    if next_frame >= total_frames:
-        next_frame = 0
-
-    update_current_frame(movie_id, next_frame)
-    cap.release()
+    # ...and one commit for everything it writes
+    next_frame, random_seed = next_movie_frame(movie, current_frame)
+    shown_at = scheduler.format_timestamp(scheduled_at or time.time())
+    # Between checkpoints (PROGRESS_CHECKPOINT_SECONDS) this is one write to
+    # the progress journal. The last frame of a pass always commits, as a
+    # playlist may switch titles.
+    journaled = not is_last_frame(movie, current_frame) and journal_progress(
+        movie, next_frame, random_seed, shown_at, None if refresh_skipped else fingerprint, decode_frame)
+    if not journaled:
+        with transaction(immediate=True):
+            checkpoint_progress()
+            set_now_playing(movie_id)
+            if refresh_skipped:
+                increment_skipped_refreshes()
+            else:
+                set_display_fingerprint(fingerprint, movie_id, decode_frame)
+            set_movie_last_updated(movie_id, shown_at)
+            if not advance_current_frame(movie_id, movie['current_frame'], next_frame, random_seed):
+                logger.info("current_frame was changed from the web UI during rendering; keeping that value.")
+            elif is_last_frame(movie, current_frame):
+                # The end of a playlist title switches to the next in the same commit
+                next_title = advance_playlist(movie_id, shown_at)
+                if next_title:
+                    logger.info(f"Playlist: next up is {next_title['video_path']}")
+    prerender.notify()
+    metrics.FRAMES_DISPLAYED.inc()
+    skipped_refreshes = (state['skipped_refreshes'] if state else 0) + refresh_skipped
+    events.publish(events.FRAME, movie_id=movie_id, shown_frame=current_frame, current_frame=next_frame,
+                   total_frames=total_frames, refreshed=not refresh_skipped,
+                   skipped_refreshes=skipped_refreshes)
+    return True
 
 def get_disk_usage_stats(path="/"):
     usage = shutil.disk_usage(path)
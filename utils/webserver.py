@@ -0,0 +1,194 @@
+import atexit
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+from utils import config, events, scheduler
+
+config_data = config.read_toml_file("config.toml")
+# "process" runs the web UI in its own process (gunicorn when installed,
+# otherwise Werkzeug); "thread" runs Werkzeug on a thread of the player
+WEBUI_SERVER = config_data.get("WEBUI_SERVER", "process")
+WEBUI_HOST = config_data.get("WEBUI_HOST", "0.0.0.0")
+WEBUI_PORT = int(config_data.get("WEBUI_PORT", 8000))
+# Request threads in the web UI process for pages, uploads and API calls.
+# There is one worker process: upload sessions and ingest job status live in
+# its memory. /events streams get events.EVENTS_MAX_STREAMS threads on top,
+# so open dashboard tabs never take these.
+WEBUI_THREADS = int(config_data.get("WEBUI_THREADS", 8))
+WEBUI_READY_TIMEOUT = float(config_data.get("WEBUI_READY_TIMEOUT", 30))
+
+# Bytes the web UI process sends the player over their socket pair, and
+# REFRESH followed by a movie id and a newline (scheduler.request_refresh).
+# The player sends back player events (utils/events.py), one JSON line each.
+READY = b"R"
+CHANGED = b"C"
+REFRESH = b"S"
+
+# Not "-m utils.webserver": the utils package imports this module itself
+_CHILD = "import sys; from utils import webserver; webserver.main(int(sys.argv[1]))"
+
+
+def serve_in_thread():
+    """Werkzeug's threaded server on a daemon thread; listening when this returns."""
+    from werkzeug.serving import make_server
+    from webui import app
+
+    server = make_server(WEBUI_HOST, WEBUI_PORT, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="webui", daemon=True).start()
+    return server
+
+
+class WebServerProcess:
+    """
+    The web UI in a child process (webserver.main), connected to
+    the player by a socket pair. The child sends READY once it accepts
+    requests and CHANGED whenever scheduler.notify_playback_changed() runs
+    there, which wakes the player loop here. REFRESH queues a panel refresh
+    here (scheduler.request_refresh), as only the player drives the panel.
+    Events published here travel the other way, to the browsers subscribed
+    to /events. When the player exits the child sees the socket close and
+    shuts down.
+    """
+
+    def __init__(self):
+        self.process = None
+        self.channel = None
+        self.ready = threading.Event()
+        self.stopping = False
+        self.send_lock = threading.Lock()
+
+    def start(self, timeout=WEBUI_READY_TIMEOUT):
+        """Start the child and wait for it to be ready. Returns False on timeout."""
+        parent_end, child_end = socket.socketpair()
+        self.process = subprocess.Popen([sys.executable, "-c", _CHILD, str(child_end.fileno())],
+                                        pass_fds=[child_end.fileno()])
+        child_end.close()
+        self.channel = parent_end
+        threading.Thread(target=self._listen, name="webui-channel", daemon=True).start()
+        events.forward_events(self._send_event)
+        atexit.register(self.stop)
+        return self.ready.wait(timeout)
+
+    def _listen(self):
+        pending = b""
+        while True:
+            try:
+                data = self.channel.recv(256)
+            except OSError:
+                data = b""
+            if not data:
+                break
+            pending += data
+            while pending:
+                message = pending[:1]
+                if message == REFRESH:
+                    end = pending.find(b"\n")
+                    if end < 0:
+                        break  # the rest of the movie id is still on its way
+                    scheduler.request_refresh(int(pending[1:end]))
+                    pending = pending[end + 1:]
+                    continue
+                if message == READY:
+                    self.ready.set()
+                elif message == CHANGED:
+                    scheduler.notify_playback_changed()
+                pending = pending[1:]
+        status = self.process.wait()
+        if not self.stopping:
+            print(f"[ERROR] Web UI process exited (status {status}).")
+
+    def _send_event(self, event):
+        with self.send_lock:
+            self.channel.sendall(events.encode(event))
+
+    def stop(self):
+        self.stopping = True
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def _watch_parent(channel, stop):
+    """
+    Pass the player's events on to /events subscribers, and call stop() once
+    the player closes its end of the channel (it exited).
+    """
+    def watch():
+        pending = b""
+        try:
+            while data := channel.recv(4096):
+                *lines, pending = (pending + data).split(b"\n")
+                for line in lines:
+                    events.dispatch(json.loads(line))
+        except (OSError, ValueError):
+            pass
+        stop()
+    threading.Thread(target=watch, name="webui-lifeline", daemon=True).start()
+
+
+def _serve_gunicorn(channel, BaseApplication):
+    class WebUIApplication(BaseApplication):
+        def load_config(self):
+            settings = {
+                "bind": f"{WEBUI_HOST}:{WEBUI_PORT}",
+                "workers": 1,
+                "worker_class": "gthread",
+                "threads": WEBUI_THREADS + events.EVENTS_MAX_STREAMS,
+                "sendfile": True,
+                # Open /events streams never finish; do not wait long for them
+                "graceful_timeout": 5,
+                # The worker serves /events, so it reads the player's events;
+                # when the player exits it stops the arbiter
+                "post_worker_init": lambda worker: _start_worker(channel),
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from webui import app
+            return app
+
+    WebUIApplication().run()
+
+
+def _start_worker(channel):
+    _watch_parent(channel, lambda: os.kill(os.getppid(), signal.SIGTERM))
+    channel.send(READY)
+
+
+def _serve_werkzeug(channel):
+    from werkzeug.serving import make_server
+    from webui import app
+
+    server = make_server(WEBUI_HOST, WEBUI_PORT, app, threaded=True)
+    _watch_parent(channel, server.shutdown)
+    channel.send(READY)
+    server.serve_forever()
+
+
+def main(fd):
+    channel = socket.socket(fileno=fd)
+    # Playback changes made through the web UI must wake the player process,
+    # and panel refreshes are the player's to make
+    def send(movie_id=None):
+        channel.send(CHANGED if movie_id is None else REFRESH + b"%d\n" % movie_id)
+
+    scheduler.forward_notifications(send)
+    try:
+        # Optional: production WSGI server; serves static frames with sendfile
+        # (pip install gunicorn). Imported here, in the web UI process only.
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        BaseApplication = None
+    if BaseApplication is not None:
+        _serve_gunicorn(channel, BaseApplication)
+    else:
+        print("[INFO] gunicorn is not installed; serving the web UI with Werkzeug (no sendfile).")
+        _serve_werkzeug(channel)
@@ -0,0 +1,64 @@
+"""
+Wire protocol between the fan-out host (utils/fanout.py) and the display
+receivers (receiver.py). Standard library only, so a receiver needs none of
+the player's dependencies.
+"""
+
+import json
+import struct
+
+# Defaults for RECEIVER_PORT and FANOUT_TIMEOUT_SECONDS
+DEFAULT_PORT = 8765
+DEFAULT_TIMEOUT_SECONDS = 10
+
+# Wire format, both ways: MAGIC, a one-byte kind, then a JSON header and a
+# binary payload, each prefixed with its big-endian uint32 length. The host
+# sends KIND_FRAME (header: display, movie_id, frame, width, height; payload:
+# JPEG) or KIND_INFO (empty); the receiver answers with KIND_REPLY (header:
+# ok, error, width, height; empty payload).
+MAGIC = b"EFRM"
+KIND_FRAME = b"F"
+KIND_INFO = b"I"
+KIND_REPLY = b"R"
+_PREFIX = struct.Struct(">4scI")
+_LENGTH = struct.Struct(">I")
+MAX_HEADER_BYTES = 64 * 1024
+MAX_PAYLOAD_BYTES = 64 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def write_message(sock, kind, header, payload=b""):
+    header_bytes = json.dumps(header).encode()
+    sock.sendall(_PREFIX.pack(MAGIC, kind, len(header_bytes)) + header_bytes
+                 + _LENGTH.pack(len(payload)))
+    if payload:
+        sock.sendall(payload)
+
+
+def _read_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ProtocolError("Connection closed mid-message")
+        received += count
+    return bytes(buffer)
+
+
+def read_message(sock):
+    """One message from sock as (kind, header dict, payload bytes)."""
+    magic, kind, header_length = _PREFIX.unpack(_read_exact(sock, _PREFIX.size))
+    if magic != MAGIC:
+        raise ProtocolError("Not an e-paper frame stream")
+    if header_length > MAX_HEADER_BYTES:
+        raise ProtocolError(f"Header too large ({header_length} bytes)")
+    header = json.loads(_read_exact(sock, header_length))
+    (payload_length,) = _LENGTH.unpack(_read_exact(sock, _LENGTH.size))
+    if payload_length > MAX_PAYLOAD_BYTES:
+        raise ProtocolError(f"Payload too large ({payload_length} bytes)")
+    return kind, header, _read_exact(sock, payload_length)
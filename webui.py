@@ -1,8 +1,8 @@
 import os
 import logging
-from flask import Flask, render_template, request, redirect, url_for, jsonify
+from flask import Flask, Response, render_template, request, redirect, send_file, url_for, jsonify
 from logging.handlers import RotatingFileHandler
-from utils import video_utils, eframe_inky, config
+from utils import video_utils, config, dir_index, events, fanout, frame_index, ingest, metrics, uploads, render_cache, scheduler
 from werkzeug.utils import secure_filename
 import database
 
@@ -30,11 +30,12 @@ def home():
     active_movie = database.get_active_movie()
 
     disk_stats = video_utils.get_disk_usage_stats("/")
-    video_dir_size = video_utils.get_directory_size_gb(settings['VideoRootPath'])
+    video_dir_size = dir_index.get_index(settings['VideoRootPath']).size_gb()
 
     playback_time = None
     if active_movie:
         playback_time = video_utils.calculate_playback_time(active_movie)
+        video_utils.ensure_preview(active_movie, settings)
 
     quiet_info = {
         "enabled": bool(int(settings['use_quiet_hours'])),
@@ -51,7 +52,8 @@ def home():
         dev_mode=config_data.get("DEVELOPMENT_MODE", False),
         active_movie=active_movie,
         playback_time=playback_time,
-        quiet_info=quiet_info
+        quiet_info=quiet_info,
+        skipped_refreshes=database.get_display_state()['skipped_refreshes']
     )
 
 @app.route('/movies')
@@ -60,7 +62,7 @@ def movies():
     settings = database.get_settings()
 
     disk_stats = video_utils.get_disk_usage_stats("/")
-    video_dir_size = video_utils.get_directory_size_gb(settings['VideoRootPath'])
+    video_dir_size = dir_index.get_index(settings['VideoRootPath']).size_gb()
 
     return render_template(
         "movies.html",
@@ -72,12 +74,13 @@ def movies():
 
 @app.route('/first_run')
 def first_run():
-    available_movies = video_utils.list_video_files(VIDEO_DIRECTORY)
+    available_movies = dir_index.get_index(VIDEO_DIRECTORY).video_files()
     return render_template("firstrun.html", movies=available_movies)
 
 @app.route('/movie/<int:movie_id>')
 def movie(movie_id):
     movie = database.get_movie_by_id(movie_id)
+    video_utils.ensure_preview(movie, database.get_settings())
 
     frame_path = os.path.join(f"static/{movie_id}", "frame.jpg")
     current_image_path = os.path.abspath(frame_path) if os.path.exists(frame_path) else None
@@ -90,8 +93,42 @@ def movie(movie_id):
         current_image_path=current_image_path,
         playback_time=playback_time,
         dev_mode=config_data.get("DEVELOPMENT_MODE", False),
+        skipped_refreshes=database.get_display_state()['skipped_refreshes'],
     )
 
+@app.get('/movie/<int:movie_id>/frame.jpg')
+def movie_preview(movie_id):
+    # The dashboard reloads the frame from here when /events reports a new one
+    movie = database.get_movie_by_id(movie_id)
+    if not movie:
+        return jsonify({"error": "Movie not found"}), 404
+    video_utils.ensure_preview(movie, database.get_settings())
+    frame_path = os.path.join(f"static/{movie_id}", "frame.jpg")
+    if not os.path.exists(frame_path):
+        return jsonify({"error": "No frame rendered yet"}), 404
+    return send_file(os.path.abspath(frame_path), mimetype="image/jpeg", max_age=0)
+
+
+@app.get('/events')
+def event_stream():
+    # One long-lived response per browser; the player publishes, nothing here
+    # queries the database. Past EVENTS_MAX_STREAMS the page polls instead
+    # (EventSource does not retry a 503), so streams never take every thread.
+    subscription = events.subscribe()
+    if subscription is None:
+        return Response("Too many event streams; poll /events/latest\n", 503, mimetype="text/plain")
+    response = Response(events.stream(subscription), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # Also frees the slot when the client goes before the stream starts
+    response.call_on_close(lambda: events.unsubscribe(subscription))
+    return response
+
+
+@app.get('/events/latest')
+def latest_events():
+    return jsonify(events.latest(request.args.get('after', 0, type=int)))
+
+
 @app.route('/add_movie', methods=['POST'])
 def add_movie():
     video_path = request.form['video_path']  # just the filename
@@ -104,14 +141,10 @@ def add_movie():
     # Construct full path for OpenCV
     full_path = os.path.join(settings['VideoRootPath'], video_path)
 
-    # Get total frames from full path
-    total_frames = video_utils.get_total_frames(full_path)
-
-    # Insert movie using just the filename
-    movie = database.insert_movie(video_path, total_frames)
-
-    # Process first frame using movie + settings
-    video_utils.process_video(movie, settings)
+    # Insert movie using just the filename; frame counting, the first frame
+    # and the keyframe index are done by a background ingest job
+    movie = database.insert_movie(video_path, 0)
+    ingest.submit("ingest", movie['id'], full_path, settings)
 
     return redirect(url_for('home'))
 
@@ -135,19 +168,105 @@ def upload():
 
         save_path = os.path.join(settings['VideoRootPath'], filename)
         uploaded_file.save(save_path)
+        movie, job = register_upload(filename, save_path, settings)
 
-        existing = database.get_movie_by_path(filename)
-        if existing:
-            return jsonify({"message": "Upload complete!", "movie_id": existing['id']}), 200
+        return jsonify({"message": "Upload complete!", "movie_id": movie['id'], "job_id": job and job.id}), 200
 
-        total_frames = video_utils.get_total_frames(save_path)
-        movie = database.insert_movie(filename, total_frames)
-        video_utils.process_video(movie, settings)
+    return render_template('upload.html')
 
-        return jsonify({"message": "Upload complete!", "movie_id": movie['id']}), 200
 
-    return render_template('upload.html')
 
+def register_upload(filename, save_path, settings):
+    """Add a freshly uploaded file as a movie (once) and queue its ingest job."""
+    dir_index.get_index(settings['VideoRootPath']).refresh_soon()
+
+    existing = database.get_movie_by_path(filename)
+    if existing:
+        return existing, None
+
+    movie = database.insert_movie(filename, 0)
+    return movie, ingest.submit("ingest", movie['id'], save_path, settings)
+
+
+def upload_session_json(session):
+    return {
+        "id": session['id'],
+        "filename": session['filename'],
+        "size": session['size'],
+        "received": session['received'],
+        "chunk_size": uploads.UPLOAD_CHUNK_MB * 1024 * 1024,
+    }
+
+
+@app.post('/upload/sessions')
+def create_upload_session():
+    payload = request.get_json() or {}
+    filename = secure_filename(payload.get('filename', ''))
+    ext = os.path.splitext(filename)[1].lower()
+
+    if ext not in UPLOAD_EXTENSIONS:
+        return jsonify({"error": "Unsupported file type"}), 400
+    try:
+        size = int(payload['size'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Missing file size"}), 400
+
+    session = uploads.create_session(database.get_settings(), filename, size, payload.get('sha256'))
+    return jsonify(upload_session_json(session)), 201
+
+
+@app.get('/upload/sessions/<session_id>')
+def upload_session_status(session_id):
+    session = database.get_upload_session(session_id)
+    if not session:
+        return jsonify({"error": "Upload not found"}), 404
+    return jsonify(upload_session_json(session))
+
+
+@app.put('/upload/sessions/<session_id>')
+def upload_chunk(session_id):
+    session = database.get_upload_session(session_id)
+    if not session:
+        return jsonify({"error": "Upload not found"}), 404
+    if request.content_length is None:
+        return jsonify({"error": "Content-Length required"}), 411
+
+    offset = request.args.get('offset', type=int)
+    try:
+        received = uploads.write_chunk(database.get_settings(), session, offset, request.stream,
+                                       request.content_length, request.headers.get('X-Chunk-SHA256'))
+    except uploads.OffsetMismatch as e:
+        return jsonify({"error": str(e), "received": e.received}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e), "received": session['received']}), 400
+
+    return jsonify({"received": received})
+
+
+@app.post('/upload/sessions/<session_id>/commit')
+def commit_upload_session(session_id):
+    session = database.get_upload_session(session_id)
+    settings = database.get_settings()
+    if not session:
+        return jsonify({"error": "Upload not found"}), 404
+
+    try:
+        filename = uploads.commit_session(settings, session)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    save_path = os.path.join(settings['VideoRootPath'], filename)
+    movie, job = register_upload(filename, save_path, settings)
+    return jsonify({"message": "Upload complete!", "movie_id": movie['id'], "job_id": job and job.id}), 200
+
+
+@app.delete('/upload/sessions/<session_id>')
+def abort_upload_session(session_id):
+    session = database.get_upload_session(session_id)
+    if not session:
+        return jsonify({"error": "Upload not found"}), 404
+    uploads.abort_session(database.get_settings(), session)
+    return jsonify({"message": "Upload cancelled"})
 
 
 @app.route('/update_movie', methods=['POST'])
@@ -163,18 +282,215 @@ def update_movie():
     if int(payload['time_per_frame']) == 0:
         payload['time_per_frame'] = int(payload.get('custom_time', 1))  # fallback to 1 minute
 
-    # Recalculate total frames using full video path
+    # Prefer the exact count from the keyframe index; otherwise keep the
+    # count stored when the movie was ingested
     full_path = os.path.join(settings['VideoRootPath'], db_movie['video_path'])
-    total_frames = video_utils.get_total_frames(full_path)
-    payload['total_frames'] = total_frames
+    total_frames = frame_index.exact_frame_count(db_movie['id'], full_path)
+    payload['total_frames'] = total_frames if total_frames is not None else db_movie['total_frames']
 
-    # Update database and process frame
+    # Update database and re-render the preview frame in the background
     updated_movie = database.update_movie(payload)
-    video_utils.process_video(updated_movie, settings)
+    job = ingest.submit("render", updated_movie['id'], full_path, settings)
+
+    return jsonify({"message": "Movie updated successfully", "job_id": job.id})
 
-    return jsonify({"message": "Movie updated successfully"})
 
 
+@app.get('/jobs')
+def jobs():
+    movie_id = request.args.get('movie_id', type=int)
+    return jsonify([job.to_dict() for job in ingest.list_jobs(movie_id)])
+
+
+@app.get('/jobs/<int:job_id>')
+def job_status(job_id):
+    job = ingest.get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.get('/metrics')
+def metrics_text():
+    if not metrics.METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled (METRICS_ENABLED)"}), 404
+    return Response(metrics.prometheus_text(metrics.combined_snapshot()), mimetype="text/plain; version=0.0.4")
+
+
+@app.get('/metrics.json')
+def metrics_json():
+    if not metrics.METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled (METRICS_ENABLED)"}), 404
+    return jsonify(metrics.combined_snapshot())
+
+
+@app.get('/render_cache')
+def render_cache_stats():
+    return jsonify(render_cache.stats())
+
+
+def display_json(display):
+    return {key: display[key] for key in display.keys()}
+
+
+def display_fields(payload):
+    """Validated DISPLAY_FIELDS from a request payload; raises ValueError."""
+    fields = {}
+    for key in ('name', 'host'):
+        if key in payload:
+            fields[key] = str(payload[key]).strip()
+            if not fields[key]:
+                raise ValueError(f"{key} must not be empty")
+    for key in ('port', 'time_per_frame', 'skip_frames', 'current_frame'):
+        if payload.get(key) is not None:
+            fields[key] = int(payload[key])
+    if 'movie_id' in payload:
+        movie_id = payload['movie_id']
+        if movie_id is not None and not database.get_movie_by_id(int(movie_id)):
+            raise ValueError(f"No movie {movie_id}")
+        fields['movie_id'] = None if movie_id is None else int(movie_id)
+    if payload.get('resolution'):
+        width, height = (int(v) for v in str(payload['resolution']).split(','))
+        fields['resolution'] = f"{width},{height}"
+    return fields
+
+
+@app.get('/displays')
+def displays():
+    return jsonify([display_json(display) for display in database.get_displays()])
+
+
+@app.post('/displays')
+def add_display():
+    try:
+        fields = display_fields(request.get_json() or {})
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    if not fields.get('name') or not fields.get('host'):
+        return jsonify({"error": "name and host are required"}), 400
+
+    if 'resolution' not in fields:
+        # Ask the receiver for its panel size
+        try:
+            info = fanout.query_receiver(fields['host'], fields.get('port'))
+        except (OSError, fanout.ProtocolError) as e:
+            return jsonify({"error": f"Receiver did not answer ({e}); give a resolution"}), 400
+        fields['resolution'] = f"{info['width']},{info['height']}"
+
+    try:
+        display = database.insert_display(fields['name'], fields['host'], fields.get('port'), fields['resolution'])
+    except database.sqlite3.IntegrityError:
+        return jsonify({"error": "A display with that name exists"}), 409
+    display = database.update_display(display['id'], fields)
+    return jsonify(display_json(display)), 201
+
+
+@app.get('/displays/<int:display_id>')
+def display_status(display_id):
+    display = database.get_display(display_id)
+    if not display:
+        return jsonify({"error": "Display not found"}), 404
+    return jsonify(display_json(display))
+
+
+@app.post('/displays/<int:display_id>')
+def update_display(display_id):
+    try:
+        fields = display_fields(request.get_json() or {})
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        display = database.update_display(display_id, fields)
+    except database.sqlite3.IntegrityError:
+        return jsonify({"error": "A display with that name exists"}), 409
+    if not display:
+        return jsonify({"error": "Display not found"}), 404
+    return jsonify(display_json(display))
+
+
+@app.delete('/displays/<int:display_id>')
+def delete_display(display_id):
+    if not database.delete_display(display_id):
+        return jsonify({"error": "Display not found"}), 404
+    return jsonify({"message": "Display removed"})
+
+
+def playlist_json():
+    state = database.get_playlist_state()
+    return {
+        "entry_id": state['entry_id'],
+        "repeat": bool(state['repeat']),
+        "entries": [dict(entry) for entry in database.get_playlist()],
+    }
+
+
+def playlist_fields(payload):
+    """Validated PLAYLIST_FIELDS (and position) from a request payload; raises ValueError."""
+    fields = {}
+    if 'movie_id' in payload:
+        if not database.get_movie_by_id(int(payload['movie_id'])):
+            raise ValueError(f"No movie {payload['movie_id']}")
+        fields['movie_id'] = int(payload['movie_id'])
+    for key in ('time_per_frame', 'skip_frames'):
+        if key in payload:
+            fields[key] = None if payload[key] is None else int(payload[key])
+            if fields[key] is not None and fields[key] < 1:
+                raise ValueError(f"{key} must be at least 1")
+    if 'isRandom' in payload:
+        fields['isRandom'] = None if payload['isRandom'] is None else int(bool(payload['isRandom']))
+    if payload.get('position') is not None:
+        fields['position'] = int(payload['position'])
+    return fields
+
+
+@app.get('/playlist')
+def playlist():
+    return jsonify(playlist_json())
+
+
+@app.post('/playlist')
+def add_playlist_entry():
+    try:
+        fields = playlist_fields(request.get_json() or {})
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    if 'movie_id' not in fields:
+        return jsonify({"error": "movie_id is required"}), 400
+    entry = database.insert_playlist_entry(fields['movie_id'], fields.get('position'))
+    entry = database.update_playlist_entry(entry['id'], fields)
+    return jsonify(dict(entry)), 201
+
+
+@app.post('/playlist/start')
+def start_playlist():
+    payload = request.get_json(silent=True) or {}
+    try:
+        entry_id = None if payload.get('entry_id') is None else int(payload['entry_id'])
+    except (TypeError, ValueError):
+        return jsonify({"error": "entry_id must be an integer"}), 400
+    if not database.start_playlist(entry_id, payload.get('repeat')):
+        return jsonify({"error": "Playlist entry not found"}), 404
+    return jsonify(playlist_json())
+
+
+@app.post('/playlist/<int:entry_id>')
+def update_playlist_entry(entry_id):
+    try:
+        fields = playlist_fields(request.get_json() or {})
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    entry = database.update_playlist_entry(entry_id, fields)
+    if not entry:
+        return jsonify({"error": "Playlist entry not found"}), 404
+    return jsonify(dict(entry))
+
+
+@app.delete('/playlist/<int:entry_id>')
+def delete_playlist_entry(entry_id):
+    if not database.delete_playlist_entry(entry_id):
+        return jsonify({"error": "Playlist entry not found"}), 404
+    return jsonify({"message": "Playlist entry removed"})
+
 
 @app.post('/start_playback/<int:movie_id>')
 def start_playback(movie_id):
@@ -211,11 +527,14 @@ def trigger_display_update(movie_id):
     if not movie or not settings:
         return jsonify({"error": "Invalid ID or settings"}), 400
 
-    video_utils.process_video(movie, settings)
-    frame_path = os.path.join(f"static/{movie_id}", "frame.jpg")
-    eframe_inky.show_on_inky(frame_path)
+    # Rendered here so a bad frame is reported at once (and the preview
+    # updated); the player shows it, from the render cache, as only it may
+    # drive the panel
+    if not video_utils.process_video(movie, settings):
+        return jsonify({"error": "Could not render the current frame"}), 500
+    scheduler.request_refresh(movie_id)
 
-    return jsonify({"message": "E-Ink display updated"})
+    return jsonify({"message": "E-Ink display update requested"}), 202
 
 @app.route('/settings', methods=['GET', 'POST'])
 def settings_page():